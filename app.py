@@ -1,7 +1,9 @@
 # app.py - VERSIÓN CON LÓGICA FREEMIUM Y REGISTRO POR EMAIL
 import datetime as dt
-import requests
-from flask import Flask, jsonify, request
+from flask import (
+    Blueprint, Flask, Response, g, has_app_context, has_request_context, jsonify, make_response, request,
+    stream_with_context
+)
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_jwt_extended import (
@@ -9,38 +11,191 @@ from flask_jwt_extended import (
     # Importa 'verify_jwt_in_request' y 'current_user' si los usas para validaciones manuales
 )
 from flask_sqlalchemy import SQLAlchemy
-from PIL import Image
-from google import genai
-from google.genai import types
+from sqlalchemy import tuple_, update
+from sqlalchemy.engine import Engine
 import os
 from dotenv import load_dotenv
 import json
-import paypalrestsdk
+import logging
 import re
+import base64
+import click
+import hashlib
+import hmac
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlencode
+from basedatos import BIND_REPLICA, SesionEnrutada, detectar_escrituras, leer_de_replica, opciones_engine, stats_pool
+from cache import RedisBackend, TTLCache, normalizar_clave
+from ciudades import CITY_INDEX_FILE, IndiceCiudades, escribir_tsv, importar_lista_owm, leer_tsv
+from concurrencia import en_hilo_nativo, preparar_psycopg_para_gevent
+from contrasenas import Contrasenas, HashSaturado
+from escritura_diferida import EscrituraDiferida
+from estadisticas import TABLAS_ROLLUP, actualizar_rollups, reconstruir_rollups
+from cuotas import LIMITES_FREE, TEXTO_PERIODO, AI_QUOTA_PERIOD, Cuotas, usos_vigentes
+from guardarropa import Guardarropa, hash_contenido, hash_perceptual
+from http_client import ClienteHTTP
+from imagenes import MIME_TYPE, preprocesar_imagenes
+from jobs import JobQueue
+from migraciones import aplicar_migraciones
+from metrics import (
+    Contador, Histograma, Medidor, VentanaLatencias, duracion_requests, fase, iniciar_traza, instrumentar_sql,
+    registrar_fase, registro, terminar_traza
+)
+from paypal_client import PayPalAPI, PayPalError
+from pronostico import INTERVALOS_PRONOSTICO, dias_del_viaje, resumir_por_dia, texto_para_prompt
+from prompts import PromptsGemini, clima_compacto, preferencias_compactas
+from recomendador import clase_condicion, recomendar
+from resiliencia import (
+    ABIERTO, VALOR_ESTADO, CircuitoAbierto, Disyuntores, ErrorUpstream, con_plazo, iniciar_plazo, recortar_timeout,
+    terminar_plazo
+)
 
 load_dotenv(override=True)
 
 # --- 1. Configuración Centralizada ---
-app = Flask(__name__)
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Fábrica de la aplicación. Crear la app no abre conexiones ni carga Gemini, PIL o requests:
+# cada subsistema se inicializa en su primer uso y el esquema se maneja con `flask --app app db-upgrade`.
+_aplicacion = None  # La última app creada; la usan los hilos de fondo (trabajos de IA) para su app_context
+# Réplica de solo lectura opcional: las rutas de solo lectura leen de ella (ver _solo_lectura)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+def _opciones_pool(url, nombre):
+    # Mismo dimensionamiento para la primaria y la réplica: cada una tiene su propio pool
+    return opciones_engine(
+        url, nombre,
+        tamano=int(os.getenv("DB_POOL_SIZE", "5")),
+        desborde=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        reciclar=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        pre_ping=os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    )
+
+def create_app(config=None):
+    global _aplicacion
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Tope del tamaño de cada request (las fotos de /api/v1/ai-outfit); Flask responde 413 si se supera
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', _opciones_pool(app.config['SQLALCHEMY_DATABASE_URI'], 'primaria'))
+    if DATABASE_REPLICA_URL:
+        app.config.setdefault('SQLALCHEMY_BINDS', {
+            BIND_REPLICA: dict(_opciones_pool(DATABASE_REPLICA_URL, 'replica'), url=DATABASE_REPLICA_URL)
+        })
+
+    db.init_app(app)
+    # Con el worker gevent de gunicorn, psycopg2 también cede el control mientras espera a PostgreSQL
+    preparar_psycopg_para_gevent()
+    jwt.init_app(app)
+    bcrypt.init_app(app)
+    contrasenas.calibrar_en_segundo_plano()
+    cors.init_app(app,
+         resources={r"/*": {"origins": "http://localhost:3000"}},
+         supports_credentials=True,
+         allow_headers=["Authorization", "Content-Type"],
+         expose_headers=["X-Next-Cursor", "Link", "X-Request-ID"]
+    )
+    app.register_blueprint(bp)
+    _aplicacion = app
+    return app
 
 # --- 2. Inicialización de Extensiones ---
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
-bcrypt = Bcrypt(app)
-CORS(app, 
-     resources={r"/*": {"origins": "http://localhost:3000"}}, 
-     supports_credentials=True,
-     allow_headers=["Authorization", "Content-Type"] 
+# La sesión manda las lecturas a la réplica dentro de leer_de_replica() (ver basedatos.py)
+db = SQLAlchemy(session_options={'class_': SesionEnrutada})
+jwt = JWTManager()
+bcrypt = Bcrypt()
+cors = CORS()
+# Hash de contraseñas en un pool propio: BCRYPT_WORKERS hashes a la vez como máximo, con el costo
+# calibrado para tardar ~BCRYPT_TARGET_MS (o fijo con BCRYPT_LOG_ROUNDS)
+contrasenas = Contrasenas(
+    bcrypt,
+    workers=int(os.getenv("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2)))),
+    max_pendientes=int(os.getenv("BCRYPT_MAX_PENDING", "64")),
+    objetivo_ms=float(os.getenv("BCRYPT_TARGET_MS", "250")),
+    costo=int(os.getenv("BCRYPT_LOG_ROUNDS", "0")) or None,
+    costo_min=int(os.getenv("BCRYPT_MIN_ROUNDS", "10")),
+    costo_max=int(os.getenv("BCRYPT_MAX_ROUNDS", "14"))
 )
-
-# Configuración de PayPal
-paypalrestsdk.configure({
-  "mode": "sandbox", # sandbox o live
-  "client_id": os.getenv("PAYPAL_CLIENT_ID"),
-  "client_secret": os.getenv("PAYPAL_CLIENT_SECRET") })
+# Todas las rutas, hooks y comandos; create_app() los registra en la app
+bp = Blueprint('api', __name__, cli_group=None)
+
+# --- Observabilidad: request id, traza de fases y logs estructurados ---
+# Cada request mide sus fases (bcrypt, sql, pil, gemini, upstreams HTTP) con metrics.fase();
+# al terminar se registra en los histogramas de /metrics y se escribe una línea JSON con el request id.
+log = logging.getLogger("guardianclima")
+if not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+LOG_REQUESTS = os.getenv("LOG_REQUESTS", "true").lower() == "true"
+instrumentar_sql(Engine)
+
+def _log(nivel, evento, **campos):
+    registro_log = {"ts": dt.datetime.utcnow().isoformat(timespec='milliseconds'), "nivel": nivel, "evento": evento}
+    if has_request_context() and 'request_id' in g:
+        registro_log["request_id"] = g.request_id
+    registro_log.update(campos)
+    log.log(getattr(logging, nivel.upper()), json.dumps(registro_log, ensure_ascii=False, default=str))
+
+# /api/internal/stats expone contadores internos: con INTERNAL_STATS_TOKEN se pide ese token como Bearer;
+# sin él, solo se responde a pedidos desde la misma máquina (loopback)
+INTERNAL_STATS_TOKEN = os.getenv("INTERNAL_STATS_TOKEN", "")
+_DIRECCIONES_LOOPBACK = ('127.0.0.1', '::1')
+
+def _solo_interno(vista):
+    @wraps(vista)
+    def envuelta(*args, **kwargs):
+        if INTERNAL_STATS_TOKEN:
+            enviado = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+            permitido = hmac.compare_digest(enviado.encode(), INTERNAL_STATS_TOKEN.encode())
+        else:
+            permitido = request.remote_addr in _DIRECCIONES_LOOPBACK
+        if not permitido:
+            _log("warning", "stats_internas_rechazadas", ip=request.remote_addr)
+            return jsonify({'error': 'No autorizado'}), 403
+        return vista(*args, **kwargs)
+    return envuelta
+
+@bp.before_app_request
+def _iniciar_request():
+    # Respetamos el X-Request-ID del proxy si es razonable; si no, generamos uno
+    entrante = request.headers.get('X-Request-ID', '')
+    g.request_id = entrante if re.fullmatch(r'[\w.\-]{1,64}', entrante) else uuid.uuid4().hex
+    g.inicio_request = time.perf_counter()
+    iniciar_traza()
+    # Plazo total de la request: cada llamada a un upstream usa como mucho lo que queda
+    iniciar_plazo(REQUEST_DEADLINE_MS / 1000)
+
+@bp.after_app_request
+def _terminar_request(response):
+    if 'inicio_request' not in g:
+        return response
+    duracion = time.perf_counter() - g.inicio_request
+    # Etiquetamos por regla de ruta (no por URL) para acotar la cardinalidad de las series
+    endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'
+    # Un stream SSE recién empieza acá: su duración completa la registra el generador (ver _responder_sse)
+    if response.mimetype != 'text/event-stream':
+        duracion_requests.observar(duracion, endpoint, request.method, str(response.status_code))
+    fases = terminar_traza()
+    terminar_plazo()
+    response.headers['X-Request-ID'] = g.request_id
+    if g.get('degradado'):
+        response.headers['X-Degraded'] = g.degradado
+    if LOG_REQUESTS:
+        _log("info", "request", metodo=request.method, ruta=endpoint, status=response.status_code,
+             duracion_ms=round(duracion * 1000, 2),
+             fases_ms={nombre: round(segundos * 1000, 2) for nombre, segundos in fases.items()})
+    return response
 
 # --- 3. Definición de Modelos (con email y plan) ---
 class Users(db.Model):
@@ -65,13 +220,32 @@ class Users(db.Model):
     preferencias_guardadas = db.Column(db.Boolean, default=False)
     ai_outfit_uses = db.Column(db.Integer, default=0)
     ai_travel_uses = db.Column(db.Integer, default=0)
+    # Período (ej. '2026-10') al que corresponden los usos de arriba; ver cuotas.py
+    ai_outfit_period = db.Column(db.String(10))
+    ai_travel_period = db.Column(db.String(10))
+    # Se incrementan con cada escritura en Queries / OutfitHistory del usuario; ver _listado_condicional
+    historial_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    outfits_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     # --- FIN DE NUEVOS CAMPOS ---
 
+    # bcrypt es CPU pura: corre en el pool acotado de contrasenas.py para no frenar al resto de las requests.
+    # Ambos lanzan HashSaturado si el pool tiene demasiados hashes esperando
     def set_password(self, password):
-        self.password = bcrypt.generate_password_hash(password).decode('utf-8')
+        with fase('bcrypt'):
+            self.password = contrasenas.generar(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password, password)
+        """Verifica la contraseña y, si es correcta y el hash quedó con otro costo, lo regenera (sin commit)."""
+        with fase('bcrypt'):
+            if not contrasenas.verificar(self.password, password):
+                return False
+            if contrasenas.necesita_rehash(self.password):
+                try:
+                    self.password = contrasenas.rehash(password)
+                except HashSaturado:
+                    # El rehash es opcional: con el pool saturado queda para el próximo login
+                    _log("info", "rehash_postergado", user_id=self.id)
+            return True
 
 class Queries(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -91,22 +265,248 @@ class OutfitHistory(db.Model):
 
     def to_dict(self):
         return {
+            'id': self.id,
             'city': self.city,
             'advice': self.advice,
             'date': self.date.isoformat()
         }
 
+class Jobs(db.Model):
+    # Trabajos de IA en modo asíncrono (submit/poll). Persisten en la BD para sobrevivir reinicios.
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # 'outfit' o 'travel'
+    estado = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, error
+    payload = db.Column(db.Text)  # JSON con los parámetros (las imágenes van en base64)
+    resultado = db.Column(db.Text)  # JSON con la respuesta final
+    status_code = db.Column(db.Integer)
+    creado = db.Column(db.DateTime, default=dt.datetime.utcnow)
+    iniciado = db.Column(db.DateTime)
+    terminado = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'resultado': json.loads(self.resultado) if self.resultado else None,
+            'creado': self.creado.isoformat() if self.creado else None,
+            'terminado': self.terminado.isoformat() if self.terminado else None
+        }
+
+# Estadísticas de clima por usuario: rollups de Queries que se actualizan con cada lote del historial
+# (ver estadisticas.py). Cada fila acumula conteo, mínima, máxima, suma de temperaturas y la última consulta
+class _AcumuladoClima:
+    consultas = db.Column(db.Integer, nullable=False, default=0)
+    temp_min = db.Column(db.Float)
+    temp_max = db.Column(db.Float)
+    temp_suma = db.Column(db.Float, nullable=False, default=0)
+    ultima = db.Column(db.DateTime)
+
+    def resumen(self):
+        return {
+            'consultas': self.consultas,
+            'temp_min': self.temp_min,
+            'temp_max': self.temp_max,
+            'temp_media': round(self.temp_suma / self.consultas, 2) if self.consultas else None,
+            'ultima': self.ultima.isoformat() if self.ultima else None
+        }
+
+class StatsCiudad(_AcumuladoClima, db.Model):
+    __tablename__ = 'stats_ciudades'
+    # Las ciudades más consultadas se leen en orden de este índice, sin ordenar todas las del usuario
+    __table_args__ = (db.Index('ix_stats_ciudades_user_consultas', 'user_id', 'consultas'),)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    ciudad = db.Column(db.String(100), primary_key=True)
+
+class StatsSemana(_AcumuladoClima, db.Model):
+    __tablename__ = 'stats_semanas'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    semana = db.Column(db.Date, primary_key=True)  # Lunes de la semana (UTC)
+
+class StatsUsuario(_AcumuladoClima, db.Model):
+    __tablename__ = 'stats_usuarios'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+
+class Prendas(db.Model):
+    # Guardarropa (ver guardarropa.py): descripción de Gemini por sha256 de cada foto de prenda ya vista
+    __tablename__ = 'prendas'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    sha = db.Column(db.String(64), primary_key=True)
+    phash = db.Column(db.String(16), nullable=False)
+    descripcion = db.Column(db.Text, nullable=False)
+    ultimo_uso = db.Column(db.DateTime, nullable=False, index=True)
+
+def _tablas_rollup():
+    return {nombre: db.metadata.tables[tabla] for nombre, tabla in TABLAS_ROLLUP.items()}
+
 # --- 4. Creación de Tablas ---
-with app.app_context():
-    db.create_all()
+# Las tablas e índices se crean con migraciones versionadas (ver migraciones.py), nunca al importar:
+# `flask --app app db-upgrade` en cada deploy (y `python app.py` las aplica antes de levantar el servidor de desarrollo)
+@bp.cli.command("db-upgrade")
+def db_upgrade():
+    """Aplica las migraciones de esquema pendientes."""
+    aplicadas = aplicar_migraciones(db)
+    print(f"Migraciones aplicadas: {aplicadas}" if aplicadas else "El esquema ya está al día.")
+
+@bp.cli.command("stats-rebuild")
+@click.option("--lote", default=1000, show_default=True, help="Usuarios por transacción.")
+def stats_rebuild(lote):
+    """Recalcula las estadísticas por usuario (rollups) desde el historial de consultas."""
+    minimo, maximo = db.session.query(db.func.min(Queries.user_id), db.func.max(Queries.user_id)).one()
+    db.session.rollback()
+    tablas, escritas = _tablas_rollup(), 0
+    if minimo is None:
+        print("No hay consultas en el historial.")
+        return
+    for desde in range(minimo, maximo + 1, lote):
+        # Una transacción por rango de usuarios: el resto sigue escribiendo mientras tanto
+        with db.engine.begin() as conexion:
+            escritas += reconstruir_rollups(
+                conexion, Queries.__table__, tablas, Users.__table__, desde, desde + lote
+            )
+        print(f"Usuarios {desde}-{min(desde + lote, maximo + 1) - 1}: {escritas} filas de rollup")
+    print(f"Estadísticas reconstruidas: {escritas} filas")
+
+@bp.cli.command("ciudades-importar")
+@click.argument("lista_owm")
+def ciudades_importar(lista_owm):
+    """Regenera el índice de ciudades desde city.list.json(.gz) de bulk.openweathermap.org."""
+    existentes = []
+    if os.path.exists(CITY_INDEX_FILE):
+        with open(CITY_INDEX_FILE, encoding='utf-8') as archivo:
+            existentes = leer_tsv(archivo)
+    filas = importar_lista_owm(lista_owm, existentes)
+    with open(CITY_INDEX_FILE, 'w', encoding='utf-8') as archivo:
+        escribir_tsv(filas, archivo)
+    print(f"{len(filas)} ciudades escritas en {CITY_INDEX_FILE}")
 
 # --- 5. Carga de API Keys Externas ---
 MIowmAPI = os.getenv("WEATHER_API_KEY")
 geminiAPI = os.getenv("GEMINI_API_KEY")
+AI_OUTFIT_MAX_IMAGES = int(os.getenv("AI_OUTFIT_MAX_IMAGES", "10"))
+AI_ADVICE_TEMP_BUCKET = float(os.getenv("AI_ADVICE_TEMP_BUCKET", "2"))
+# Motor de /api/v1/ai-advice para el plan gratuito ('local' o 'gemini') y tiempo máximo de Gemini
+# antes de responder con el recomendador local (ver recomendador.py)
+AI_ADVICE_FREE_ENGINE = os.getenv("AI_ADVICE_FREE_ENGINE", "local")
+AI_ADVICE_TIMEOUT_MS = int(os.getenv("AI_ADVICE_TIMEOUT_MS", "8000"))
+# /api/v1/weather/batch: ciudades por pedido y llamadas a OpenWeatherMap en paralelo por proceso
+WEATHER_BATCH_MAX = int(os.getenv("WEATHER_BATCH_MAX", "50"))
+WEATHER_BATCH_WORKERS = int(os.getenv("WEATHER_BATCH_WORKERS", "32"))
+OWM_GROUP_MAX = 20  # Límite de ids por llamada de /data/2.5/group
+# Con el índice estricto, un nombre que no está en datos/ciudades.tsv se rechaza sin llamar a OpenWeatherMap.
+# Solo vale con la lista completa importada (`flask ciudades-importar`): con la lista semilla que viene en el repo
+# (o cualquiera de menos de CITY_INDEX_STRICT_MIN ciudades) los nombres desconocidos se piden por nombre (q=)
+CITY_INDEX_STRICT = os.getenv("CITY_INDEX_STRICT", "false").lower() == "true"
+CITY_INDEX_STRICT_MIN = int(os.getenv("CITY_INDEX_STRICT_MIN", "10000"))
+
+# GEMINI_API_BASE permite apuntar el SDK a un stub local (ver benchmarks/stubs.py)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE")
+GEMINI_TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", "60000"))
+# Modelo, tope de tokens de salida y presupuesto de tokens de entrada de cada ruta de IA (ver prompts.py):
+# GEMINI_MODEL_<RUTA>, GEMINI_MAX_OUTPUT_<RUTA> y GEMINI_INPUT_BUDGET_<RUTA>. En 'wardrobe' la salida es por prenda
+prompts_gemini = PromptsGemini()
+for _ruta, _modelo, _salida, _presupuesto in (
+        ('advice', "gemini-2.0-flash", "600", "300"),
+        ('outfit', "gemini-2.5-flash-lite-preview-06-17", "600", "600"),
+        ('travel', "gemini-2.5-flash-lite-preview-06-17", "1000", "600"),
+        ('wardrobe', "gemini-2.5-flash-lite-preview-06-17", "60", "150")):
+    prompts_gemini.configurar(
+        _ruta, modelo=os.getenv(f"GEMINI_MODEL_{_ruta.upper()}", _modelo),
+        max_salida=int(os.getenv(f"GEMINI_MAX_OUTPUT_{_ruta.upper()}", _salida)),
+        presupuesto=int(os.getenv(f"GEMINI_INPUT_BUDGET_{_ruta.upper()}", _presupuesto))
+    )
 
-if geminiAPI:
-    #api
-    gemini_client = genai.Client(api_key=geminiAPI)
+# --- Resiliencia frente a los upstreams (ver resiliencia.py) ---
+# Plazo total de cada request; los timeouts de OpenWeatherMap, Gemini y PayPal se recortan a lo que queda
+REQUEST_DEADLINE_MS = int(os.getenv("REQUEST_DEADLINE_MS", "30000"))
+# Un circuit breaker por upstream: se abre si en las últimas CIRCUIT_WINDOW llamadas (con al menos
+# CIRCUIT_MIN_CALLS) falla o tarda más de CIRCUIT_SLOW_MS_<UPSTREAM> la proporción CIRCUIT_FAILURE_RATE
+disyuntores = Disyuntores(
+    ventana=int(os.getenv("CIRCUIT_WINDOW", "20")),
+    minimo=int(os.getenv("CIRCUIT_MIN_CALLS", "10")),
+    umbral=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+    espera=float(os.getenv("CIRCUIT_OPEN_SECONDS", "30")),
+    activo=os.getenv("CIRCUIT_BREAKERS", "true").lower() == "true"
+)
+for _upstream, _lento_ms in (('openweathermap', "3000"), ('gemini', "30000"), ('paypal', "5000")):
+    disyuntores.configurar(_upstream, lento=int(os.getenv(f"CIRCUIT_SLOW_MS_{_upstream.upper()}", _lento_ms)) / 1000)
+# Hasta cuánto después de vencer se sirve un clima cacheado si OpenWeatherMap no responde
+WEATHER_CACHE_DEGRADED_TTL = int(os.getenv("WEATHER_CACHE_DEGRADED_TTL", "21600"))
+
+# El SDK de Gemini tarda ~0,7 s en importarse: el cliente se crea en la primera consulta de IA
+gemini_client = None
+_gemini_lock = threading.Lock()
+
+def _gemini():
+    global gemini_client
+    if gemini_client is None:
+        with _gemini_lock:
+            if gemini_client is None:
+                from google import genai
+                from google.genai import types
+                gemini_client = genai.Client(
+                    api_key=geminiAPI,
+                    http_options=types.HttpOptions(base_url=GEMINI_API_BASE) if GEMINI_API_BASE else None
+                )
+    return gemini_client
+
+# Cliente HTTP saliente compartido (OpenWeatherMap, PayPal). Las URLs base se pueden apuntar a stubs locales
+WEATHER_API_BASE = os.getenv("WEATHER_API_BASE", "https://api.openweathermap.org").rstrip('/')
+PAYPAL_API_BASE = os.getenv("PAYPAL_API_BASE", "https://api-m.sandbox.paypal.com")
+http = ClienteHTTP(
+    timeout=(float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")), float(os.getenv("HTTP_READ_TIMEOUT", "10"))),
+    reintentos=int(os.getenv("HTTP_RETRIES", "2")),
+    backoff=float(os.getenv("HTTP_RETRY_BACKOFF", "0.3")),
+    conexiones_por_host=int(os.getenv("HTTP_POOL_SIZE", "20")),
+    disyuntores=disyuntores
+)
+paypal_api = PayPalAPI(
+    http, PAYPAL_API_BASE, os.getenv("PAYPAL_CLIENT_ID"), os.getenv("PAYPAL_CLIENT_SECRET"),
+    margen=int(os.getenv("PAYPAL_TOKEN_MARGIN", "60"))
+)
+
+# Caché del clima: en proceso por defecto; con REDIS_URL todos los workers comparten los aciertos
+REDIS_URL = os.getenv("REDIS_URL")
+weather_cache = TTLCache(
+    "clima",
+    ttl=int(os.getenv("WEATHER_CACHE_TTL", "600")),
+    stale_ttl=int(os.getenv("WEATHER_CACHE_STALE_TTL", "300")),
+    max_entradas=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "2048")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:clima:") if REDIS_URL else None
+)
+
+# Pronóstico de 5 días ya resumido por día (ver pronostico.py), compartido por todos los viajes a la misma ciudad.
+# OpenWeatherMap lo recalcula cada 3 horas: una hora de caché no lo deja viejo
+pronostico_cache = TTLCache(
+    "pronostico",
+    ttl=int(os.getenv("FORECAST_CACHE_TTL", "3600")),
+    stale_ttl=int(os.getenv("FORECAST_CACHE_STALE_TTL", "600")),
+    max_entradas=int(os.getenv("FORECAST_CACHE_MAX_ENTRIES", "1024")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:pronostico:") if REDIS_URL else None
+)
+
+# Caché de consejos de /api/v1/ai-advice, por huella de preferencias + clima agrupado
+consejos_cache = TTLCache(
+    "consejos_ia",
+    ttl=int(os.getenv("AI_ADVICE_CACHE_TTL", "1800")),
+    max_entradas=int(os.getenv("AI_ADVICE_CACHE_MAX_ENTRIES", "5000")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:consejos:") if REDIS_URL else None
+)
+
+# Respuestas de /api/v1/ai-outfit y /api/v1/ai-travel-assistant por Idempotency-Key (ver _idempotente).
+# Sin cabecera, el mismo usuario con el mismo pedido se deduplica solo por IDEMPOTENCY_IMPLICIT_TTL segundos
+idempotencia_cache = TTLCache(
+    "idempotencia",
+    ttl=int(os.getenv("IDEMPOTENCY_TTL", "86400")),
+    max_entradas=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:idempotencia:") if REDIS_URL else None
+)
+duplicados_cache = TTLCache(
+    "duplicados",
+    ttl=int(os.getenv("IDEMPOTENCY_IMPLICIT_TTL", "10")),
+    max_entradas=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+)
 
 # --- 6. Funciones de Ayuda ---
 def validate_password(password):
@@ -156,18 +556,759 @@ def validate_password(password):
         'errors': errors
     }
 
+indice_ciudades = None
+_indice_lock = threading.Lock()
+
+def _indice():
+    # El índice de ciudades se carga con la primera búsqueda (la lista completa de OWM tarda en leerse)
+    global indice_ciudades
+    if indice_ciudades is None:
+        with _indice_lock:
+            if indice_ciudades is None:
+                indice = IndiceCiudades.desde_archivo()
+                if CITY_INDEX_STRICT and len(indice) < CITY_INDEX_STRICT_MIN:
+                    _log("warning", "indice_ciudades_no_estricto", ciudades=len(indice), minimo=CITY_INDEX_STRICT_MIN)
+                indice_ciudades = indice
+    return indice_ciudades
+
+def _indice_estricto():
+    # CITY_INDEX_STRICT se ignora si el índice no tiene la lista completa: rechazaría la mayoría de las ciudades
+    return CITY_INDEX_STRICT and len(_indice()) >= CITY_INDEX_STRICT_MIN
+
+def resolver_ciudad(ciudad):
+    """
+    Lo que se le pide a OpenWeatherMap para 'ciudad': su id (int) si está en el índice o ya es un id,
+    el texto tal cual si no está y el índice no es estricto, o None si hay que rechazarla.
+    """
+    if isinstance(ciudad, int):
+        return ciudad
+    if ciudad.strip().isdigit():
+        return int(ciudad)
+    ciudad_id = _indice().resolver(ciudad)
+    if ciudad_id is not None:
+        return ciudad_id
+    return None if _indice_estricto() else ciudad
+
 def obtener_datos_clima_api(ciudad):
-    base_url = "https://api.openweathermap.org/data/2.5/weather"
-    parametros = {'q': ciudad, 'appid': MIowmAPI, 'units': 'metric', 'lang': 'es'}
+    """
+    Devuelve (datos, status) del clima actual para 'ciudad' pasando por la caché.
+    El nombre se resuelve a su id con el índice de ciudades, así 'Cordoba', 'córdoba' o
+    'Córdoba, AR' comparten caché y una ciudad desconocida se rechaza (404) sin llamar al upstream.
+    Los pedidos concurrentes para la misma ciudad comparten una sola llamada a OpenWeatherMap
+    y los errores no se guardan en la caché. Si OpenWeatherMap no está disponible (5xx, timeout o
+    circuito abierto) se responde con el último clima conocido, si no tiene más de WEATHER_CACHE_DEGRADED_TTL.
+    """
+    consulta = resolver_ciudad(ciudad)
+    if consulta is None:
+        return None, 404
+    clave = f"id:{consulta}" if isinstance(consulta, int) else normalizar_clave(consulta)
+    # Con el circuito abierto se sirve el clima vencido sin pasar por la caché ni esperar a otras cargas
+    if disyuntores['openweathermap'].estado == ABIERTO:
+        anterior = _clima_degradado(clave)
+        if anterior is not None:
+            return anterior
+    datos, status = weather_cache.obtener(
+        clave,
+        lambda: _cargar_clima(consulta),
+        cacheable=lambda resultado: resultado[0] is not None
+    )
+    if datos is None and status >= 500:
+        return _clima_degradado(clave) or (datos, status)
+    return datos, status
+
+def _clima_degradado(clave):
+    anterior = weather_cache.get_vencido(clave, WEATHER_CACHE_DEGRADED_TTL)
+    if anterior is None:
+        return None
+    _marcar_degradado('clima')
+    return anterior
+
+def obtener_pronostico(ciudad):
+    """
+    Devuelve (días, status) con el pronóstico resumido por día para 'ciudad' (ver resumir_por_dia), con la
+    misma resolución de nombres, caché compartida y respaldo ante caídas que obtener_datos_clima_api.
+    """
+    consulta = resolver_ciudad(ciudad)
+    if consulta is None:
+        return None, 404
+    clave = f"id:{consulta}" if isinstance(consulta, int) else normalizar_clave(consulta)
+    if disyuntores['openweathermap'].estado == ABIERTO:
+        anterior = _pronostico_degradado(clave)
+        if anterior is not None:
+            return anterior
+    dias, status = pronostico_cache.obtener(
+        clave,
+        lambda: _cargar_pronostico(consulta),
+        cacheable=lambda resultado: resultado[0] is not None
+    )
+    if dias is None and status >= 500:
+        return _pronostico_degradado(clave) or (dias, status)
+    return dias, status
+
+def _pronostico_degradado(clave):
+    anterior = pronostico_cache.get_vencido(clave, WEATHER_CACHE_DEGRADED_TTL)
+    if anterior is None:
+        return None
+    _marcar_degradado('pronostico')
+    return anterior
+
+def _marcar_degradado(tipo):
+    # Respuesta armada sin el upstream (caché vencida o recomendador local): cabecera X-Degraded y métrica
+    respuestas_degradadas.incrementar(tipo)
+    if has_request_context():
+        g.degradado = tipo
+
+respuestas_degradadas = registro.agregar(Contador(
+    'guardianclima_degraded_responses_total',
+    'Respuestas armadas sin el upstream: clima vencido de la caché o consejo del recomendador local.',
+    ('kind',)
+))
+
+def _cargar_clima(consulta):
+    _liberar_conexion()
+    return _obtener_datos_clima_upstream(consulta)
+
+def _cargar_pronostico(consulta):
+    _liberar_conexion()
+    return _obtener_pronostico_upstream(consulta)
+
+def _liberar_conexion():
+    """
+    Antes de una llamada lenta (OpenWeatherMap, Gemini) cierra la transacción de solo lectura para
+    devolver la conexión al pool: así las requests que esperan upstreams no agotan el pool de la base,
+    que con el worker gevent es lo que limitaría las llamadas en curso. No hace nada si hay cambios pendientes.
+    """
+    if not has_app_context() or not db.session().in_transaction():
+        return
+    if db.session.new or db.session.dirty or db.session.deleted:
+        return
+    db.session.commit()
+
+@contextmanager
+def _llamada_externa(nombre):
+    # Con el circuito abierto lanza CircuitoAbierto sin llamar; las excepciones cuentan como fallo
+    _liberar_conexion()
+    with disyuntores[nombre].llamada(), fase(nombre):
+        yield
+
+def _generar_gemini(solicitud):
+    """
+    generate_content con el disyuntor de Gemini y el timeout recortado al plazo de la request.
+    Registra tokens y latencia de la llamada (ver PromptsGemini.registrar).
+    """
+    # Sin plazo restante se lanza PlazoVencido antes de pasar por el disyuntor, como en http_client.py:
+    # es un límite de la request, no un fallo de Gemini
+    argumentos = _con_timeout_gemini(solicitud)
+    inicio = time.perf_counter()
     try:
-        respuesta = requests.get(base_url, params=parametros, timeout=10)
+        with _llamada_externa('gemini'):
+            respuesta = _gemini().models.generate_content(**argumentos)
+    except CircuitoAbierto:
+        raise
+    except Exception:
+        prompts_gemini.registrar(solicitud, time.perf_counter() - inicio, error=True)
+        raise
+    prompts_gemini.registrar(solicitud, time.perf_counter() - inicio, uso=getattr(respuesta, 'usage_metadata', None),
+                             texto_salida=respuesta.text)
+    return respuesta
+
+def _con_timeout_gemini(solicitud):
+    from google.genai import types
+    config = solicitud.get('config') or types.GenerateContentConfig()
+    propio = config.http_options.timeout if config.http_options and config.http_options.timeout else GEMINI_TIMEOUT_MS
+    timeout_ms = int(recortar_timeout(propio / 1000, 'gemini') * 1000)
+    argumentos = {clave: valor for clave, valor in solicitud.items() if clave != 'ruta'}
+    return dict(argumentos, config=config.model_copy(update={'http_options': types.HttpOptions(timeout=timeout_ms)}))
+
+def _obtener_datos_clima_upstream(ciudad):
+    # 'ciudad' es un id de OpenWeatherMap (int) o, sin índice estricto, un nombre para q=
+    import requests
+    base_url = f"{WEATHER_API_BASE}/data/2.5/weather"
+    parametros = {'id' if isinstance(ciudad, int) else 'q': ciudad, 'appid': MIowmAPI, 'units': 'metric', 'lang': 'es'}
+    try:
+        respuesta = http.get('openweathermap', base_url, params=parametros)
         respuesta.raise_for_status()
         return respuesta.json(), 200
+    except requests.exceptions.HTTPError as e:
+        # Se conserva el código de OpenWeatherMap (ej. 404 si la ciudad no existe)
+        return None, e.response.status_code
+    except ErrorUpstream as e:
+        return None, e.status
+    except requests.exceptions.Timeout:
+        return None, 504
     except requests.exceptions.RequestException as e:
         return None, 500
 
+def _obtener_pronostico_upstream(ciudad):
+    # Se guarda el resumen por día, no la respuesta: es lo único que usa el prompt y ocupa ~20 veces menos
+    import requests
+    parametros = {'id' if isinstance(ciudad, int) else 'q': ciudad, 'appid': MIowmAPI, 'units': 'metric',
+                  'lang': 'es', 'cnt': INTERVALOS_PRONOSTICO}
+    try:
+        respuesta = http.get('openweathermap', f"{WEATHER_API_BASE}/data/2.5/forecast", params=parametros)
+        respuesta.raise_for_status()
+        return resumir_por_dia(respuesta.json()), 200
+    except requests.exceptions.HTTPError as e:
+        return None, e.response.status_code
+    except ErrorUpstream as e:
+        return None, e.status
+    except requests.exceptions.Timeout:
+        return None, 504
+    except requests.exceptions.RequestException:
+        return None, 500
+
+def _obtener_grupo_upstream(ids):
+    """
+    Clima de hasta OWM_GROUP_MAX ciudades por id en una sola llamada (/data/2.5/group).
+    Devuelve ({id: datos}, status); los ids que OpenWeatherMap no conoce no aparecen.
+    """
+    import requests
+    parametros = {'id': ','.join(str(i) for i in ids), 'appid': MIowmAPI, 'units': 'metric', 'lang': 'es'}
+    try:
+        respuesta = http.get('openweathermap', f"{WEATHER_API_BASE}/data/2.5/group", params=parametros)
+        respuesta.raise_for_status()
+        return {datos['id']: datos for datos in respuesta.json().get('list', [])}, 200
+    except requests.exceptions.HTTPError as e:
+        return {}, e.response.status_code
+    except ErrorUpstream as e:
+        return {}, e.status
+    except requests.exceptions.Timeout:
+        return {}, 504
+    except requests.exceptions.RequestException:
+        return {}, 500
+
+_ejecutor_clima = None
+_ejecutor_clima_lock = threading.Lock()
+
+def _ejecutor_batch():
+    # Hilos para las llamadas a OpenWeatherMap de /api/v1/weather/batch (greenlets con el worker gevent)
+    global _ejecutor_clima
+    with _ejecutor_clima_lock:
+        if _ejecutor_clima is None:
+            _ejecutor_clima = ThreadPoolExecutor(max_workers=WEATHER_BATCH_WORKERS, thread_name_prefix="clima-batch")
+    return _ejecutor_clima
+
+def obtener_clima_varias(ciudades):
+    """
+    Clima de varias ciudades a la vez. 'ciudades' mezcla nombres (str) e ids de OpenWeatherMap (int).
+    Los nombres se resuelven a su id con el índice de ciudades; los ids sin caché se agrupan en
+    llamadas a /data/2.5/group de hasta OWM_GROUP_MAX. Los nombres que no están en el índice
+    (sin índice estricto) se piden uno por uno en paralelo, acotado por WEATHER_BATCH_WORKERS.
+    Devuelve {ciudad: (datos, status)} con cada ciudad tal como vino.
+    """
+    resultados, por_id, faltan_ids, nombres = {}, {}, [], []
+    for ciudad in dict.fromkeys(ciudades):
+        consulta = resolver_ciudad(ciudad)
+        if consulta is None:
+            resultados[ciudad] = (None, 404)
+        elif isinstance(consulta, int):
+            por_id.setdefault(consulta, []).append(ciudad)
+        else:
+            nombres.append(ciudad)
+    for ciudad_id, pedidas in por_id.items():
+        en_cache = weather_cache.get(f"id:{ciudad_id}")
+        if en_cache is None:
+            faltan_ids.append(ciudad_id)
+            continue
+        for ciudad in pedidas:
+            resultados[ciudad] = en_cache
+
+    _liberar_conexion()
+    ejecutor = _ejecutor_batch()
+
+    # Primero las llamadas agrupadas (una por cada OWM_GROUP_MAX ids), después una por nombre.
+    # Los hilos del ejecutor heredan el plazo de la request
+    grupos = {
+        ejecutor.submit(con_plazo(_obtener_grupo_upstream), faltan_ids[i:i + OWM_GROUP_MAX]): faltan_ids[i:i + OWM_GROUP_MAX]
+        for i in range(0, len(faltan_ids), OWM_GROUP_MAX)
+    }
+    futuros = {ciudad: ejecutor.submit(con_plazo(obtener_datos_clima_api), ciudad) for ciudad in nombres}
+    for futuro, ids in grupos.items():
+        encontrados, status = futuro.result()
+        for ciudad_id in ids:
+            datos = encontrados.get(ciudad_id)
+            if datos is not None:
+                resultado = (datos, 200)
+                weather_cache.set(f"id:{ciudad_id}", resultado)
+            elif status >= 500:
+                resultado = _clima_degradado(f"id:{ciudad_id}") or (None, status)
+            else:
+                resultado = (None, 404 if status == 200 else status)
+            for ciudad in por_id[ciudad_id]:
+                resultados[ciudad] = resultado
+    for ciudad, futuro in futuros.items():
+        try:
+            resultados[ciudad] = futuro.result()
+        except Exception:
+            resultados[ciudad] = (None, 500)
+    return resultados
+
+def _crear_token(user):
+    # Token con los claims que usa el frontend (plan, preferencias y usos de IA)
+    additional_claims = {
+        "plan": user.plan,
+        "username": user.username,
+        "prefs_saved": user.preferencias_guardadas,
+        "ai_outfit_uses": usos_vigentes(user, 'outfit'),
+        "ai_travel_uses": usos_vigentes(user, 'travel')
+    }
+    return create_access_token(identity=str(user.id), additional_claims=additional_claims)
+
+# --- Cuotas del plan gratuito ---
+def _consumir_cuota(user, recurso):
+    """
+    Consume un uso del plan gratuito con un único UPDATE condicional (ver cuotas.py).
+    Retorna (consumo, None) o (None, respuesta_403). 'consumo' es None para los planes pagos.
+    """
+    if user.plan != 'free':
+        return None, None
+    limite = LIMITES_FREE[recurso]
+    ok, _, periodo = cuotas.consumir(user.id, recurso, limite)
+    if not ok:
+        funcion = "el consejo de vestimenta" if recurso == 'outfit' else "el asistente de viaje"
+        usos = "uso" if limite == 1 else "usos"
+        return None, (jsonify({"error": f"Has alcanzado el límite de {limite} {usos}{TEXTO_PERIODO[AI_QUOTA_PERIOD]} para {funcion}. Actualiza a Pro para usos ilimitados."}), 403)
+    return {"recurso": recurso, "periodo": periodo}, None
+
+def _devolver_cuota(user_id, consumo):
+    # Si la IA falló, el uso no cuenta
+    if consumo:
+        cuotas.devolver(user_id, consumo["recurso"], consumo["periodo"])
+
+# --- Idempotencia de los endpoints de IA ---
+def _idempotente(user, ruta, huella, calcular):
+    """
+    Ejecuta calcular() (que devuelve una respuesta de Flask) una sola vez por pedido:
+    - con la cabecera Idempotency-Key, la respuesta 2xx se guarda IDEMPOTENCY_TTL segundos y los
+      reintentos con la misma clave la reciben de nuevo (misma clave con otro contenido: 422);
+    - sin cabecera, la clave es el usuario más la 'huella' del contenido, por IDEMPOTENCY_IMPLICIT_TTL.
+    Los pedidos concurrentes con la misma clave esperan al que está en curso en lugar de repetir
+    el trabajo (y la cuota, y el OutfitHistory). Las respuestas repetidas llevan 'Idempotent-Replayed: true'.
+    """
+    clave_cliente = request.headers.get('Idempotency-Key')
+    if clave_cliente is not None and not 0 < len(clave_cliente) <= 255:
+        return jsonify({"error": "La cabecera Idempotency-Key debe tener entre 1 y 255 caracteres."}), 400
+    if clave_cliente is not None:
+        cache, clave = idempotencia_cache, f"{user.id}:{ruta}:{clave_cliente}"
+    else:
+        cache, clave = duplicados_cache, f"{user.id}:{ruta}:{huella}"
+
+    propia = []
+
+    def cargar():
+        respuesta = make_response(calcular())
+        propia.append(respuesta)
+        return {
+            "huella": huella, "status": respuesta.status_code, "cuerpo": respuesta.get_json(),
+            "cabeceras": {k: v for k, v in respuesta.headers.items() if k in ('Location', 'Retry-After')},
+        }
+
+    guardada = cache.obtener(clave, cargar, cacheable=lambda guardada: 200 <= guardada["status"] < 300)
+    if propia:
+        return propia[0]
+    if guardada["huella"] != huella:
+        return jsonify({"error": "La Idempotency-Key ya se usó con otro pedido."}), 422
+    cuerpo = dict(guardada["cuerpo"])
+    if "access_token" in cuerpo:
+        cuerpo["access_token"] = _crear_token(user)
+    return jsonify(cuerpo), guardada["status"], dict(guardada["cabeceras"], **{"Idempotent-Replayed": "true"})
+
+def _huella(*partes):
+    return hashlib.sha256(json.dumps(partes, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# --- Réplica de lectura ---
+# Después de escribir, un usuario lee de la primaria durante DB_REPLICA_STICKY_SECONDS para ver sus
+# propios cambios aunque la réplica venga atrasada (con REDIS_URL lo saben todos los workers)
+escrituras_recientes = TTLCache(
+    "escrituras_recientes",
+    ttl=int(os.getenv("DB_REPLICA_STICKY_SECONDS", "10")),
+    max_entradas=int(os.getenv("DB_REPLICA_STICKY_MAX_ENTRIES", "10000")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:escrituras:") if REDIS_URL else None
+)
+
+def _registrar_escritura(user_ids=None):
+    # Sin user_ids, el usuario de la request actual (si la request lleva JWT)
+    if user_ids is None:
+        try:
+            user_ids = [get_jwt_identity()]
+        except RuntimeError:
+            return
+    for user_id in user_ids:
+        if user_id is not None:
+            escrituras_recientes.set(str(user_id), True)
+
+if DATABASE_REPLICA_URL:
+    detectar_escrituras(Engine, _registrar_escritura)
+
+def _leer_de_replica():
+    """Lecturas de la sesión desde la réplica, salvo que el usuario haya escrito hace poco."""
+    return leer_de_replica(bool(DATABASE_REPLICA_URL) and escrituras_recientes.get(str(get_jwt_identity())) is None)
+
+def _solo_lectura(vista):
+    # Para rutas que no escriben en la base: todas sus consultas pueden ir a la réplica
+    @wraps(vista)
+    def envuelta(*args, **kwargs):
+        with _leer_de_replica():
+            return vista(*args, **kwargs)
+    return envuelta
+
+# --- Paginación por cursor (keyset) ---
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+def _codificar_cursor(fecha, id_fila):
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{id_fila}".encode()).decode('ascii')
+
+def _decodificar_cursor(cursor):
+    fecha, id_fila = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split('|')
+    return dt.datetime.fromisoformat(fecha), int(id_fila)
+
+def _leer_paginacion():
+    """Lee ?limit= y ?cursor= de la request. Lanza ValueError si el cursor no es válido."""
+    limite = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    cursor = request.args.get('cursor')
+    return limite, _decodificar_cursor(cursor) if cursor else None
+
+def _paginar(query, columna_fecha, columna_id, limite, cursor):
+    """
+    Paginación keyset: en lugar de OFFSET se filtra por (fecha, id) < último visto, así cada página
+    cuesta lo mismo sin importar cuántas filas tenga el usuario. Retorna (filas, siguiente_cursor).
+    """
+    if cursor:
+        query = query.filter(tuple_(columna_fecha, columna_id) < cursor)
+    filas = query.order_by(columna_fecha.desc(), columna_id.desc()).limit(limite + 1).all()
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _codificar_cursor(getattr(filas[-1], columna_fecha.key), getattr(filas[-1], columna_id.key))
+    return filas, siguiente
+
+def _respuesta_paginada(items, siguiente, cuerpo=None):
+    # El cuerpo sigue siendo una lista; el cursor de la próxima página va en las cabeceras.
+    # 'cuerpo' es la lista ya serializada (ver _listado_condicional)
+    respuesta = jsonify(items) if cuerpo is None else Response(cuerpo, mimetype='application/json')
+    if siguiente:
+        respuesta.headers["X-Next-Cursor"] = siguiente
+        # La próxima página conserva los demás parámetros de la request (ej. ?limit=)
+        parametros = request.args.copy()
+        parametros['cursor'] = siguiente
+        respuesta.headers["Link"] = f'<{request.base_url}?{urlencode(list(parametros.items(multi=True)))}>; rel="next"'
+    return respuesta
+
+# --- Listados condicionales (ETag) ---
+# Cuerpos ya serializados de /api/v1/history y /api/v1/outfits por usuario, plan, versión y página.
+# La versión es parte de la clave: cada escritura la incrementa y deja inalcanzables las entradas viejas
+listados_cache = TTLCache(
+    "listados",
+    ttl=int(os.getenv("LIST_CACHE_TTL", "300")),
+    max_entradas=int(os.getenv("LIST_CACHE_MAX_ENTRIES", "5000")),
+    backend=RedisBackend(REDIS_URL, "guardianclima:listados:") if REDIS_URL else None
+)
+
+listados_no_modificados = registro.agregar(Contador(
+    'guardianclima_list_not_modified_total',
+    'Listados respondidos con 304 porque el ETag del cliente seguía vigente.',
+    ('list',)
+))
+
+def _nueva_version(columna, user_ids):
+    """UPDATE que incrementa 'columna' (historial_version / outfits_version) de los usuarios dados."""
+    return update(Users).where(Users.id.in_(list(user_ids))).values(
+        {columna: columna + 1}
+    ).execution_options(synchronize_session=False)
+
+def _listado_condicional(nombre, columna_version, user_id, variante, construir):
+    """
+    Respuesta de un listado con ETag derivado de la versión del usuario ('columna_version') y de la
+    'variante' (plan, página...). Si el cliente ya tiene esa versión (If-None-Match) se responde 304
+    sin leer las filas; si no, el cuerpo sale de listados_cache o de construir() -> (items, siguiente).
+    """
+    version = db.session.query(columna_version).filter(Users.id == user_id).scalar() or 0
+    etag = _huella(nombre, int(user_id), version, variante)[:32]
+    if request.if_none_match.contains(etag):
+        listados_no_modificados.incrementar(nombre)
+        respuesta = Response(status=304)
+    else:
+        def serializar():
+            items, siguiente = construir()
+            return {'cuerpo': jsonify(items).get_data(as_text=True), 'siguiente': siguiente}
+        datos = listados_cache.obtener(etag, serializar)
+        respuesta = _respuesta_paginada(None, datos['siguiente'], cuerpo=datos['cuerpo'])
+    respuesta.set_etag(etag)
+    # El navegador puede guardar la respuesta, pero tiene que revalidarla en cada uso
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+# --- Trabajos de IA asíncronos (submit/poll) ---
+def _modo_asincrono():
+    # El cliente pide el modo asíncrono con ?async=1 o con la cabecera 'Prefer: respond-async'
+    if request.args.get('async', '').lower() in ('1', 'true'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+def _cola_llena():
+    return jsonify({"error": "Hay demasiados trabajos en cola. Intenta de nuevo en unos segundos."}), 503, {"Retry-After": "5"}
+
+def _encolar_job(user, tipo, payload):
+    job = Jobs(id=uuid.uuid4().hex, user_id=user.id, tipo=tipo, payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+    if not job_queue.encolar(job.id):
+        # La cola se llenó entre job_queue.hay_lugar() y acá: el cliente va a reintentar, así que este trabajo
+        # no se retoma al reiniciar (queda en 'error') y el uso de la cuota se devuelve
+        _devolver_cuota(user.id, payload.get("cuota"))
+        job.estado, job.status_code, job.payload = 'error', 503, None
+        job.resultado = json.dumps({"error": "Hay demasiados trabajos en cola."})
+        job.terminado = dt.datetime.utcnow()
+        db.session.commit()
+        return _cola_llena()
+    return jsonify({
+        "job_id": job.id,
+        "estado": job.estado,
+        "status_url": f"/api/v1/jobs/{job.id}",
+        "access_token": _crear_token(user)
+    }), 202, {"Location": f"/api/v1/jobs/{job.id}"}
+
+def _ejecutar_job(job_id):
+    with _aplicacion.app_context():
+        # Reclamamos el trabajo con un UPDATE condicional para que dos workers no lo ejecuten a la vez
+        reclamado = Jobs.query.filter_by(id=job_id, estado='pending').update(
+            {"estado": "running", "iniciado": dt.datetime.utcnow()}
+        )
+        db.session.commit()
+        if not reclamado:
+            return
+
+        job = Jobs.query.get(job_id)
+        user = Users.query.get(job.user_id)
+        payload = json.loads(job.payload)
+        try:
+            if job.tipo == 'outfit':
+                prendas = payload["prendas"]
+                for prenda in prendas:
+                    if prenda.get("imagen"):
+                        prenda["imagen"] = base64.b64decode(prenda["imagen"])
+                resultado, status_code = _ejecutar_outfit(user, payload["ciudad"], prendas)
+            else:
+                resultado, status_code = _ejecutar_viaje(
+                    user, payload["ciudad_destino"], payload["fecha_inicio"], payload["fecha_fin"]
+                )
+        except Exception as e:
+            db.session.rollback()
+            _log("error", "job_ia_fallido", job_id=job_id, error=str(e))
+            resultado, status_code = {"error": "No se pudo completar el trabajo de IA."}, 500
+
+        if status_code != 200:
+            _devolver_cuota(job.user_id, payload.get("cuota"))
+        job.estado = 'done' if status_code == 200 else 'error'
+        job.resultado = json.dumps(resultado)
+        job.status_code = status_code
+        job.payload = None  # Ya no hacen falta las imágenes
+        job.terminado = dt.datetime.utcnow()
+        db.session.commit()
+
+# --- Respuestas en streaming (SSE) ---
+def _modo_streaming():
+    # ?stream=1 o 'Accept: text/event-stream' (lo que envía EventSource)
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def _evento_sse(datos, evento=None):
+    linea = f"event: {evento}\n" if evento else ""
+    return f"{linea}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+def _responder_sse(user, ruta, solicitud, mensaje_error, al_terminar=None, al_fallar=None, texto_cacheado=None,
+                   respaldo=None):
+    """
+    Envía los fragmentos de Gemini como server-sent events a medida que llegan.
+    El evento final 'done' lleva el texto completo y el access_token renovado;
+    'al_terminar(texto)' se ejecuta antes (ej. guardar el OutfitHistory) y 'al_fallar()' si hay un error
+    (ej. devolver el uso de la cuota). Con 'texto_cacheado' no se llama a Gemini: se envía ese texto.
+    Si Gemini falla antes del primer fragmento y hay 'respaldo()', se envía el texto que devuelva.
+    La métrica principal es el tiempo hasta el primer fragmento (TTFB). Si el cliente corta el stream antes del
+    evento 'done' también se llama a 'al_fallar()'.
+    """
+    inicio = time.perf_counter()
+    inicio_request = g.get('inicio_request', inicio)
+    endpoint, metodo = request.url_rule.rule, request.method
+
+    def generar():
+        # resultado: ok, respaldo, error o desconectado (GeneratorExit: el cliente cerró la conexión)
+        partes, resultado = [], 'desconectado'
+        try:
+            if texto_cacheado is not None:
+                fragmentos = [texto_cacheado]
+            else:
+                _liberar_conexion()
+                fragmentos = _fragmentos_gemini(solicitud)
+            for fragmento in fragmentos:
+                if not fragmento:
+                    continue
+                if not partes:
+                    ttfb = time.perf_counter() - inicio
+                    latencias_streaming.registrar(f"{ruta}:ttfb", ttfb)
+                    ttfb_streaming.observar(ttfb, ruta)
+                partes.append(fragmento)
+                yield _evento_sse({"texto": fragmento})
+
+            texto = "".join(partes)
+            if texto_cacheado is None:
+                registrar_fase('gemini', time.perf_counter() - inicio)
+            if al_terminar and texto_cacheado is None:
+                al_terminar(texto)
+            resultado = 'ok'
+            latencias_streaming.registrar(f"{ruta}:total", time.perf_counter() - inicio)
+            yield _evento_sse({"consejo": texto, "access_token": _crear_token(user)}, evento="done")
+        except Exception as e:
+            db.session.rollback()
+            _log("error", "gemini_streaming_fallido", ruta=ruta, error=str(e))
+            if respaldo is not None and not partes:
+                resultado = 'respaldo'
+                texto = respaldo()
+                yield _evento_sse({"texto": texto})
+                yield _evento_sse({"consejo": texto, "access_token": _crear_token(user)}, evento="done")
+                return
+            resultado = 'error'
+            if al_fallar:
+                al_fallar()
+            yield _evento_sse({"error": mensaje_error}, evento="error")
+        finally:
+            # GeneratorExit no pasa por el except: si el cliente se fue antes del 'done', el uso se devuelve acá
+            if resultado == 'desconectado':
+                _log("info", "streaming_cortado", ruta=ruta, fragmentos=len(partes))
+                if al_fallar:
+                    al_fallar()
+            fin = time.perf_counter()
+            duracion_streaming.observar(fin - inicio, ruta, resultado)
+            duracion_requests.observar(fin - inicio_request, endpoint, metodo, '200')
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _fragmentos_gemini(solicitud):
+    # El stream completo cuenta como una llamada para el disyuntor de Gemini y para el uso de tokens;
+    # el usage_metadata del último fragmento tiene los totales
+    # Como en _generar_gemini, el plazo vencido se detecta antes de pasar por el disyuntor: no cuenta como fallo
+    # de Gemini ni ocupa la llamada de prueba del semiabierto
+    argumentos = _con_timeout_gemini(solicitud)
+    disyuntores['gemini'].verificar()
+    inicio, uso, partes = time.monotonic(), None, []
+    try:
+        for fragmento in _gemini().models.generate_content_stream(**argumentos):
+            uso = getattr(fragmento, 'usage_metadata', None) or uso
+            partes.append(fragmento.text or "")
+            yield fragmento.text
+    except GeneratorExit:
+        # El cliente cortó el stream: no dice nada de Gemini, pero libera la llamada de prueba si lo era
+        disyuntores['gemini'].registrar(True, time.monotonic() - inicio)
+        prompts_gemini.registrar(solicitud, time.monotonic() - inicio, uso=uso, texto_salida="".join(partes))
+        raise
+    except Exception:
+        disyuntores['gemini'].registrar(False, time.monotonic() - inicio)
+        prompts_gemini.registrar(solicitud, time.monotonic() - inicio, error=True)
+        raise
+    disyuntores['gemini'].registrar(True, time.monotonic() - inicio)
+    prompts_gemini.registrar(solicitud, time.monotonic() - inicio, uso=uso, texto_salida="".join(partes))
+
+latencias_streaming = VentanaLatencias()
+ttfb_streaming = registro.agregar(Histograma(
+    'guardianclima_streaming_ttfb_seconds', 'Tiempo hasta el primer fragmento de las respuestas SSE por ruta.',
+    ('route',)
+))
+duracion_streaming = registro.agregar(Histograma(
+    'guardianclima_streaming_duration_seconds',
+    'Duración de las respuestas SSE por ruta y resultado (ok, respaldo, error, desconectado).',
+    ('route', 'outcome')
+))
+cuotas = Cuotas(db, Users.__table__)
+guardarropa = Guardarropa(db, Prendas.__table__)
+
+def _insertar_consultas(filas):
+    # Un solo INSERT con todas las filas del lote (executemany) y un commit por lote,
+    # junto con la nueva versión del historial de cada usuario del lote
+    with _aplicacion.app_context():
+        with db.engine.begin() as conexion:
+            conexion.execute(Queries.__table__.insert(), filas)
+            # La versión va antes que los rollups: su bloqueo de la fila del usuario es lo que espera
+            # reconstruir_rollups() (stats-rebuild) para no pisarse con este lote
+            conexion.execute(_nueva_version(Users.historial_version, {fila['user_id'] for fila in filas}))
+            actualizar_rollups(conexion, _tablas_rollup(), filas)
+    if DATABASE_REPLICA_URL:
+        _registrar_escritura({fila['user_id'] for fila in filas})
+
+# Historial de consultas de clima con escritura diferida (ver escritura_diferida.py)
+consultas_diferidas = EscrituraDiferida(
+    _insertar_consultas,
+    lote=int(os.getenv("QUERY_LOG_BATCH", "500")),
+    intervalo=int(os.getenv("QUERY_LOG_FLUSH_MS", "500")) / 1000,
+    max_pendientes=int(os.getenv("QUERY_LOG_MAX_PENDING", "10000")),
+    espera_max=int(os.getenv("QUERY_LOG_BLOCK_MS", "50")) / 1000,
+    nombre="consultas-clima",
+    tabla=Queries.__tablename__,
+    log=_log
+)
+
+job_queue = JobQueue(
+    _ejecutar_job,
+    max_workers=int(os.getenv("AI_JOB_WORKERS", "4")),
+    max_pendientes=int(os.getenv("AI_JOB_QUEUE_MAX", "100")),
+    log=_log
+)
+
+AI_JOB_STALE_SECONDS = int(os.getenv("AI_JOB_STALE_SECONDS", "300"))
+
+def recuperar_jobs_pendientes(todos=False):
+    """
+    Vuelve a encolar los trabajos que quedaron sin terminar (ej. un worker que se cayó a mitad de uno).
+    Los que quedaron 'running' más de AI_JOB_STALE_SECONDS se consideran abandonados y vuelven a 'pending'.
+    Con todos=True (al arrancar el proceso) se encolan todos los 'pending'; si no, solo los que llevan más
+    de AI_JOB_STALE_SECONDS esperando, que son los que estaban en la cola en memoria de un worker caído:
+    los recientes ya están en la cola de algún worker. Retorna cuántos trabajos encoló.
+    """
+    limite = dt.datetime.utcnow() - dt.timedelta(seconds=AI_JOB_STALE_SECONDS)
+    with _aplicacion.app_context():
+        abandonados = Jobs.query.filter(Jobs.estado == 'running', Jobs.iniciado < limite).update(
+            {"estado": "pending"}, synchronize_session=False
+        )
+        db.session.commit()
+        if abandonados:
+            _log("warning", "jobs_abandonados", cantidad=abandonados)
+        pendientes = db.session.query(Jobs.id).filter(Jobs.estado == 'pending')
+        if not todos:
+            # Los que vuelven de 'running' tienen 'iniciado'; los que nunca arrancaron, solo 'creado'
+            pendientes = pendientes.filter(db.func.coalesce(Jobs.iniciado, Jobs.creado) < limite)
+        encolados = 0
+        for (job_id,) in pendientes.order_by(Jobs.creado):
+            if not job_queue.encolar(job_id):
+                break
+            encolados += 1
+        return encolados
+
+# Con la primera request del proceso (y no al importar, que no debe tocar la base) se encolan los pendientes
+# y arranca la revisión periódica: un worker que se reinicia antes de que sus trabajos 'running' cumplan
+# AI_JOB_STALE_SECONDS los encuentra en la revisión siguiente
+AI_JOB_RECOVER_ON_START = os.getenv("AI_JOB_RECOVER_ON_START", "true").lower() == "true"
+_jobs_recuperados = False
+_jobs_recuperados_lock = threading.Lock()
+
+@bp.before_app_request
+def _recuperar_jobs_al_iniciar():
+    global _jobs_recuperados
+    if _jobs_recuperados or not AI_JOB_RECOVER_ON_START:
+        return
+    with _jobs_recuperados_lock:
+        if _jobs_recuperados:
+            return
+        _jobs_recuperados = True
+    recuperar_jobs_pendientes(todos=True)
+    job_queue.recuperar_periodicamente(recuperar_jobs_pendientes, AI_JOB_STALE_SECONDS)
+
 # --- 7. Endpoints de la Aplicación ---
-@app.route('/api/register', methods=['POST'])
+@bp.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     username, email, password = data.get('username'), data.get('email'), data.get('password')
@@ -188,30 +1329,36 @@ def register():
         return jsonify({"error": "El nombre de usuario ya está en uso"}), 409
     
     new_user = Users(username=username, email=email)
-    new_user.set_password(password) # El plan es 'free' por defecto
+    try:
+        new_user.set_password(password) # El plan es 'free' por defecto
+    except HashSaturado:
+        return _hash_saturado()
     db.session.add(new_user)
     db.session.commit()
     return jsonify({"mensaje": f"Usuario {username} creado con éxito"}), 201
 
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     email, password = data.get('email'), data.get('password')
     user = Users.query.filter_by(email=email).first()
-    if user and user.check_password(password):
-        # AÑADIMOS 'preferencias_guardadas' a los claims del token
-        additional_claims = {
-            "plan": user.plan, 
-            "username": user.username,
-            "prefs_saved": user.preferencias_guardadas,
-            "ai_outfit_uses": user.ai_outfit_uses,
-            "ai_travel_uses": user.ai_travel_uses
-        }
-        access_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
+    try:
+        valida = user is not None and user.check_password(password)
+    except HashSaturado:
+        return _hash_saturado()
+    if valida:
+        # Si check_password regeneró el hash con el costo actual, se guarda acá
+        if db.session.dirty:
+            db.session.commit()
+        # Los claims incluyen 'preferencias_guardadas' y los usos de IA (ver _crear_token)
+        access_token = _crear_token(user)
         return jsonify(access_token=access_token)
     return jsonify({"error": "Credenciales inválidas"}), 401
 
-@app.route('/api/user/preferences', methods=['POST'])
+def _hash_saturado():
+    return jsonify({"error": "Hay demasiados inicios de sesión en curso. Intenta de nuevo en unos segundos."}), 503, {"Retry-After": "2"}
+
+@bp.route('/api/user/preferences', methods=['POST'])
 @jwt_required()
 def save_preferences():
     current_user_id = get_jwt_identity()
@@ -230,15 +1377,8 @@ def save_preferences():
     db.session.commit()
     
     # --- ¡LA SOLUCIÓN! ---
-    # 1. Creamos las propiedades para el nuevo token, ahora con 'prefs_saved' en True.
-    additional_claims = {
-        "plan": user.plan, 
-        "username": user.username,
-        "prefs_saved": user.preferencias_guardadas, # Esto ahora será True
-        "ai_outfit_uses": user.ai_outfit_uses,
-        "ai_travel_uses": user.ai_travel_uses
-    }
-    new_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
+    # 1. Creamos el nuevo token, ahora con 'prefs_saved' en True.
+    new_token = _crear_token(user)
     
     # 3. Lo devolvemos en la respuesta.
     return jsonify({
@@ -246,62 +1386,152 @@ def save_preferences():
         "access_token": new_token # <-- ¡NUEVO!
     }), 200
 
-@app.route('/api/v1/weather/<string:ciudad>', methods=['GET'])
+@bp.route('/api/v1/weather/<string:ciudad>', methods=['GET'])
 @jwt_required()
 def get_weather(ciudad):
     datos_clima, status_code = obtener_datos_clima_api(ciudad)
         
     if not datos_clima:
-        return jsonify({"error": f"No se pudo obtener el clima. Código: {status_code}"}), status_code
-    
-    try:
-        current_user_id = get_jwt_identity()
-        nueva_consulta = Queries(
-            user_id=current_user_id,
-            ciudad=datos_clima['name'],
-            temperatura=datos_clima['main']['temp'],
-            descripcion=datos_clima['weather'][0]['description']
-        )
-        db.session.add(nueva_consulta)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error al guardar en la base de datos: {e}")
+        respuesta = {"error": f"No se pudo obtener el clima. Código: {status_code}"}
+        if status_code == 404:
+            respuesta["sugerencias"] = _indice().autocompletar(ciudad, 5)
+        return jsonify(respuesta), status_code
     
+    # La consulta se guarda en segundo plano, en lotes: la respuesta no espera a la base
+    consultas_diferidas.registrar({
+        "user_id": int(get_jwt_identity()),
+        "ciudad": datos_clima['name'],
+        "temperatura": datos_clima['main']['temp'],
+        "descripcion": datos_clima['weather'][0]['description'],
+        "timestamp": dt.datetime.utcnow()
+    })
     return jsonify(datos_clima)
 
-@app.route('/api/v1/history', methods=['GET'])
+@bp.route('/api/v1/cities/autocomplete', methods=['GET'])
 @jwt_required()
+def autocomplete_cities():
+    """Ciudades del índice cuyo nombre empieza con ?q= (sin importar acentos ni mayúsculas)."""
+    try:
+        limite = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        return jsonify({"error": "'limit' debe ser un número."}), 400
+    return jsonify(_indice().autocompletar(request.args.get('q', ''), limite))
+
+@bp.route('/api/v1/weather/batch', methods=['POST'])
+@jwt_required()
+def get_weather_batch():
+    """
+    Clima de varias ciudades en un solo pedido: {"ciudades": ["Madrid", 3435910, ...]}
+    (nombres o ids de OpenWeatherMap). Responde siempre 200 con un resultado por ciudad, en el
+    mismo orden: {"ciudad", "datos"} o {"ciudad", "error", "status"} si esa ciudad falló.
+    """
+    data = request.get_json(silent=True) or {}
+    ciudades = data.get('ciudades')
+    if not isinstance(ciudades, list) or not ciudades:
+        return jsonify({"error": "Envía 'ciudades' con una lista de nombres o ids de ciudad."}), 400
+    if len(ciudades) > WEATHER_BATCH_MAX:
+        return jsonify({"error": f"Se pueden pedir hasta {WEATHER_BATCH_MAX} ciudades por vez."}), 400
+    for ciudad in ciudades:
+        valida = (isinstance(ciudad, str) and 0 < len(ciudad.strip()) <= 100) or \
+            (isinstance(ciudad, int) and not isinstance(ciudad, bool) and ciudad > 0)
+        if not valida:
+            return jsonify({"error": f"Ciudad no válida: {ciudad!r}"}), 400
+
+    por_ciudad = obtener_clima_varias(ciudades)
+    user_id = int(get_jwt_identity())
+    ahora = dt.datetime.utcnow()
+    resultados = []
+    for ciudad in ciudades:
+        datos_clima, status_code = por_ciudad[ciudad]
+        if not datos_clima:
+            resultados.append({"ciudad": ciudad, "error": f"No se pudo obtener el clima. Código: {status_code}",
+                               "status": status_code})
+            continue
+        resultados.append({"ciudad": ciudad, "datos": datos_clima})
+        # Todas las consultas del pedido van a la cola de escritura diferida y salen en el mismo lote
+        consultas_diferidas.registrar({
+            "user_id": user_id,
+            "ciudad": datos_clima['name'],
+            "temperatura": datos_clima['main']['temp'],
+            "descripcion": datos_clima['weather'][0]['description'],
+            "timestamp": ahora
+        })
+    return jsonify({"resultados": resultados})
+
+@bp.route('/api/v1/history', methods=['GET'])
+@jwt_required()
+@_solo_lectura
 def get_history():
     current_user_id = get_jwt_identity()
     claims = get_jwt()
     user_plan = claims.get("plan", "free") # Obtenemos el plan del token
 
-    query = Queries.query.filter_by(user_id=current_user_id).order_by(Queries.timestamp.desc())
+    try:
+        limite, cursor = _leer_paginacion()
+    except ValueError:
+        return jsonify({"error": "Cursor no válido."}), 400
 
-    # Aplicamos la lógica Freemium
+    # Aplicamos la lógica Freemium: solo las últimas 5 consultas y sin más páginas
     if user_plan == 'free':
-        query = query.limit(5)
-    
-    consultas = query.all()
-    historial_json = [{"ciudad": c.ciudad, "temperatura": c.temperatura, "descripcion": c.descripcion, "fecha": c.timestamp.strftime("%Y-%m-%d %H:%M:%S")} for c in consultas]
-    return jsonify(historial_json)
+        limite, cursor = 5, None
+
+    def construir():
+        # Proyección con solo las columnas del listado (cubiertas por ix_queries_user_timestamp)
+        query = db.session.query(
+            Queries.id, Queries.ciudad, Queries.temperatura, Queries.descripcion, Queries.timestamp
+        ).filter(Queries.user_id == current_user_id)
+        consultas, siguiente = _paginar(query, Queries.timestamp, Queries.id, limite, cursor)
+        if user_plan == 'free':
+            siguiente = None
+        historial_json = [{"ciudad": c.ciudad, "temperatura": c.temperatura, "descripcion": c.descripcion, "fecha": c.timestamp.strftime("%Y-%m-%d %H:%M:%S")} for c in consultas]
+        return historial_json, siguiente
+
+    # Las vistas free y premium difieren: el plan es parte del ETag y de la clave de la caché
+    variante = (user_plan, limite, request.args.get('cursor') if cursor else None)
+    return _listado_condicional('historial', Users.historial_version, current_user_id, variante, construir)
+
+# Ciudades y semanas que devuelve /api/v1/stats
+STATS_TOP_CITIES = int(os.getenv("STATS_TOP_CITIES", "10"))
+STATS_WEEKS = int(os.getenv("STATS_WEEKS", "12"))
+
+@bp.route('/api/v1/stats', methods=['GET'])
+@jwt_required()
+@_solo_lectura
+def get_stats():
+    """
+    Ciudades más consultadas, rangos de temperatura y consultas por semana del usuario. Sale de los
+    rollups (ver estadisticas.py): tres lecturas por clave primaria o índice, sin recorrer el historial.
+    """
+    current_user_id = get_jwt_identity()
+
+    def construir():
+        total = db.session.get(StatsUsuario, int(current_user_id))
+        ciudades = StatsCiudad.query.filter_by(user_id=current_user_id).order_by(
+            StatsCiudad.consultas.desc(), StatsCiudad.ciudad
+        ).limit(STATS_TOP_CITIES).all()
+        semanas = StatsSemana.query.filter_by(user_id=current_user_id).order_by(
+            StatsSemana.semana.desc()
+        ).limit(STATS_WEEKS).all()
+        return {
+            "total": total.resumen() if total else {"consultas": 0},
+            "ciudades": [dict(c.resumen(), ciudad=c.ciudad) for c in ciudades],
+            "semanas": [dict(s.resumen(), semana=s.semana.isoformat()) for s in semanas]
+        }, None
 
-@app.route('/api/v1/ai-outfit', methods=['POST'])
+    # Las estadísticas cambian solo cuando se escribe un lote del historial: mismo ETag que /api/v1/history
+    return _listado_condicional('estadisticas', Users.historial_version, current_user_id,
+                                (STATS_TOP_CITIES, STATS_WEEKS), construir)
+
+@bp.route('/api/v1/ai-outfit', methods=['POST'])
 @jwt_required()
 def get_ai_outfit():
     current_user_id = get_jwt_identity()
-    user = Users.query.get(current_user_id)
+    # Solo esta lectura va a la réplica: lo que sigue consume cuota y escribe el historial
+    with _leer_de_replica():
+        user = Users.query.get(current_user_id)
     if not user:
         return jsonify({"error": "Usuario no encontrado."}), 404
 
-    # Verificar el plan del usuario
-    if user.plan == 'free':
-        if user.ai_outfit_uses >= 3:
-            return jsonify({"error": "Has alcanzado el límite de 3 usos para el consejo de vestimenta. Actualiza a Pro para usos ilimitados."}), 403
-        user.ai_outfit_uses += 1
-        db.session.commit()
-
     # Obtener la ciudad del formulario o JSON, no de la URL
     ciudad = request.form.get('ciudad') # Asumimos que la ciudad vendrá como parte del formulario
     if not ciudad:
@@ -315,101 +1545,192 @@ def get_ai_outfit():
     if not archivos_imagenes:
         return jsonify({"error": "No se seleccionaron imágenes."}), 400
 
-    imagenes_pil = []
+    if len(archivos_imagenes) > AI_OUTFIT_MAX_IMAGES:
+        return jsonify({"error": f"Se permiten como máximo {AI_OUTFIT_MAX_IMAGES} imágenes."}), 400
+
+    contenidos = []
     for archivo in archivos_imagenes:
         if archivo.filename == '':
             return jsonify({"error": "Nombre de archivo no válido."}), 400
         if archivo:
-            try:
-                # Abrir la imagen directamente del stream para evitar guardar en disco innecesariamente
-                imagen = Image.open(archivo.stream)
-                imagenes_pil.append(imagen)
-            except Exception as e:
-                return jsonify({"error": f"Error al procesar imagen: {e}"}), 400
-            
-    # 2. Obtenemos los datos del clima (sin cambios aquí)
-    datos_clima, status_code = obtener_datos_clima_api(ciudad)
-    if not datos_clima: return jsonify({"error": f"No se pudo obtener el clima para la IA. Código: {status_code}"}), status_code
-    if not geminiAPI: return jsonify({"consejo": "La función de IA no está configurada."})
+            # Leemos los bytes del stream para evitar guardar en disco innecesariamente
+            contenidos.append(archivo.read())
+
+    # El streaming no se puede repetir: solo se deduplican las respuestas JSON (sincrónicas o 202 de un job)
+    if _modo_streaming():
+        return _procesar_outfit(user, ciudad, contenidos)
+    huella = _huella(ciudad, _modo_asincrono(), [hashlib.sha256(contenido).hexdigest() for contenido in contenidos])
+    return _idempotente(user, 'ai-outfit', huella, lambda: _procesar_outfit(user, ciudad, contenidos))
 
+def _procesar_outfit(user, ciudad, contenidos):
     try:
-        descripcion = datos_clima['weather'][0]['description']
-        temperatura = datos_clima['main']['temp']
-        sensacion_termica = datos_clima['main']['feels_like']
-        humedad = datos_clima['main']['humidity']
-
-        prompt = (
-            f"""
-            Basándote en las prendas identificadas en las imágenes, 
-            el clima actual en {ciudad} 
-            (Temperatura: {temperatura}°C, 
-            Sensación térmica: {sensacion_termica}°C, 
-            Humedad: {humedad}%, 
-            Descripción: {descripcion}), 
-            y las preferencias del usuario (Estilo: {user.estilo_preferido}, 
-            Actividad: {user.actividad_principal}, 
-            Sensibilidad al frío: {user.sensibilidad_frio}, 
-            Colores Preferidos: {user.colores_preferidos}, 
-            Preferencia de Clima: {user.preferencia_clima}, 
-            Frecuencia de Viajes: {user.frecuencia_viajes},
-            Tipo de Calzado Preferido: {user.tipo_calzado},
-            Frecuencia de Ejercicio Físico: {user.frecuencia_ejercicio},
-            Preferencia de Tejidos: {user.preferencia_tejido},
-            Prenda Favorita: {user.prenda_favorita}),
-            genera una recomendación de vestimenta estructurada 
-
-            Tu recomendación debe incluir las siguientes secciones:
-            - Parte de arriba:
-            - Parte de abajo:
-            - Calzado:
-            - Capas adicionales (si aplica):
-            - Accesorios relevantes (si aplica):
-
-            Para cada prenda o accesorio sugerido, incluye una descripción muy breve de sus características 
-            (ej. 'camiseta blanca de algodón', 'pantalón vaquero oscuro', 'zapatillas deportivas') para que el usuario pueda identificarla en sus fotos. 
-            Enfócate en un atuendo práctico y con estilo. NO USES LETRAS NEGRITAS, ASTERISCOS, NI HTML TAGS.
-            """
+        # Las prendas ya vistas salen del guardarropa; solo las nuevas se reducen para Gemini
+        prendas = _resolver_prendas(user, contenidos)
+    except Exception as e:
+        return jsonify({"error": f"Error al procesar imagen: {e}"}), 400
+    contenidos.clear()  # Liberamos los originales antes de la llamada a Gemini
+
+    # Verificar el plan del usuario (después de validar la request, para no gastar usos en errores)
+    if _modo_asincrono() and not job_queue.hay_lugar():
+        return _cola_llena()
+    consumo, respuesta_limite = _consumir_cuota(user, 'outfit')
+    if respuesta_limite:
+        return respuesta_limite
+
+    if _modo_asincrono():
+        return _encolar_job(user, 'outfit', {
+            "ciudad": ciudad,
+            "cuota": consumo,
+            "prendas": [
+                dict(prenda, imagen=base64.b64encode(prenda["imagen"]).decode('ascii')) if prenda.get("imagen") else prenda
+                for prenda in prendas
+            ]
+        })
+    if _modo_streaming():
+        solicitud, respuesta = _preparar_outfit(user, ciudad, prendas)
+        if respuesta:
+            if respuesta[1] != 200:
+                _devolver_cuota(user.id, consumo)
+            return jsonify(respuesta[0]), respuesta[1]
+        return _responder_sse(
+            user, 'ai-outfit', solicitud,
+            al_terminar=lambda texto: _guardar_outfit(user, ciudad, texto),
+            al_fallar=lambda: _devolver_cuota(user.id, consumo),
+            mensaje_error="No se pudo generar el consejo de IA de vestimenta."
         )
 
+    resultado, status_code = _ejecutar_outfit(user, ciudad, prendas)
+    if status_code == 200:
+        resultado["access_token"] = _crear_token(user)
+    else:
+        _devolver_cuota(user.id, consumo)
+    return jsonify(resultado), status_code
 
-        response = gemini_client.models.generate_content(
-            model='gemini-2.5-flash-lite-preview-06-17',
-            config=types.GenerateContentConfig(
-                system_instruction="Sos un asistente de estilo y moda profesional. Analiza las prendas de las imágenes para tus recomendaciones.",
-                max_output_tokens=600
-            ),
-            contents=imagenes_pil + [prompt] # Enviamos las imágenes y luego el prompt
-        )
+def _resolver_prendas(user, contenidos):
+    """
+    Busca cada foto en el guardarropa del usuario: primero por sha256 del archivo original
+    (sin decodificarla) y, si no está, por hash perceptual de la foto reducida.
+    Retorna una lista de prendas {sha, descripcion} o, para las nuevas, {sha, phash, imagen}.
+    """
+    prendas, pendientes = [], []
+    for contenido in contenidos:
+        prenda = {"sha": hash_contenido(contenido)}
+        prenda["descripcion"] = guardarropa.buscar(user.id, prenda["sha"])
+        prendas.append(prenda)
+        if prenda["descripcion"] is None:
+            pendientes.append((prenda, contenido))
+
+    # Reducimos y re-codificamos en paralelo (sin EXIF) solo las fotos que no conocíamos
+    with fase('pil'):
+        reducidas = preprocesar_imagenes([contenido for _, contenido in pendientes])
+    for (prenda, _), imagen in zip(pendientes, reducidas):
+        with fase('pil'):
+            prenda["phash"] = en_hilo_nativo(hash_perceptual, imagen)
+        prenda["descripcion"] = guardarropa.buscar_similar(user.id, prenda["sha"], prenda["phash"])
+        if prenda["descripcion"] is None:
+            prenda["imagen"] = imagen
+    return prendas
+
+def _describir_prendas_nuevas(user, prendas):
+    """
+    Pide a Gemini una descripción corta de cada prenda nueva (una sola llamada para todas)
+    y la guarda en el guardarropa. Si algo falla, esas fotos se envían tal cual en la consulta.
+    """
+    from google.genai import types
+    nuevas = [prenda for prenda in prendas if prenda.get("imagen")]
+    if not nuevas:
+        return
+    try:
+        response = _generar_gemini(prompts_gemini.solicitud(
+            'wardrobe', {'n': len(nuevas)},
+            partes=[types.Part.from_bytes(data=prenda["imagen"], mime_type=MIME_TYPE) for prenda in nuevas],
+            unidades=len(nuevas), response_mime_type='application/json'
+        ))
+        descripciones = json.loads(response.text)
+    except Exception as e:
+        _log("warning", "describir_prendas_fallido", error=str(e))
+        return
+    if not isinstance(descripciones, list) or len(descripciones) != len(nuevas):
+        return
+    for prenda, descripcion in zip(nuevas, descripciones):
+        prenda["descripcion"] = str(descripcion)
+        prenda.pop("imagen")
+        guardarropa.guardar(user.id, prenda["sha"], prenda["phash"], prenda["descripcion"])
+
+def _ejecutar_outfit(user, ciudad, prendas):
+    """
+    Clima + prompt + Gemini para el consejo de vestimenta a partir de las prendas (ver _resolver_prendas).
+    Guarda el consejo en OutfitHistory. Retorna (respuesta, status) como obtener_datos_clima_api.
+    """
+    solicitud, respuesta = _preparar_outfit(user, ciudad, prendas)
+    if respuesta: return respuesta
 
+    try:
+        response = _generar_gemini(solicitud)
         advice_text = response.text
-        # Save the AI advice to the outfit history
-        print(f"[DEBUG] Saving outfit for user_id={current_user_id}, city={ciudad}, advice={advice_text[:60]}...")
-        new_outfit = OutfitHistory(
-            user_id=current_user_id,
-            city=ciudad,
-            advice=advice_text,
-            date=dt.datetime.utcnow()
-        )
-        db.session.add(new_outfit)
-        db.session.commit()
+        _guardar_outfit(user, ciudad, advice_text)
+        return {"consejo": advice_text}, 200
+    except ErrorUpstream as e:
+        return _ia_no_disponible(e)
+    except Exception as e:
+        db.session.rollback()
+        _log("error", "gemini_fallido", error=str(e))
+        return {"error": "No se pudo generar el consejo de IA de vestimenta."}, 500
 
-        # Generate a new token with updated claims
-        additional_claims = {
-            "plan": user.plan,
-            "username": user.username,
-            "prefs_saved": user.preferencias_guardadas,
-            "ai_outfit_uses": user.ai_outfit_uses,
-            "ai_travel_uses": user.ai_travel_uses
-        }
-        new_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
+def _preparar_outfit(user, ciudad, prendas):
+    """
+    Obtiene el clima y arma la solicitud a Gemini (argumentos de generate_content).
+    Retorna (solicitud, None) o (None, (respuesta, status)) si hay que responder sin llamar a la IA.
+    """
+    from google.genai import types
+    datos_clima, status_code = obtener_datos_clima_api(ciudad)
+    if not datos_clima: return None, ({"error": f"No se pudo obtener el clima para la IA. Código: {status_code}"}, status_code)
+    if not geminiAPI: return None, ({"consejo": "La función de IA no está configurada."}, 200)
 
-        return jsonify({"consejo": advice_text, "access_token": new_token})
+    try:
+        _describir_prendas_nuevas(user, prendas)
+        # Las prendas conocidas van como texto; solo las que no se pudieron describir van como imagen
+        lista_prendas = "; ".join(prenda["descripcion"] for prenda in prendas if prenda.get("descripcion"))
+        partes_imagen = [
+            types.Part.from_bytes(data=prenda["imagen"], mime_type=MIME_TYPE)
+            for prenda in prendas if prenda.get("imagen")
+        ]
+        # Las imágenes (si quedan) van antes del prompt
+        return prompts_gemini.solicitud('outfit', {
+            'prendas': lista_prendas or 'las de las imágenes',
+            'imagenes': '; además, las de las imágenes' if partes_imagen and lista_prendas else '',
+            'ciudad': ciudad,
+            'clima': clima_compacto(datos_clima),
+            'preferencias': preferencias_compactas(user),
+        }, partes=partes_imagen), None
     except Exception as e:
-        print(f"Error al contactar la API de Gemini o procesar: {e}")
-        return jsonify({"error": "No se pudo generar el consejo de IA de vestimenta."}), 500
+        _log("error", "preparar_consejo_fallido", error=str(e))
+        return None, ({"error": "No se pudo generar el consejo de IA de vestimenta."}, 500)
+
+def _ia_no_disponible(error):
+    # Circuito de Gemini abierto o sin plazo: 503/504 enseguida (la cuota se devuelve como en cualquier error)
+    _log("warning", "gemini_no_disponible", error=str(error))
+    respuesta = {"error": "El servicio de IA no está disponible en este momento. Probá de nuevo en unos minutos."}
+    if isinstance(error, CircuitoAbierto):
+        respuesta["reintentar_en"] = error.reintentar_en
+    return respuesta, error.status
+
+def _guardar_outfit(user, ciudad, advice_text):
+    # Save the AI advice to the outfit history
+    _log("debug", "guardar_outfit", user_id=user.id, ciudad=ciudad)
+    new_outfit = OutfitHistory(
+        user_id=user.id,
+        city=ciudad,
+        advice=advice_text,
+        date=dt.datetime.utcnow()
+    )
+    db.session.add(new_outfit)
+    db.session.execute(_nueva_version(Users.outfits_version, [user.id]))
+    db.session.commit()
 
-@app.route('/api/v1/ai-advice/<string:ciudad>', methods=['GET'])
+@bp.route('/api/v1/ai-advice/<string:ciudad>', methods=['GET'])
 @jwt_required()
+@_solo_lectura
 def get_ai_advice(ciudad):
     # 1. Obtenemos la identidad del usuario y sus datos de la BD
     current_user_id = get_jwt_identity()
@@ -417,54 +1738,106 @@ def get_ai_advice(ciudad):
     if not user:
         return jsonify({"error": "Usuario no encontrado para generar consejo."}), 404
 
+    # ?motor=local|gemini elige el motor; sin él, el plan gratuito usa AI_ADVICE_FREE_ENGINE y los pagos Gemini
+    motor = request.args.get('motor', '').lower() or (AI_ADVICE_FREE_ENGINE if user.plan == 'free' else 'gemini')
+    if motor not in ('local', 'gemini'):
+        return jsonify({"error": "El parámetro 'motor' debe ser 'local' o 'gemini'."}), 400
+
     # 2. Obtenemos los datos del clima (sin cambios aquí)
     datos_clima, status_code = obtener_datos_clima_api(ciudad)
     if not datos_clima: return jsonify({"error": f"No se pudo obtener el clima para la IA. Código: {status_code}"}), status_code
-    if not geminiAPI: return jsonify({"consejo": "La función de IA no está configurada."})
 
+    # Sin Gemini configurado, el recomendador local responde siempre
+    if motor == 'local' or not geminiAPI:
+        return _responder_consejo_local(user, datos_clima, 'local')
+
+    # Mismas preferencias + clima parecido = mismo consejo. Los planes pagos pueden pedir uno nuevo con ?fresh=1
+    clave = _clave_consejo(user, datos_clima)
+    fresco = user.plan != 'free' and request.args.get('fresh', '').lower() in ('1', 'true')
+    solicitud = _preparar_consejo(user, datos_clima)
+
+    if _modo_streaming():
+        return _responder_sse(user, 'ai-advice', solicitud,
+                              texto_cacheado=None if fresco else consejos_cache.get(clave),
+                              al_terminar=lambda texto: consejos_cache.set(clave, texto),
+                              respaldo=lambda: _consejo_local(user, datos_clima, 'respaldo')['consejo'],
+                              mensaje_error="No se pudo generar el consejo de la IA.")
+
+    if fresco:
+        consejo = _generar_consejo(solicitud)
+        if consejo is not None:
+            consejos_cache.set(clave, consejo)
+    else:
+        # Los pedidos concurrentes con la misma clave comparten una sola llamada a Gemini
+        consejo = consejos_cache.obtener(clave, lambda: _generar_consejo(solicitud),
+                                         cacheable=lambda texto: texto is not None)
+    if consejo is None:
+        # Gemini falló o pasó AI_ADVICE_TIMEOUT_MS: respondemos con el recomendador local (sin cachearlo)
+        return _responder_consejo_local(user, datos_clima, 'respaldo')
+    consejos_por_motor.incrementar('gemini')
+    return jsonify({"consejo": consejo, "motor": "gemini"})
+
+def _generar_consejo(solicitud):
     try:
-        # 3. Construimos el MEGA-PROMPT
-        descripcion = datos_clima['weather'][0]['description']
-        temperatura = datos_clima['main']['temp']
-        sensacion_termica = datos_clima['main']['feels_like']
-        humedad = datos_clima['main']['humidity']
-
-        # Usamos los datos del usuario para enriquecer el prompt
-        prompt = (
-            f"Actúa como un asistente de moda y estilo de vida personal. "
-            f"El usuario tiene las siguientes preferencias: "
-            f"Estilo: '{user.estilo_preferido}', "
-            f"Actividad principal del día: '{user.actividad_principal}', "
-            f"Sensibilidad al frío: '{user.sensibilidad_frio}', "
-            f"Colores preferidos: '{user.colores_preferidos}', "
-            f"Preferencia de clima: '{user.preferencia_clima}', "
-            f"Frecuencia de viajes: '{user.frecuencia_viajes}', "
-            f"Tipo de calzado preferido: '{user.tipo_calzado}', "
-            f"Frecuencia de ejercicio físico: '{user.frecuencia_ejercicio}', "
-            f"Preferencia de tejidos: '{user.preferencia_tejido}', "
-            f"Prenda favorita: '{user.prenda_favorita}'.\n"
-            f"El clima actual es: Condición: {descripcion}, Temperatura: {temperatura}°C, "
-            f"Sensación térmica: {sensacion_termica}°C, Humedad: {humedad}%.\n"
-            f"Basado en TODA esta información (preferencias del usuario Y el clima), "
-            f"genera una recomendación de vestimenta breve, práctica y con estilo en un solo párrafo. "
-            f"Dirígete al usuario de forma amigable y directa. Por ejemplo, si su sensibilidad al frío es alta, sugiérele una capa extra. "
-            f"Si su estilo es elegante, recomienda prendas más formales. Responde únicamente con la recomendación."
-        )
-
         # 4. Generamos y devolvemos la respuesta (sin cambios aquí)
-        response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
-            config = types.GenerateContentConfig(
-                max_output_tokens=600
-            ),
-            contents=prompt           
-        )
-        return jsonify({"consejo": response.text})
+        response = _generar_gemini(solicitud)
+        return response.text
     except Exception as e:
-        print(f"Error al contactar la API de Gemini: {e}")
-        return jsonify({"error": "No se pudo generar el consejo de la IA."}), 500
+        _log("error", "gemini_fallido", error=str(e))
+        return None
+
+def _consejo_local(user, datos_clima, origen):
+    # 'origen' es 'local' (elegido) o 'respaldo' (Gemini falló o su circuito está abierto)
+    consejos_por_motor.incrementar(origen)
+    if origen == 'respaldo':
+        _marcar_degradado('consejo')
+    return recomendar(datos_clima, {
+        'estilo_preferido': user.estilo_preferido, 'actividad_principal': user.actividad_principal,
+        'sensibilidad_frio': user.sensibilidad_frio, 'colores_preferidos': user.colores_preferidos,
+        'tipo_calzado': user.tipo_calzado, 'preferencia_tejido': user.preferencia_tejido,
+        'prenda_favorita': user.prenda_favorita,
+    })
+
+def _responder_consejo_local(user, datos_clima, origen):
+    recomendacion = _consejo_local(user, datos_clima, origen)
+    if _modo_streaming():
+        return _responder_sse(user, 'ai-advice', None, texto_cacheado=recomendacion['consejo'],
+                              mensaje_error="No se pudo generar el consejo.")
+    return jsonify({"consejo": recomendacion['consejo'], "prendas": recomendacion['prendas'], "motor": "local"})
+
+consejos_por_motor = registro.agregar(Contador(
+    'guardianclima_ai_advice_total',
+    'Consejos de vestimenta por motor: gemini, local (elegido) o respaldo (local porque Gemini falló).',
+    ('engine',)
+))
+
+def _clave_consejo(user, datos_clima):
+    """
+    Clave del caché de consejos: huella de las preferencias del usuario más el clima agrupado
+    (temperatura y sensación térmica en tramos de AI_ADVICE_TEMP_BUCKET °C, clase de condición y humedad).
+    """
+    tramo = AI_ADVICE_TEMP_BUCKET
+    humedad = datos_clima['main']['humidity']
+    huella = "|".join(str(valor) for valor in (
+        user.estilo_preferido, user.actividad_principal, user.sensibilidad_frio, user.colores_preferidos,
+        user.preferencia_clima, user.frecuencia_viajes, user.tipo_calzado, user.frecuencia_ejercicio,
+        user.preferencia_tejido, user.prenda_favorita,
+        math.floor(datos_clima['main']['temp'] / tramo),
+        math.floor(datos_clima['main']['feels_like'] / tramo),
+        clase_condicion(datos_clima['weather'][0].get('id', 800)),
+        'seco' if humedad < 40 else 'humedo' if humedad > 75 else 'normal'
+    ))
+    return hashlib.sha256(huella.encode('utf-8')).hexdigest()
+
+def _preparar_consejo(user, datos_clima):
+    """Arma la solicitud a Gemini para el consejo rápido de /api/v1/ai-advice (ya con el clima)."""
+    from google.genai import types
+    return prompts_gemini.solicitud(
+        'advice', {'preferencias': preferencias_compactas(user), 'clima': clima_compacto(datos_clima)},
+        http_options=types.HttpOptions(timeout=AI_ADVICE_TIMEOUT_MS)
+    )
 
-@app.route('/api/user/upgrade', methods=['POST'])
+@bp.route('/api/user/upgrade', methods=['POST'])
 @jwt_required()
 def upgrade_plan():
     current_user_id = get_jwt_identity()
@@ -482,14 +1855,7 @@ def upgrade_plan():
     db.session.commit()
 
     # ¡Paso clave! Creamos y devolvemos un NUEVO token con el plan actualizado.
-    additional_claims = {
-        "plan": user.plan, 
-        "username": user.username,
-        "prefs_saved": user.preferencias_guardadas,
-        "ai_outfit_uses": user.ai_outfit_uses,
-        "ai_travel_uses": user.ai_travel_uses
-        }
-    new_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
+    new_token = _crear_token(user)
     
     # Creamos UN SOLO diccionario con ambas claves: "mensaje" y "access_token".
     return jsonify({
@@ -498,21 +1864,16 @@ def upgrade_plan():
     }), 200
 
 # --- NUEVO ENDPOINT: ASISTENTE DE VIAJE IA ---
-@app.route('/api/v1/ai-travel-assistant', methods=['POST'])
+@bp.route('/api/v1/ai-travel-assistant', methods=['POST'])
 @jwt_required()
 def get_ai_travel_advice():
     current_user_id = get_jwt_identity()
-    user = Users.query.get(current_user_id)
+    # Solo esta lectura va a la réplica: lo que sigue consume cuota y escribe el historial
+    with _leer_de_replica():
+        user = Users.query.get(current_user_id)
     if not user:
         return jsonify({"error": "Usuario no encontrado."}), 404
 
-    # 1. Verificar el plan del usuario
-    if user.plan == 'free':
-        if user.ai_travel_uses >= 1:
-            return jsonify({"error": "Has alcanzado el límite de 1 uso para el asistente de viaje. Actualiza a Pro para usos ilimitados."}), 403
-        user.ai_travel_uses += 1
-        db.session.commit()
-
     data = request.get_json()
     ciudad_destino = data.get('ciudad_destino')
     fecha_inicio_str = data.get('fecha_inicio')
@@ -521,83 +1882,150 @@ def get_ai_travel_advice():
     if not all([ciudad_destino, fecha_inicio_str, fecha_fin_str]):
         return jsonify({"error": "Se requieren ciudad de destino, fecha de inicio y fecha de fin."}), 400
 
-    # 2. Obtener el pronóstico del tiempo (real)
-    datos_clima, status_code = obtener_datos_clima_api(ciudad_destino)
-    if not datos_clima:
-        return jsonify({"error": f"No se pudo obtener el clima para {ciudad_destino}. Código: {status_code}"}), status_code
+    # El streaming no se puede repetir: solo se deduplican las respuestas JSON (sincrónicas o 202 de un job)
+    if _modo_streaming():
+        return _procesar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str)
+    huella = _huella(normalizar_clave(ciudad_destino), fecha_inicio_str, fecha_fin_str, _modo_asincrono())
+    return _idempotente(user, 'ai-travel-assistant', huella,
+                        lambda: _procesar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str))
+
+def _procesar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str):
+    # 1. Verificar el plan del usuario (con la cola llena no se consume el uso)
+    if _modo_asincrono() and not job_queue.hay_lugar():
+        return _cola_llena()
+    consumo, respuesta_limite = _consumir_cuota(user, 'travel')
+    if respuesta_limite:
+        return respuesta_limite
+
+    if _modo_asincrono():
+        return _encolar_job(user, 'travel', {
+            "cuota": consumo,
+            "ciudad_destino": ciudad_destino,
+            "fecha_inicio": fecha_inicio_str,
+            "fecha_fin": fecha_fin_str
+        })
+    if _modo_streaming():
+        solicitud, respuesta = _preparar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str)
+        if respuesta:
+            if respuesta[1] != 200:
+                _devolver_cuota(user.id, consumo)
+            return jsonify(respuesta[0]), respuesta[1]
+        return _responder_sse(user, 'ai-travel-assistant', solicitud,
+                              al_fallar=lambda: _devolver_cuota(user.id, consumo),
+                              mensaje_error="No se pudo generar el consejo de viaje de IA.")
+
+    resultado, status_code = _ejecutar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str)
+    if status_code == 200:
+        resultado["access_token"] = _crear_token(user)
+    else:
+        _devolver_cuota(user.id, consumo)
+    return jsonify(resultado), status_code
+
+def _fechas_del_viaje(fecha_inicio_str, fecha_fin_str):
+    # (inicio, fin) como date, o None si no son fechas ISO (AAAA-MM-DD) o el viaje termina antes de empezar
+    try:
+        inicio, fin = dt.date.fromisoformat(fecha_inicio_str[:10]), dt.date.fromisoformat(fecha_fin_str[:10])
+    except (TypeError, ValueError):
+        return None
+    return (inicio, fin) if inicio <= fin else None
+
+def _ejecutar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str):
+    """Clima + prompt + Gemini para la lista de equipaje. Retorna (respuesta, status)."""
+    solicitud, respuesta = _preparar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str)
+    if respuesta:
+        return respuesta
+
+    try:
+        # 4. Generar y devolver la respuesta de la IA
+        response = _generar_gemini(solicitud)
+        return {"consejo": response.text}, 200
+    except ErrorUpstream as e:
+        return _ia_no_disponible(e)
+    except Exception as e:
+        _log("error", "gemini_fallido", error=str(e))
+        return {"error": "No se pudo generar el consejo de viaje de IA."}, 500
+
+def _preparar_viaje(user, ciudad_destino, fecha_inicio_str, fecha_fin_str):
+    """Igual que _preparar_outfit pero para el asistente de viaje."""
+    # 2. Obtener el pronóstico de los días del viaje; si el viaje cae fuera de los 5 días del pronóstico
+    # (o las fechas no se entienden), el clima actual como hasta ahora
+    fechas, dias = _fechas_del_viaje(fecha_inicio_str, fecha_fin_str), None
+    if fechas:
+        resumen, _ = obtener_pronostico(ciudad_destino)
+        dias = dias_del_viaje(resumen or [], *fechas)
+    if not dias:
+        datos_clima, status_code = obtener_datos_clima_api(ciudad_destino)
+        if not datos_clima:
+            return None, ({"error": f"No se pudo obtener el clima para {ciudad_destino}. Código: {status_code}"}, status_code)
 
     if not geminiAPI:
-        return jsonify({"consejo": "La función de IA no está configurada."})
+        return None, ({"consejo": "La función de IA no está configurada."}, 200)
 
     try:
-        descripcion = datos_clima['weather'][0]['description']
-        temperatura = datos_clima['main']['temp']
-        sensacion_termica = datos_clima['main']['feels_like']
-        humedad = datos_clima['main']['humidity']
+        if dias:
+            clima_del_viaje = f"Pronóstico por día:\n{texto_para_prompt(dias)}"
+            if dias[-1]['fecha'] < fechas[1].isoformat():
+                clima_del_viaje += f"\nSin pronóstico después del {dias[-1]['fecha']}."
+        else:
+            clima_del_viaje = f"Clima actual: {clima_compacto(datos_clima)}"
 
         # 3. Construir el prompt para la IA
-        prompt = (
-            f"Actúa como un asistente de viaje experto y conciso. Tu tarea es crear una lista de equipaje inteligente y detallada.\n\n"
-            f"Destino: {ciudad_destino}\n"
-            f"Fechas del viaje: del {fecha_inicio_str} al {fecha_fin_str}\n\n"
-            f"Preferencias del usuario:\n"
-            f"- Estilo preferido: {user.estilo_preferido}\n"
-            f"- Actividad principal planeada: {user.actividad_principal}\n"
-            f"- Sensibilidad al frío: {user.sensibilidad_frio}\n"
-            f"- Colores preferidos: {user.colores_preferidos}\n"
-            f"- Preferencia de clima: {user.preferencia_clima}\n"
-            f"- Frecuencia de viajes: {user.frecuencia_viajes}\n"
-            f"- Tipo de calzado preferido: {user.tipo_calzado}\n"
-            f"- Frecuencia de ejercicio físico: {user.frecuencia_ejercicio}\n"
-            f"- Preferencia de tejidos: {user.preferencia_tejido}\n"
-            f"- Prenda favorita: {user.prenda_favorita}.\n"
-            f"Clima actual en {ciudad_destino}:\n"
-            f"Temperatura: {temperatura}°C\n"
-            f"Sensación térmica: {sensacion_termica}°C\n"
-            f"Humedad: {humedad}%\n"
-            f"Descripción del clima: {descripcion}\n\n"
-            f"Basándote en toda esta información, genera una lista de equipaje organizada por categorías (ej. Ropa, Calzado, Accesorios, Artículos de Aseo, Documentos). \n"
-            f"Para cada prenda o artículo, sé específico (ej. '2 camisetas de algodón de manga corta', '1 par de zapatillas cómodas para caminar', '1 chaqueta impermeable ligera').\n"
-            f"Añade una sección final con 2 o 3 consejos prácticos para el viaje basados en el clima y el destino.\n\n"
-            f"El resultado debe ser una lista fácil de leer y accionable para el usuario.\n"
-            f"Aclaracion: La cantidad de prendas para el viaje debe depender de la fecha de inicio y final del viaje especificadas anteriormente"
-            f"NO USES LETRAS NEGRITAS EN LAS RESPUESTAS, NO USES ASTERISCOS, NO USES HTML TAGS.\n"
-        )
+        return prompts_gemini.solicitud('travel', {
+            'ciudad': ciudad_destino, 'inicio': fecha_inicio_str, 'fin': fecha_fin_str,
+            'preferencias': preferencias_compactas(user), 'clima': clima_del_viaje,
+        }), None
+    except Exception as e:
+        _log("error", "preparar_viaje_fallido", error=str(e))
+        return None, ({"error": "No se pudo generar el consejo de viaje de IA."}, 500)
 
-        # 4. Generar y devolver la respuesta de la IA
-        response = gemini_client.models.generate_content(
-            model='gemini-2.5-flash-lite-preview-06-17',
-            config=types.GenerateContentConfig(
-                system_instruction="Eres un asistente de viajes y experto en planificación de equipaje.",
-                max_output_tokens=1000
-            ),
-            contents=[prompt]
+@bp.route('/api/v1/jobs/<string:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    current_user_id = get_jwt_identity()
+    job = Jobs.query.get(job_id)
+    if not job or str(job.user_id) != str(current_user_id):
+        return jsonify({"error": "Trabajo no encontrado."}), 404
+
+    respuesta = job.to_dict()
+    respuesta["status_code"] = job.status_code
+    if job.estado == 'done':
+        # El token se genera al consultar para que refleje los usos actuales del plan
+        respuesta["access_token"] = _crear_token(Users.query.get(current_user_id))
+    return jsonify(respuesta)
+
+@bp.route('/api/v1/outfits', methods=['GET'])
+@jwt_required()
+@_solo_lectura
+def get_outfits():
+    user_id = get_jwt_identity()
+    try:
+        limite, cursor = _leer_paginacion()
+    except ValueError:
+        return jsonify({"error": "Cursor no válido."}), 400
+
+    def construir():
+        # El listado no incluye el texto completo del consejo: se pide con GET /api/v1/outfits/<id>
+        query = db.session.query(OutfitHistory.id, OutfitHistory.city, OutfitHistory.date).filter(
+            OutfitHistory.user_id == user_id
         )
+        outfits, siguiente = _paginar(query, OutfitHistory.date, OutfitHistory.id, limite, cursor)
+        _log("debug", "listar_outfits", user_id=user_id, cantidad=len(outfits))
+        return [{'id': o.id, 'city': o.city, 'date': o.date.isoformat()} for o in outfits], siguiente
 
-        # Generate a new token with updated claims
-        additional_claims = {
-            "plan": user.plan,
-            "username": user.username,
-            "prefs_saved": user.preferencias_guardadas,
-            "ai_outfit_uses": user.ai_outfit_uses,
-            "ai_travel_uses": user.ai_travel_uses
-        }
-        new_token = create_access_token(identity=str(user.id), additional_claims=additional_claims)
+    variante = (get_jwt().get("plan", "free"), limite, request.args.get('cursor'))
+    return _listado_condicional('outfits', Users.outfits_version, user_id, variante, construir)
 
-        return jsonify({"consejo": response.text, "access_token": new_token})
-    except Exception as e:
-        print(f"Error al contactar la API de Gemini o procesar: {e}")
-        return jsonify({"error": "No se pudo generar el consejo de viaje de IA."}), 500
-
-@app.route('/api/v1/outfits', methods=['GET'])
+@bp.route('/api/v1/outfits/<int:outfit_id>', methods=['GET'])
 @jwt_required()
-def get_outfits():
+@_solo_lectura
+def get_outfit(outfit_id):
     user_id = get_jwt_identity()
-    outfits = OutfitHistory.query.filter_by(user_id=user_id).order_by(OutfitHistory.date.desc()).all()
-    print(f"[DEBUG] Fetching outfits for user_id={user_id}, found {len(outfits)} outfits.")
-    return jsonify([o.to_dict() for o in outfits])
+    outfit = OutfitHistory.query.filter_by(id=outfit_id, user_id=user_id).first()
+    if not outfit:
+        return jsonify({"error": "Outfit no encontrado."}), 404
+    return jsonify(outfit.to_dict())
 
-@app.route('/api/v1/outfits', methods=['POST'])
+@bp.route('/api/v1/outfits', methods=['POST'])
 @jwt_required()
 def save_outfit():
     user_id = get_jwt_identity()
@@ -609,35 +2037,105 @@ def save_outfit():
         date=dt.datetime.fromisoformat(data['date']) if 'date' in data else dt.datetime.utcnow()
     )
     db.session.add(new_outfit)
+    db.session.execute(_nueva_version(Users.outfits_version, [user_id]))
     db.session.commit()
     return jsonify({'success': True, 'id': new_outfit.id})
 
-@app.route('/api/paypal/create-order', methods=['POST'])
+@bp.route('/api/internal/stats', methods=['GET'])
+@_solo_interno
+def internal_stats():
+    return jsonify({
+        "weather_cache": weather_cache.stats(),
+        "forecast_cache": pronostico_cache.stats(),
+        "ai_advice_cache": dict(consejos_cache.stats(), populares=consejos_cache.populares()),
+        "idempotencia": {"con_clave": idempotencia_cache.stats(), "duplicados": duplicados_cache.stats()},
+        "listados": listados_cache.stats(),
+        "ai_jobs": job_queue.stats(),
+        "contrasenas": contrasenas.stats(),
+        "gemini": prompts_gemini.stats(),
+        "historial_consultas": consultas_diferidas.stats(),
+        "streaming": latencias_streaming.resumen(),
+        "guardarropa": guardarropa.stats(),
+        "upstreams": http.stats(),
+        "disyuntores": disyuntores.stats(),
+        "base_de_datos": dict(stats_pool(db.engines), lecturas_pegadas_a_primaria=escrituras_recientes.stats())
+    })
+
+# Contadores que ya llevan las cachés, la cola de trabajos y el guardarropa, leídos al exportar
+registro.agregar(Medidor(
+    'guardianclima_cache_events_total', 'Eventos de las cachés (hits, misses, cargas, expulsiones...).',
+    ('cache', 'event'),
+    lambda: {
+        (nombre, evento): valor
+        for nombre, cache in (('weather', weather_cache), ('forecast', pronostico_cache), ('ai_advice', consejos_cache),
+                              ('idempotency', idempotencia_cache), ('duplicates', duplicados_cache),
+                              ('lists', listados_cache))
+        for evento, valor in cache.stats().items() if isinstance(valor, int) and evento != 'entradas'
+    },
+    tipo='counter'
+))
+registro.agregar(Medidor(
+    'guardianclima_ai_jobs', 'Trabajos de IA en cola y en curso.', ('state',),
+    lambda: (lambda datos: {('pending',): datos['profundidad'], ('running',): datos['en_curso']})(job_queue.stats())
+))
+registro.agregar(Medidor(
+    'guardianclima_password_hash_queue', 'Hashes de contraseña esperando y en curso en el pool de bcrypt.', ('state',),
+    lambda: (lambda datos: {('pending',): datos['pendientes'], ('running',): datos['en_curso']})(contrasenas.stats())
+))
+registro.agregar(Medidor(
+    'guardianclima_password_hash_total', 'Operaciones de bcrypt (hashes, verificaciones, rehashes, rechazados).',
+    ('operation',),
+    lambda: {(clave,): valor for clave, valor in contrasenas.stats().items()
+             if clave in ('hashes', 'verificaciones', 'rehashes', 'rechazados')},
+    tipo='counter'
+))
+registro.agregar(Medidor(
+    'guardianclima_query_log_rows_total', 'Filas del historial de consultas por destino (escritura diferida).',
+    ('result',),
+    lambda: {(clave,): valor for clave, valor in consultas_diferidas.stats().items()
+             if clave in ('encoladas', 'sincronicas', 'escritas', 'fallidas')},
+    tipo='counter'
+))
+registro.agregar(Medidor(
+    'guardianclima_query_log_pending', 'Consultas de clima esperando a ser escritas.', (),
+    lambda: {(): consultas_diferidas.stats()['profundidad']}
+))
+registro.agregar(Medidor(
+    'guardianclima_circuit_state', 'Estado del circuit breaker por upstream: 0 cerrado, 1 semiabierto, 2 abierto.',
+    ('upstream',),
+    lambda: {(nombre,): VALOR_ESTADO[datos['estado']] for nombre, datos in disyuntores.stats().items()}
+))
+registro.agregar(Medidor(
+    'guardianclima_circuit_calls_total', 'Llamadas por upstream según el disyuntor (exitos, fallos, lentas, rechazadas).',
+    ('upstream', 'result'),
+    lambda: {
+        (nombre, resultado): datos[resultado]
+        for nombre, datos in disyuntores.stats().items() for resultado in ('exitos', 'fallos', 'lentas', 'rechazadas')
+    },
+    tipo='counter'
+))
+registro.agregar(Medidor(
+    'guardianclima_circuit_opens_total', 'Veces que se abrió el circuito de cada upstream.', ('upstream',),
+    lambda: {(nombre,): datos['aperturas'] for nombre, datos in disyuntores.stats().items()},
+    tipo='counter'
+))
+registro.agregar(Medidor(
+    'guardianclima_wardrobe_events_total', 'Aciertos, fallos y expulsiones del guardarropa.', ('event',),
+    lambda: {(evento,): valor for evento, valor in guardarropa.stats().items()},
+    tipo='counter'
+))
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registro.exportar(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/paypal/create-order', methods=['POST'])
 @jwt_required()
 def create_paypal_order():
     import requests
-    client_id = os.getenv("PAYPAL_CLIENT_ID")
-    client_secret = os.getenv("PAYPAL_CLIENT_SECRET")
-
-    # Get an access token from PayPal
-    auth_response = requests.post(
-        "https://api-m.sandbox.paypal.com/v1/oauth2/token",
-        headers={"Accept": "application/json", "Accept-Language": "en_US"},
-        data={"grant_type": "client_credentials"},
-        auth=(client_id, client_secret)
-    )
-    if not auth_response.ok:
-        return jsonify({"error": "Failed to authenticate with PayPal.", "details": auth_response.text}), 500
-    access_token = auth_response.json()['access_token']
-
-    # Create an order
-    order_response = requests.post(
-        "https://api-m.sandbox.paypal.com/v2/checkout/orders",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}"
-        },
-        json={
+    # El token OAuth se reutiliza entre órdenes hasta poco antes de vencer (ver paypal_client.py)
+    try:
+        order = paypal_api.crear_orden({
             "intent": "CAPTURE",
             "purchase_units": [{
                 "amount": {
@@ -649,13 +2147,20 @@ def create_paypal_order():
                 "return_url": "https://your-production-domain.com/payment/execute",
                 "cancel_url": "https://your-production-domain.com/"
             }
-        }
-    )
-    if not order_response.ok:
-        return jsonify({"error": "Failed to create PayPal order.", "details": order_response.text}), 500
-    order = order_response.json()
+        })
+    except PayPalError as e:
+        return jsonify({"error": e.mensaje, "details": e.detalles}), 500
+    except ErrorUpstream as e:
+        return jsonify({"error": "PayPal is unavailable right now.", "details": str(e)}), e.status
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": "PayPal is unreachable.", "details": str(e)}), 502
     return jsonify({"orderID": order["id"]})
 
 # --- 8. Ejecución de la Aplicación ---
+# `app` se mantiene para `gunicorn app:app`, `flask --app app` y los imports existentes
+app = create_app()
+
 if __name__ == '__main__':
+    with app.app_context():
+        aplicar_migraciones(db)
     app.run(port=5000, debug=True)
@@ -0,0 +1,136 @@
+# basedatos.py - Pool de conexiones configurable y medido, y ruteo de lecturas a una réplica
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from metrics import Histograma, VentanaLatencias, registrar_fase, registro
+
+# Bind de Flask-SQLAlchemy (SQLALCHEMY_BINDS) con la réplica de solo lectura
+BIND_REPLICA = 'replica'
+
+espera_pool = registro.agregar(Histograma(
+    'guardianclima_db_pool_wait_seconds', 'Espera para obtener una conexión del pool, por base (primaria o réplica).',
+    ('bind',)
+))
+latencias_pool = VentanaLatencias()
+_contadores = {}
+_contadores_lock = threading.Lock()
+_clases_pool = {}
+
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que mide cuánto espera cada checkout (incluida la apertura de una conexión nueva): con el
+    pool agotado las requests hacen cola acá, hasta pool_timeout, y esa espera no se ve en el tiempo de las consultas.
+    """
+    nombre = 'primaria'
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        resultado = 'timeouts'
+        try:
+            conexion = super()._do_get()
+            resultado = 'checkouts'
+            return conexion
+        finally:
+            espera = time.perf_counter() - inicio
+            espera_pool.observar(espera, self.nombre)
+            latencias_pool.registrar(self.nombre, espera)
+            registrar_fase('db_pool', espera)
+            with _contadores_lock:
+                contadores = _contadores.setdefault(self.nombre, {'checkouts': 0, 'timeouts': 0})
+                contadores[resultado] += 1
+
+
+def _clase_pool(nombre):
+    # Una subclase por base: el pool se recrea (ej. engine.dispose()) con la misma clase y conserva el nombre
+    if nombre not in _clases_pool:
+        _clases_pool[nombre] = type(f'PoolMedido_{nombre}', (PoolMedido,), {'nombre': nombre})
+    return _clases_pool[nombre]
+
+
+def opciones_engine(url, nombre, tamano=5, desborde=10, timeout=30, reciclar=1800, pre_ping=True):
+    """
+    Opciones de create_engine para 'url': pool medido con su tamaño, desborde, timeout de checkout,
+    reciclado de conexiones (segundos) y pre-ping. SQLite en memoria usa su propio pool y no lleva ninguna.
+    """
+    if not url:
+        return {}
+    partes = make_url(url)
+    if partes.get_backend_name() == 'sqlite' and partes.database in (None, '', ':memory:'):
+        return {}
+    return {
+        'poolclass': _clase_pool(nombre),
+        'pool_size': tamano,
+        'max_overflow': desborde,
+        'pool_timeout': timeout,
+        'pool_recycle': reciclar,
+        'pool_pre_ping': pre_ping,
+    }
+
+
+class SesionEnrutada(Session):
+    """
+    Sesión de Flask-SQLAlchemy que manda las lecturas a la réplica mientras la request está dentro de
+    leer_de_replica(). Los flush y las sentencias INSERT/UPDATE/DELETE van siempre a la primaria,
+    igual que todo cuando no hay réplica configurada.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False) \
+                and has_request_context() and g.get('leer_de_replica'):
+            replica = self._db.engines.get(BIND_REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def leer_de_replica(activar=True):
+    """Dentro del bloque, las lecturas de la sesión van a la réplica (si 'activar' y hay réplica)."""
+    anterior = g.get('leer_de_replica', False)
+    g.leer_de_replica = activar
+    try:
+        yield
+    finally:
+        g.leer_de_replica = anterior
+
+
+def detectar_escrituras(objetivo, al_escribir):
+    """
+    Llama a al_escribir() con la primera sentencia INSERT/UPDATE/DELETE de cada request (objetivo: un
+    Engine o la clase Engine). Sirve para leer de la primaria después de una escritura propia.
+    """
+
+    @event.listens_for(objetivo, 'before_cursor_execute')
+    def _escritura(conexion, cursor, sentencia, parametros, contexto, executemany):
+        if not has_request_context() or g.get('escritura_registrada'):
+            return
+        if sentencia.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            g.escritura_registrada = True
+            al_escribir()
+
+
+def stats_pool(engines):
+    """Estado de cada pool (conexiones en uso, libres, desborde) y la espera de los checkouts."""
+    with _contadores_lock:
+        contadores = {nombre: dict(valores) for nombre, valores in _contadores.items()}
+    latencias = latencias_pool.resumen()
+    datos = {}
+    for engine in engines.values():
+        pool = engine.pool
+        if not isinstance(pool, PoolMedido):
+            continue
+        datos[pool.nombre] = dict(
+            contadores.get(pool.nombre, {'checkouts': 0, 'timeouts': 0}),
+            tamano=pool.size(), en_uso=pool.checkedout(), libres=pool.checkedin(), desborde=pool.overflow(),
+            espera=latencias.get(pool.nombre)
+        )
+    return datos
+
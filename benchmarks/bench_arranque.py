@@ -0,0 +1,87 @@
+# bench_arranque.py - Arranque en frío: tiempo de import, primera request y memoria de un proceso nuevo
+#
+# Uso: python benchmarks/bench_arranque.py [--repeticiones 5] [--comparar-con <commit>]
+#
+# Cada medición es un intérprete nuevo que importa `app`, responde una primera request (login con un
+# email inexistente: toca JWT, SQLAlchemy y la base) y reporta su pico de RSS. Así se ve lo que paga
+# cada worker de gunicorn al arrancar, cada corrida de `flask` y cada test que importa la app.
+# Con --comparar-con mide además el árbol de ese commit (extraído con git archive) sobre la misma base
+# ya migrada, para comparar antes/después. El primer uso de Gemini se mide aparte (se paga una vez).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDIR = r"""
+import json, resource, sys, time
+inicio = time.perf_counter()
+import app as aplicacion
+importado = time.perf_counter()
+respuesta = aplicacion.app.test_client().post(
+    "/api/login", json={"email": "nadie@example.com", "password": "x"})
+primera = time.perf_counter()
+resultado = {
+    "import_ms": (importado - inicio) * 1000,
+    "primera_request_ms": (primera - importado) * 1000,
+    "status": respuesta.status_code,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}
+if hasattr(aplicacion, "_gemini"):
+    t = time.perf_counter()
+    aplicacion._gemini()
+    resultado["gemini_primer_uso_ms"] = (time.perf_counter() - t) * 1000
+print(json.dumps(resultado))
+"""
+
+
+def _medir(arbol, entorno, repeticiones):
+    corridas = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", MEDIR], cwd=arbol, env=entorno,
+                                capture_output=True, text=True, check=True)
+        corridas.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    resumen = {"status": corridas[0]["status"]}
+    for campo in ("import_ms", "primera_request_ms", "rss_mb", "gemini_primer_uso_ms"):
+        if campo in corridas[0]:
+            resumen[campo] = round(statistics.median(c[campo] for c in corridas), 1)
+    resumen["arranque_ms"] = round(resumen["import_ms"] + resumen["primera_request_ms"], 1)
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--comparar-con", help="Commit o rama a medir como 'antes' (ej. HEAD~1)")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-arranque-")
+    entorno = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(directorio, 'bench.db')}",
+        JWT_SECRET_KEY="bench-" + "x" * 32,
+        GEMINI_API_KEY="bench", LOG_REQUESTS="false",
+    )
+    # La base se migra una sola vez antes de medir, como en un deploy
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "db-upgrade"],
+                   cwd=RAIZ, env=entorno, capture_output=True, check=True)
+
+    arboles = [("actual", RAIZ)]
+    if args.comparar_con:
+        anterior = os.path.join(directorio, "anterior")
+        os.makedirs(anterior)
+        archivo = subprocess.run(["git", "archive", args.comparar_con], cwd=RAIZ,
+                                 capture_output=True, check=True).stdout
+        subprocess.run(["tar", "-x", "-C", anterior], input=archivo, check=True)
+        arboles.insert(0, (args.comparar_con, anterior))
+
+    resultados = {nombre: _medir(arbol, entorno, args.repeticiones) for nombre, arbol in arboles}
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
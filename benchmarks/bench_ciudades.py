@@ -0,0 +1,77 @@
+# bench_ciudades.py - Índice de ciudades a escala: carga, memoria y latencia de resolver/autocompletar
+#
+# Uso: python benchmarks/bench_ciudades.py [--ciudades 200000] [--consultas 20000]
+#
+# Arma un índice con nombres sintéticos del tamaño de la lista completa de OpenWeatherMap (~200k ciudades)
+# más las de datos/ciudades.tsv, y mide cuánto tarda en construirse, cuánta memoria ocupa (tracemalloc)
+# y la latencia p50/p99 de resolver un nombre y de autocompletar prefijos de 1 a 4 letras.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from ciudades import CITY_INDEX_FILE, IndiceCiudades, leer_tsv  # noqa: E402
+from metrics import percentil  # noqa: E402
+
+
+def _nombre(azar):
+    silabas = ["ba", "ca", "da", "la", "ma", "na", "ra", "sa", "ta", "vi", "lo", "mé", "tó", "san ", "villa "]
+    return "".join(azar.choice(silabas) for _ in range(azar.randint(2, 5))).strip().title()
+
+
+def _medir(funcion, argumentos):
+    duraciones = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcion(argumento)
+        duraciones.append((time.perf_counter() - inicio) * 1e6)
+    return {"p50_us": round(percentil(duraciones, 50), 1), "p99_us": round(percentil(duraciones, 99), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ciudades", type=int, default=200000)
+    parser.add_argument("--consultas", type=int, default=20000)
+    args = parser.parse_args()
+
+    azar = random.Random(7)
+    with open(CITY_INDEX_FILE, encoding="utf-8") as archivo:
+        filas = leer_tsv(archivo)
+    filas += [
+        {"id": 10 ** 7 + i, "nombre": _nombre(azar), "pais": azar.choice(["AR", "ES", "MX", "US", "FR"]),
+         "lat": azar.uniform(-90, 90), "lon": azar.uniform(-180, 180), "poblacion": 0, "alias": []}
+        for i in range(args.ciudades)
+    ]
+
+    inicio = time.perf_counter()
+    IndiceCiudades(filas)
+    construccion = time.perf_counter() - inicio
+    # Segunda construcción con tracemalloc (que la hace más lenta) solo para medir la memoria que queda
+    tracemalloc.start()
+    indice = IndiceCiudades(filas)
+    del filas
+    memoria = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    nombres = [indice.nombres[azar.randrange(len(indice))] for _ in range(args.consultas)]
+    resultados = {
+        "ciudades": len(indice),
+        "construccion_s": round(construccion, 2),
+        "memoria_indice_mb": round(memoria / 2 ** 20, 1),
+        "resolver": _medir(indice.resolver, nombres),
+        "resolver_inexistente": _medir(indice.resolver, ["zzz" + n for n in nombres[:2000]]),
+    }
+    for largo in (1, 2, 3, 4):
+        prefijos = [azar.choice(nombres)[:largo] for _ in range(2000)]
+        resultados[f"autocompletar_{largo}_letras"] = _medir(indice.autocompletar, prefijos)
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
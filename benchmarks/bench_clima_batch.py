@@ -0,0 +1,84 @@
+# bench_clima_batch.py - Clima de N ciudades: N requests a /api/v1/weather vs un POST /api/v1/weather/batch
+#
+# Uso: python benchmarks/bench_clima_batch.py [--ciudades 20] [--owm-latencia 0.2] [--repeticiones 3]
+#
+# La app corre en proceso contra el stub de OpenWeatherMap (benchmarks/stubs.py) con una latencia fija.
+# Cada repetición usa ciudades nuevas para que nada salga de la caché. Compara el tiempo total del
+# tablero de hoy (una request por ciudad, en serie) con el batch por nombres y el batch por ids (/group),
+# y cuenta las llamadas que recibió el stub. Los nombres son inventados (CITY_INDEX_STRICT=false), así
+# se piden uno por uno con q=; los nombres del índice de ciudades irían por /group como los ids.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import iniciar_stubs  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ciudades", type=int, default=20)
+    parser.add_argument("--owm-latencia", type=float, default=0.2)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    _, config, url_stubs = iniciar_stubs(owm_latencia=args.owm_latencia)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false",
+        # Nombres inventados (fuera del índice) para medir también el camino de una llamada por nombre
+        CITY_INDEX_STRICT="false",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(username="bench", email="bench@example.com", password="x")
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+    cliente = aplicacion.app.test_client()
+
+    def una_por_ciudad(ciudades):
+        for ciudad in ciudades:
+            assert cliente.get(f"/api/v1/weather/{ciudad}", headers=cabeceras).status_code == 200
+
+    def batch(ciudades):
+        respuesta = cliente.post("/api/v1/weather/batch", headers=cabeceras, json={"ciudades": ciudades})
+        assert all("datos" in r for r in respuesta.get_json()["resultados"])
+
+    resultados = {}
+    for nombre, pedir, por_id in (("una_por_ciudad", una_por_ciudad, False), ("batch_nombres", batch, False),
+                                  ("batch_ids", batch, True)):
+        tiempos, llamadas_antes = [], dict(config.contadores)
+        for _ in range(args.repeticiones):
+            base = uuid.uuid4().int % 10 ** 6 * 100
+            ciudades = [base + i for i in range(args.ciudades)] if por_id else \
+                [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(args.ciudades)]
+            inicio = time.perf_counter()
+            pedir(ciudades)
+            tiempos.append(time.perf_counter() - inicio)
+        resultados[nombre] = {
+            "ms": round(1000 * min(tiempos)),
+            "llamadas_owm_por_repeticion": {
+                api: (config.contadores[api] - llamadas_antes.get(api, 0)) / args.repeticiones
+                for api in config.contadores if config.contadores[api] != llamadas_antes.get(api, 0)
+            },
+        }
+    aplicacion.consultas_diferidas.vaciar()
+    print(f"{args.ciudades} ciudades, OpenWeatherMap con {int(args.owm_latencia * 1000)} ms de latencia")
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# bench_concurrencia.py - Requests en curso vs hilos: worker gthread contra worker gevent
+#
+# Uso: python benchmarks/bench_concurrencia.py [--niveles 50 200 1000] [--owm-latencia 1.0] [--hilos-gthread 32]
+#
+# Levanta gunicorn (1 worker) con cada worker_class contra el stub de OpenWeatherMap con una latencia alta
+# y dispara N requests simultáneas a /api/v1/weather/<ciudad>, cada una a una ciudad distinta (sin aciertos
+# de caché). Reporta req/s, latencias y el pico de hilos y RSS del worker: con gthread las llamadas en curso
+# quedan topeadas por los hilos; con gevent escalan con el nivel sin que crezcan los hilos.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from metrics import percentil  # noqa: E402
+from stubs import iniciar_stubs  # noqa: E402
+
+CLAVE = "Carga9Segura"
+
+
+def _leer_proc(pid, campo):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _hijos(pid):
+    hijos = []
+    for entrada in os.listdir("/proc"):
+        if entrada.isdigit():
+            try:
+                with open(f"/proc/{entrada}/stat") as f:
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                        hijos.append(int(entrada))
+            except (OSError, ValueError, IndexError):
+                continue
+    return hijos
+
+
+class MonitorWorker:
+    """Pico de hilos y de RSS de los workers de gunicorn (hijos del master) mientras corre el nivel."""
+
+    def __init__(self, pid_master):
+        self.pid_master = pid_master
+        self.hilos = 0
+        self.rss_kb = 0
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.is_set():
+            for pid in _hijos(self.pid_master):
+                self.hilos = max(self.hilos, _leer_proc(pid, "Threads") or 0)
+                self.rss_kb = max(self.rss_kb, _leer_proc(pid, "VmRSS") or 0)
+            self._detener.wait(0.1)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._hilo.join()
+
+
+def _nivel(base, token, concurrencia):
+    latencias, errores, lock = [], [0], threading.Lock()
+    barrera = threading.Barrier(concurrencia)
+
+    def cliente():
+        barrera.wait()
+        inicio = time.perf_counter()
+        try:
+            ok = requests.get(f"{base}/api/v1/weather/bench-{uuid.uuid4().hex[:10]}",
+                              headers={"Authorization": f"Bearer {token}"}, timeout=300).ok
+        except requests.RequestException:
+            ok = False
+        with lock:
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            errores[0] += not ok
+
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return time.perf_counter() - inicio, latencias, errores[0]
+
+
+def _medir_modo(modo, args, url_stubs, directorio):
+    puerto = args.puerto
+    entorno = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(directorio, f'{modo}.db')}",
+        JWT_SECRET_KEY="bench-" + "x" * 32,
+        WEATHER_API_KEY="stub", WEATHER_API_BASE=url_stubs,
+        AI_JOB_RECOVER_ON_START="false", LOG_REQUESTS="false",
+        CITY_INDEX_STRICT="false",  # Las ciudades del benchmark son inventadas (una por request)
+        GUNICORN_WORKER_CLASS=modo, GUNICORN_BIND=f"127.0.0.1:{puerto}", WEB_CONCURRENCY="1",
+        GUNICORN_THREADS=str(args.hilos_gthread), GUNICORN_WORKER_CONNECTIONS=str(max(args.niveles) * 2),
+        GUNICORN_TIMEOUT="300",
+    )
+    base = f"http://127.0.0.1:{puerto}"
+    with open(os.path.join(directorio, f"{modo}.log"), "w") as log:
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "db-upgrade"],
+                       cwd=RAIZ, env=entorno, stdout=log, stderr=subprocess.STDOUT, check=True)
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+            cwd=RAIZ, env=entorno, stdout=log, stderr=subprocess.STDOUT
+        )
+        try:
+            limite = time.time() + 60
+            while True:
+                try:
+                    if requests.get(f"{base}/metrics", timeout=1).ok:
+                        break
+                except requests.RequestException:
+                    pass
+                if time.time() > limite or proceso.poll() is not None:
+                    raise RuntimeError(f"gunicorn ({modo}) no arrancó; ver {directorio}/{modo}.log")
+                time.sleep(0.2)
+
+            requests.post(f"{base}/api/register",
+                          json={"username": "bench", "email": "bench@bench.local", "password": CLAVE})
+            token = requests.post(f"{base}/api/login",
+                                  json={"email": "bench@bench.local", "password": CLAVE}).json()["access_token"]
+            filas = []
+            for concurrencia in args.niveles:
+                with MonitorWorker(proceso.pid) as monitor:
+                    duracion, latencias, errores = _nivel(base, token, concurrencia)
+                filas.append({
+                    "modo": modo, "concurrencia": concurrencia, "errores": errores,
+                    "rps": round(len(latencias) / duracion, 1),
+                    "p50_ms": round(percentil(latencias, 50)), "p95_ms": round(percentil(latencias, 95)),
+                    "hilos_pico": monitor.hilos, "rss_pico_mb": round(monitor.rss_kb / 1024, 1),
+                })
+                print(f"  {modo:<8}{concurrencia:>7}{errores:>6}{filas[-1]['rps']:>9}{filas[-1]['p50_ms']:>9}"
+                      f"{filas[-1]['p95_ms']:>9}{monitor.hilos:>8}{filas[-1]['rss_pico_mb']:>9}", flush=True)
+            return filas
+        finally:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--niveles", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--owm-latencia", type=float, default=1.0)
+    parser.add_argument("--hilos-gthread", type=int, default=32)
+    parser.add_argument("--modos", nargs="+", default=["gthread", "gevent"])
+    parser.add_argument("--puerto", type=int, default=5056)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench-concurrencia-")
+    _, _, url_stubs = iniciar_stubs(owm_latencia=args.owm_latencia)
+    print(f"OpenWeatherMap stub con {args.owm_latencia}s de latencia; gthread con {args.hilos_gthread} hilos")
+    print(f"  {'modo':<8}{'conc':>7}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'hilos':>8}{'RSS MB':>9}")
+    for modo in args.modos:
+        _medir_modo(modo, args, url_stubs, directorio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# bench_consultas.py - Costo de guardar el historial de clima en la request: commit por consulta vs escritura diferida
+#
+# Uso: python benchmarks/bench_consultas.py [--hilos 16] [--consultas 500]
+#
+# Por defecto usa un SQLite temporal; con DATABASE_URL apuntando a un Postgres local se prueba ahí.
+# Cada hilo simula requests de /api/v1/weather que guardan su consulta. "antes" hace lo que hacía
+# get_weather (add + commit en la request); "diferida" usa consultas_diferidas.registrar.
+# Reporta la latencia que paga la request (p50/p95) y el tiempo hasta que todas las filas están en la base.
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--consultas", type=int, default=500, help="consultas por hilo")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}?timeout=30"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+    os.environ["AI_JOB_RECOVER_ON_START"] = "false"
+
+    import app as aplicacion
+    from metrics import percentil
+
+    db, Queries, Users = aplicacion.db, aplicacion.Queries, aplicacion.Users
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(db)
+        usuario = Users(username="bench", email="bench@example.com", password="x")
+        db.session.add(usuario)
+        db.session.commit()
+        user_id = usuario.id
+
+    def fila():
+        return {"user_id": user_id, "ciudad": "Buenos Aires", "temperatura": 20.0,
+                "descripcion": "cielo claro", "timestamp": dt.datetime.utcnow()}
+
+    def antes():
+        db.session.add(Queries(**fila()))
+        db.session.commit()
+
+    def diferida():
+        aplicacion.consultas_diferidas.registrar(fila())
+
+    resultados = {}
+    for nombre, guardar in (("antes", antes), ("diferida", diferida)):
+        latencias, lock, barrera = [], threading.Lock(), threading.Barrier(args.hilos)
+
+        def trabajador():
+            propias = []
+            with aplicacion.app.app_context():
+                barrera.wait()
+                for _ in range(args.consultas):
+                    inicio = time.perf_counter()
+                    guardar()
+                    propias.append((time.perf_counter() - inicio) * 1000)
+            with lock:
+                latencias.extend(propias)
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(args.hilos)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        en_requests = time.perf_counter() - inicio
+        aplicacion.consultas_diferidas.vaciar()
+        total = time.perf_counter() - inicio
+
+        resultados[nombre] = {
+            "consultas": len(latencias),
+            "request_p50_ms": round(percentil(latencias, 50), 3),
+            "request_p95_ms": round(percentil(latencias, 95), 3),
+            "consultas_por_s": round(len(latencias) / en_requests),
+            "hasta_persistir_s": round(total, 2),
+        }
+    resultados["diferida"]["stats"] = aplicacion.consultas_diferidas.stats()
+
+    with aplicacion.app.app_context():
+        guardadas = Queries.query.count()
+    print(json.dumps(resultados, indent=2))
+    print(f"Filas en la base: {guardadas} (esperadas {2 * args.hilos * args.consultas})")
+
+
+if __name__ == "__main__":
+    main()
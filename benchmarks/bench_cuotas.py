@@ -0,0 +1,98 @@
+# bench_cuotas.py - Verifica que la cuota del plan gratuito se respeta con requests concurrentes
+#
+# Uso: python benchmarks/bench_cuotas.py [--hilos 32] [--limite 3] [--rondas 20]
+#
+# Por defecto usa un SQLite temporal; con DATABASE_URL apuntando a un Postgres local se prueba ahí.
+# Compara el esquema anterior (leer, comparar en Python, incrementar y commit) con el UPDATE
+# condicional de cuotas.Cuotas. Termina con código 1 si el nuevo esquema supera el límite.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=32)
+    parser.add_argument("--limite", type=int, default=3)
+    parser.add_argument("--rondas", type=int, default=20)
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}?timeout=30"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+    os.environ["AI_JOB_RECOVER_ON_START"] = "false"
+
+    import app as aplicacion
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+    db, Users, cuotas = aplicacion.db, aplicacion.Users, aplicacion.cuotas
+
+    def antes(user_id):
+        # Lo que hacía get_ai_outfit: leer la fila, comparar en Python e incrementar aparte
+        user = db.session.get(Users, user_id)
+        if (user.ai_outfit_uses or 0) >= args.limite:
+            return False
+        time.sleep(0.001)  # El tiempo entre la lectura y la escritura que deja pasar la carrera
+        user.ai_outfit_uses = (user.ai_outfit_uses or 0) + 1
+        db.session.commit()
+        return True
+
+    def ahora(user_id):
+        return cuotas.consumir(user_id, 'outfit', args.limite)[0]
+
+    resultados = {}
+    for nombre, consumir in (("antes", antes), ("update_condicional", ahora)):
+        excedidas, aceptadas_max, duraciones = 0, 0, []
+        for ronda in range(args.rondas):
+            with aplicacion.app.app_context():
+                user = Users(username=f"{nombre}-{ronda}", email=f"{nombre}-{ronda}@example.com", password="x")
+                db.session.add(user)
+                db.session.commit()
+                user_id = user.id
+
+            aceptadas, lock, barrera = [0], threading.Lock(), threading.Barrier(args.hilos)
+
+            def trabajador():
+                with aplicacion.app.app_context():
+                    barrera.wait()
+                    try:
+                        ok = consumir(user_id)
+                    except Exception:
+                        db.session.rollback()
+                        ok = False
+                    if ok:
+                        with lock:
+                            aceptadas[0] += 1
+
+            hilos = [threading.Thread(target=trabajador) for _ in range(args.hilos)]
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            duraciones.append(time.perf_counter() - inicio)
+            aceptadas_max = max(aceptadas_max, aceptadas[0])
+            excedidas += aceptadas[0] > args.limite
+
+        resultados[nombre] = {
+            "rondas": args.rondas,
+            "rondas_que_superaron_el_limite": excedidas,
+            "max_usos_aceptados": aceptadas_max,
+            "limite": args.limite,
+            "ms_por_ronda": round(1000 * sum(duraciones) / len(duraciones), 2),
+        }
+
+    print(json.dumps(resultados, indent=2))
+    sys.exit(1 if resultados["update_condicional"]["rondas_que_superaron_el_limite"] else 0)
+
+
+if __name__ == "__main__":
+    main()
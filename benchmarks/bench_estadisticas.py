@@ -0,0 +1,99 @@
+# bench_estadisticas.py - Costo de /api/v1/stats a medida que crece el historial de un usuario
+#
+# Uso: python benchmarks/bench_estadisticas.py [--filas 1000 10000 100000] [--repeticiones 20]
+#
+# Compara calcular las estadísticas recorriendo Queries (GROUP BY por ciudad y por semana sobre el historial)
+# con leerlas de los rollups (/api/v1/stats, sin la caché de listados). Las filas se cargan por el mismo
+# camino que el historial (_insertar_consultas, en lotes de 500), así los rollups se mantienen solos; al
+# final se mide `flask stats-rebuild` sobre todo el historial.
+import argparse
+import datetime as dt
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _medir(funcion, repeticiones, preparar=None):
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+    os.environ.update(AI_JOB_RECOVER_ON_START="false", LOG_REQUESTS="false")
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import func
+
+    db, Queries, Users = aplicacion.db, aplicacion.Queries, aplicacion.Users
+    cliente = aplicacion.app.test_client()
+    resultados, cargadas = [], 0
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(db)
+        usuario = Users(username="bench", email="bench@example.com", password="x")
+        db.session.add(usuario)
+        db.session.commit()
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+        inicio_fechas = dt.datetime(2020, 1, 1)
+
+        def escritura():
+            # Nueva versión del historial, como un lote escrito: /api/v1/stats no sale de la caché de listados
+            db.session.execute(aplicacion._nueva_version(Users.historial_version, [usuario.id]))
+            db.session.commit()
+
+        def escaneo():
+            # Lo que costaría sin rollups: agrupar todo el historial del usuario en cada request
+            base = db.session.query(Queries).filter(Queries.user_id == usuario.id)
+            base.with_entities(Queries.ciudad, func.count(), func.min(Queries.temperatura),
+                               func.max(Queries.temperatura)).group_by(Queries.ciudad).all()
+            semana = func.date(Queries.timestamp, 'weekday 0', '-6 days')
+            base.with_entities(semana, func.count()).group_by(semana).all()
+            db.session.rollback()
+
+        for total in sorted(args.filas):
+            inicio = time.perf_counter()
+            for desde in range(cargadas, total, 500):
+                aplicacion._insertar_consultas([
+                    {"user_id": usuario.id, "ciudad": f"Ciudad {i % 200}", "temperatura": (i % 400) / 10 - 5,
+                     "descripcion": "cielo claro", "timestamp": inicio_fechas + dt.timedelta(minutes=30 * i)}
+                    for i in range(desde, min(desde + 500, total))
+                ])
+            carga_ms_por_lote = (time.perf_counter() - inicio) * 1000 / max(1, -(-(total - cargadas) // 500))
+            cargadas = total
+
+            resultados.append({
+                "filas": total,
+                "lote_de_500_ms": round(carga_ms_por_lote, 2),
+                "escaneo_ms": _medir(escaneo, max(1, args.repeticiones // 5)),
+                "rollups_ms": _medir(lambda: cliente.get("/api/v1/stats", headers=cabeceras), args.repeticiones,
+                                     preparar=escritura),
+            })
+
+        inicio = time.perf_counter()
+        aplicacion.app.test_cli_runner().invoke(args=["stats-rebuild"])
+        reconstruccion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+    print(json.dumps({"resultados": resultados, "stats_rebuild_ms": reconstruccion_ms}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# bench_fallas.py - Inyección de fallas: latencia durante una caída de OpenWeatherMap o Gemini, con y sin disyuntores
+#
+# Uso: python benchmarks/bench_fallas.py [--hilos 16] [--segundos 15] [--falla colgado|error]
+#
+# La app corre en proceso contra los stubs (benchmarks/stubs.py). Cada escenario tiene tres fases de
+# --segundos: normal, caída del upstream (el stub se cuelga o responde 503) y recuperación. --hilos
+# clientes piden sin pausa /api/v1/weather/<ciudad> (caída de OpenWeatherMap) o /api/v1/ai-advice
+# con motor=gemini (caída de Gemini), y se reportan p50/p99 y los status de cada fase, con los
+# disyuntores activos y desactivados. La caché del clima vence al segundo para que las requests lleguen
+# al upstream; durante la caída, el clima vencido y el recomendador local mantienen las respuestas en 200.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ciudades import IndiceCiudades  # noqa: E402
+from stubs import iniciar_stubs  # noqa: E402
+
+# Las 100 ciudades más pobladas del índice: cada una es una llamada distinta a OpenWeatherMap
+_indice = IndiceCiudades.desde_archivo()
+CIUDADES = [_indice.nombres[i] for i in range(min(100, len(_indice)))]
+
+
+def _fase(cliente_para, ruta_para, hilos, segundos):
+    from metrics import percentil
+    duraciones, status, lock = [], Counter(), threading.Lock()
+    fin = time.monotonic() + segundos
+
+    def trabajar(numero):
+        cliente, i = cliente_para(), 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            respuesta = cliente(ruta_para(numero, i))
+            with lock:
+                duraciones.append((time.perf_counter() - inicio) * 1000)
+                status[respuesta.status_code] += 1
+            i += 1
+
+    trabajadores = [threading.Thread(target=trabajar, args=(n,)) for n in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join()
+    return {
+        "requests": len(duraciones), "p50_ms": round(percentil(duraciones, 50), 1),
+        "p99_ms": round(percentil(duraciones, 99), 1), "max_ms": round(max(duraciones), 1),
+        "status": dict(status),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=15)
+    parser.add_argument("--falla", choices=("colgado", "error"), default="colgado")
+    args = parser.parse_args()
+
+    _, config, url_stubs = iniciar_stubs(owm_latencia=0.05, gemini_latencia=0.3, colgado_s=30)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", GEMINI_API_BASE=url_stubs, GEMINI_API_KEY="stub",
+        LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false",
+        WEATHER_CACHE_TTL="1", WEATHER_CACHE_STALE_TTL="0",
+        HTTP_READ_TIMEOUT="2", REQUEST_DEADLINE_MS="5000", AI_ADVICE_TIMEOUT_MS="2000", CIRCUIT_OPEN_SECONDS="5",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import logging
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+    logging.getLogger("guardianclima").setLevel(logging.CRITICAL)
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(username="bench", email="bench@example.com", password="x", plan="premium")
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+
+    def cliente_para():
+        cliente = aplicacion.app.test_client()
+        return lambda ruta: cliente.get(ruta, headers=cabeceras)
+
+    escenarios = {
+        "owm": lambda n, i: f"/api/v1/weather/{CIUDADES[(n + i) % len(CIUDADES)]}",
+        "gemini": lambda n, i: f"/api/v1/ai-advice/{CIUDADES[n % len(CIUDADES)]}?motor=gemini&fresh=1",
+    }
+    resultados = {}
+    for api, ruta_para in escenarios.items():
+        for activos in (False, True):
+            for disyuntor in ('openweathermap', 'gemini'):
+                aplicacion.disyuntores[disyuntor].activo = activos
+            nombre = f"{api}_{'con' if activos else 'sin'}_disyuntores"
+            resultados[nombre] = {"normal": _fase(cliente_para, ruta_para, args.hilos, args.segundos)}
+            config.fallas[api] = args.falla
+            resultados[nombre]["caida"] = _fase(cliente_para, ruta_para, args.hilos, args.segundos)
+            config.fallas[api] = None
+            resultados[nombre]["recuperacion"] = _fase(cliente_para, ruta_para, args.hilos, args.segundos)
+            resultados[nombre]["disyuntor"] = aplicacion.disyuntores.stats().get(
+                'openweathermap' if api == 'owm' else 'gemini')
+            # El escenario siguiente arranca con los disyuntores cerrados
+            time.sleep(float(os.environ["CIRCUIT_OPEN_SECONDS"]) + 0.5)
+            _fase(cliente_para, ruta_para, 1, 0.5)
+    aplicacion.consultas_diferidas.vaciar()
+    print(f"{args.hilos} clientes, {args.segundos:.0f} s por fase, upstream caído: {args.falla} "
+          f"(timeout de lectura 2 s, plazo por request 5 s, timeout de Gemini 2 s)")
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
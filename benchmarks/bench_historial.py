@@ -0,0 +1,104 @@
+# bench_historial.py - Latencia del listado de outfits a medida que crece el historial de un usuario
+#
+# Uso: python benchmarks/bench_historial.py [--filas 1000 10000 100000] [--repeticiones 20]
+#
+# Compara la consulta anterior (todas las filas con el consejo completo) con la paginación
+# keyset de /api/v1/outfits: primera página y una página profunda (a mitad del historial).
+# También mide el sondeo sin cambios: con If-None-Match (304 sin leer filas) y con el cuerpo de la caché.
+# Para medir la consulta, antes de cada repetición se incrementa la versión del listado (como una escritura).
+import argparse
+import datetime as dt
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _medir(funcion, repeticiones, preparar=None):
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(statistics.median(tiempos), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+    os.environ["AI_JOB_RECOVER_ON_START"] = "false"
+    os.environ["LOG_REQUESTS"] = "false"
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+
+    db, OutfitHistory, Users = aplicacion.db, aplicacion.OutfitHistory, aplicacion.Users
+    cliente = aplicacion.app.test_client()
+    consejo = "Parte de arriba: camiseta blanca de algodón. " * 20
+    resultados, cargadas = [], 0
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(db)
+        usuario = Users(username="bench", email="bench@example.com", password="x")
+        db.session.add(usuario)
+        db.session.commit()
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+        inicio_fechas = dt.datetime(2020, 1, 1)
+
+        for total in sorted(args.filas):
+            # Completamos el historial hasta 'total' filas con inserts masivos
+            db.session.execute(db.insert(OutfitHistory), [
+                {"user_id": usuario.id, "city": f"Ciudad {i % 50}", "advice": consejo,
+                 "date": inicio_fechas + dt.timedelta(minutes=i)}
+                for i in range(cargadas, total)
+            ])
+            db.session.commit()
+            cargadas = total
+
+            def escritura():
+                db.session.execute(aplicacion._nueva_version(Users.outfits_version, [usuario.id]))
+                db.session.commit()
+
+            def antes():
+                filas = OutfitHistory.query.filter_by(user_id=usuario.id).order_by(OutfitHistory.date.desc()).all()
+                json.dumps([o.to_dict() for o in filas])
+                db.session.expunge_all()
+
+            fecha_media = inicio_fechas + dt.timedelta(minutes=total // 2)
+            cursor = aplicacion._codificar_cursor(fecha_media, total // 2)
+
+            resultados.append({
+                "filas": total,
+                "sin_paginar_ms": _medir(antes, max(1, args.repeticiones // 5)),
+                "keyset_primera_pagina_ms": _medir(
+                    lambda: cliente.get("/api/v1/outfits?limit=50", headers=cabeceras), args.repeticiones, escritura),
+                "keyset_pagina_profunda_ms": _medir(
+                    lambda: cliente.get(f"/api/v1/outfits?limit=50&cursor={cursor}", headers=cabeceras),
+                    args.repeticiones, escritura),
+            })
+            etag = cliente.get("/api/v1/outfits?limit=50", headers=cabeceras).headers["ETag"]
+            resultados[-1].update({
+                "sondeo_304_ms": _medir(
+                    lambda: cliente.get("/api/v1/outfits?limit=50", headers=dict(cabeceras, **{"If-None-Match": etag})),
+                    args.repeticiones),
+                "sondeo_en_cache_ms": _medir(
+                    lambda: cliente.get("/api/v1/outfits?limit=50", headers=cabeceras), args.repeticiones),
+            })
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
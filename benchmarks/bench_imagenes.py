@@ -0,0 +1,105 @@
+# bench_imagenes.py - Compara el envío de fotos a Gemini con y sin preprocesamiento
+#
+# Uso: python benchmarks/bench_imagenes.py [--fotos N]
+#
+# Cada modo corre en un subproceso aparte para medir su pico de memoria (RSS) por separado.
+# 'original' reproduce el camino anterior: Image.open(stream) y el SDK de genai serializando la
+# imagen completa (PNG, porque una imagen abierta desde un stream no tiene nombre de archivo).
+# 'preprocesado' usa imagenes.preprocesar_imagenes (draft JPEG + reducción + re-codificación).
+import argparse
+import glob
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def _fotos_de_prueba(n):
+    """Las fotos del repo y una versión 4000x3000 (tamaño típico de un celular) de cada una."""
+    from PIL import Image
+
+    fotos = []
+    for ruta in sorted(glob.glob(os.path.join(RAIZ, "*.jpg"))):
+        with open(ruta, "rb") as f:
+            original = f.read()
+        fotos.append(original)
+        grande = io.BytesIO()
+        Image.open(io.BytesIO(original)).resize((3000, 4000)).save(grande, "JPEG", quality=92)
+        fotos.append(grande.getvalue())
+    return (fotos * n)[:n]
+
+
+def _modo_original(fotos):
+    from PIL import Image
+
+    # Como antes: todas las imágenes abiertas a la vez y serializadas por el SDK en la misma request
+    imagenes_pil = [Image.open(io.BytesIO(contenido)) for contenido in fotos]
+    partes = []
+    for imagen in imagenes_pil:
+        salida = io.BytesIO()
+        imagen.save(salida, "PNG")
+        partes.append(salida.getvalue())
+    return sum(len(p) for p in partes)
+
+
+def _modo_preprocesado(fotos):
+    from imagenes import preprocesar_imagenes
+
+    return sum(len(img) for img in preprocesar_imagenes(fotos))
+
+
+def _correr_modo(modo, directorio):
+    fotos = []
+    for ruta in sorted(glob.glob(os.path.join(directorio, "*.jpg"))):
+        with open(ruta, "rb") as f:
+            fotos.append(f.read())
+    rss_antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    enviados = _modo_original(fotos) if modo == "original" else _modo_preprocesado(fotos)
+    duracion = time.perf_counter() - inicio
+    rss_despues = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "modo": modo,
+        "fotos": len(fotos),
+        "bytes_subidos": sum(len(f) for f in fotos),
+        "bytes_a_gemini": enviados,
+        "pico_rss_extra_mb": round((rss_despues - rss_antes) / 1024, 1),
+        "segundos": round(duracion, 3),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fotos", type=int, default=4)
+    parser.add_argument("--modo", choices=["original", "preprocesado"])
+    parser.add_argument("--dir")
+    args = parser.parse_args()
+
+    if args.modo:
+        _correr_modo(args.modo, args.dir)
+        return
+
+    # Las fotos de prueba se generan una sola vez aquí para no ensuciar la medición de cada modo
+    resultados = []
+    with tempfile.TemporaryDirectory() as directorio:
+        for i, contenido in enumerate(_fotos_de_prueba(args.fotos)):
+            with open(os.path.join(directorio, f"{i:03d}.jpg"), "wb") as f:
+                f.write(contenido)
+        for modo in ("original", "preprocesado"):
+            salida = subprocess.run(
+                [sys.executable, __file__, "--modo", modo, "--dir", directorio],
+                check=True, capture_output=True, text=True
+            ).stdout
+            resultados.append(json.loads(salida))
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
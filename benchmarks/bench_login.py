@@ -0,0 +1,106 @@
+# bench_login.py - Logins por segundo y por núcleo, y latencia del clima durante una tanda de logins
+#
+# Uso: python benchmarks/bench_login.py [--hilos 16] [--segundos 10] [--workers N] [--costo N]
+#
+# La app corre en proceso contra el stub de OpenWeatherMap (benchmarks/stubs.py). Primero se mide
+# /api/v1/weather/<ciudad> solo; después --hilos clientes hacen POST /api/login sin pausa mientras otro
+# cliente sigue pidiendo el clima. Se reportan logins/s, logins/s por núcleo, p50/p99 del login, p99 del
+# clima con y sin la tanda de logins y el estado del pool de bcrypt (espera en cola, rechazados).
+# --workers fija BCRYPT_WORKERS y --costo BCRYPT_LOG_ROUNDS (sin --costo se calibra).
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import iniciar_stubs  # noqa: E402
+
+
+def _medir_clima(cliente, cabeceras, fin):
+    duraciones = []
+    while time.monotonic() < fin:
+        inicio = time.perf_counter()
+        cliente.get("/api/v1/weather/Rosario", headers=cabeceras)
+        duraciones.append((time.perf_counter() - inicio) * 1000)
+        time.sleep(0.01)
+    return duraciones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--costo", type=int)
+    args = parser.parse_args()
+
+    _, _, url_stubs = iniciar_stubs(owm_latencia=0.01)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}?timeout=30",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+    if args.workers:
+        os.environ["BCRYPT_WORKERS"] = str(args.workers)
+    if args.costo:
+        os.environ["BCRYPT_LOG_ROUNDS"] = str(args.costo)
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+    from metrics import percentil
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(username="bench", email="bench@example.com")
+        usuario.set_password("Segura9Clave")
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+
+    nucleos = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    clima_solo = _medir_clima(aplicacion.app.test_client(), cabeceras, time.monotonic() + 2)
+
+    duraciones, status, lock = [], Counter(), threading.Lock()
+    fin = time.monotonic() + args.segundos
+
+    def iniciar_sesiones():
+        cliente = aplicacion.app.test_client()
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            respuesta = cliente.post("/api/login", json={"email": "bench@example.com", "password": "Segura9Clave"})
+            with lock:
+                duraciones.append((time.perf_counter() - inicio) * 1000)
+                status[respuesta.status_code] += 1
+
+    hilos = [threading.Thread(target=iniciar_sesiones) for _ in range(args.hilos)]
+    inicio = time.monotonic()
+    for hilo in hilos:
+        hilo.start()
+    clima_con_logins = _medir_clima(aplicacion.app.test_client(), cabeceras, fin)
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.monotonic() - inicio
+    aplicacion.consultas_diferidas.vaciar()
+
+    logins = status.get(200, 0)
+    print(json.dumps({
+        "nucleos": nucleos, "clientes": args.hilos,
+        "logins_por_s": round(logins / transcurrido, 1),
+        "logins_por_s_por_nucleo": round(logins / transcurrido / nucleos, 1),
+        "login_p50_ms": round(percentil(duraciones, 50), 1), "login_p99_ms": round(percentil(duraciones, 99), 1),
+        "status": dict(status),
+        "clima_p99_ms_solo": round(percentil(clima_solo, 99), 1),
+        "clima_p99_ms_con_logins": round(percentil(clima_con_logins, 99), 1),
+        "pool_bcrypt": aplicacion.contrasenas.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# bench_prompts.py - Tokens y latencia de cada ruta de IA contra el stub de Gemini
+#
+# Uso: python benchmarks/bench_prompts.py [--llamadas 20] [--gemini-latencia 0.3] [--prendas 5]
+#
+# La app corre en proceso contra los stubs de OpenWeatherMap y Gemini (benchmarks/stubs.py). Por cada ruta
+# (advice, outfit con --prendas prendas ya descritas, travel y travel en streaming) arma la solicitud
+# como la request real y la manda a Gemini --llamadas veces, sin caché de consejos. Reporta el tamaño del
+# prompt y lo que quedó en /api/internal/stats: tokens de entrada y salida promedio (el stub cuenta ~4 bytes
+# del cuerpo por token) y latencia por ruta, que es lo que hay que comparar entre dos versiones de los prompts.
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import clima_falso, iniciar_stubs  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llamadas", type=int, default=20)
+    parser.add_argument("--gemini-latencia", type=float, default=0.3)
+    parser.add_argument("--prendas", type=int, default=5)
+    args = parser.parse_args()
+
+    _, _, url_stubs = iniciar_stubs(gemini_latencia=args.gemini_latencia)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", GEMINI_API_BASE=url_stubs, GEMINI_API_KEY="stub",
+        LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false", CITY_INDEX_STRICT="false",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import app as aplicacion
+
+    hoy = dt.date.today()
+    prendas = [{"sha": str(n), "descripcion": f"prenda {n}: camiseta blanca de algodón de manga corta"}
+               for n in range(args.prendas)]
+    largos = {}
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(
+            username="bench", email="bench@example.com", password="x", plan="premium",
+            estilo_preferido="Elegante", actividad_principal="Oficina", sensibilidad_frio="Alta",
+            colores_preferidos="Neutros (negro, blanco, gris, beige)", preferencia_clima="Templado",
+            frecuencia_viajes="Ocasional", tipo_calzado="Elegante", frecuencia_ejercicio="Semanal",
+            preferencia_tejido="Lana", prenda_favorita="Chaqueta",
+        )
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        with aplicacion.app.test_request_context():
+            solicitudes = {
+                "advice": aplicacion._preparar_consejo(usuario, clima_falso("Madrid")),
+                "outfit": aplicacion._preparar_outfit(usuario, "Madrid", prendas)[0],
+                "travel": aplicacion._preparar_viaje(
+                    usuario, "Madrid", hoy.isoformat(), (hoy + dt.timedelta(days=3)).isoformat())[0],
+            }
+            for ruta, solicitud in solicitudes.items():
+                largos[ruta] = len(solicitud["config"].system_instruction) + sum(
+                    len(parte) for parte in solicitud["contents"] if isinstance(parte, str))
+                for _ in range(args.llamadas):
+                    aplicacion._generar_gemini(solicitud)
+            resumen = {ruta: _resumen(datos, largos.get(ruta)) for ruta, datos in aplicacion.prompts_gemini.stats().items()
+                       if datos["llamadas"]}
+            # En streaming los tokens salen del usage_metadata del último fragmento
+            antes = aplicacion.prompts_gemini.stats()["travel"]
+            for _ in range(args.llamadas):
+                "".join(aplicacion._fragmentos_gemini(solicitudes["travel"]))
+            despues = aplicacion.prompts_gemini.stats()["travel"]
+            resumen["travel_streaming"] = {
+                "tokens_entrada_promedio": round((despues["tokens_entrada"] - antes["tokens_entrada"]) / args.llamadas, 1),
+                "tokens_salida_promedio": round((despues["tokens_salida"] - antes["tokens_salida"]) / args.llamadas, 1),
+                "estimadas": despues["estimadas"] - antes["estimadas"],
+            }
+    print(json.dumps(resumen, indent=2))
+
+
+def _resumen(datos, caracteres):
+    return {
+        "prompt_caracteres": caracteres,
+        "modelo": datos["modelo"],
+        "tokens_entrada_promedio": datos["tokens_entrada_promedio"],
+        "tokens_salida_promedio": datos["tokens_salida_promedio"],
+        "estimadas": datos["estimadas"],
+        "p50_ms": round(1000 * datos["latencia"]["p50_s"], 1),
+    }
+
+
+if __name__ == "__main__":
+    main()
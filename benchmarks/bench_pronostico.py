@@ -0,0 +1,86 @@
+# bench_pronostico.py - Pronóstico para el asistente de viaje: llamadas a OpenWeatherMap y tamaño del prompt
+#
+# Uso: python benchmarks/bench_pronostico.py [--viajeros 200] [--ciudades 10] [--owm-latencia 0.2]
+#
+# La app corre en proceso contra el stub de OpenWeatherMap (benchmarks/stubs.py). Cada viajero pide la lista de
+# equipaje para una de --ciudades con una ventana de 1 a 4 días dentro del pronóstico; se arma el prompt
+# (_preparar_viaje, sin llamar a Gemini) y se cuentan las llamadas que recibió el stub. El tamaño del prompt se
+# compara con el que tendría pegando la respuesta cruda de /data/2.5/forecast y el resumen de los 5 días.
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import iniciar_stubs, pronostico_falso  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--viajeros", type=int, default=200)
+    parser.add_argument("--ciudades", type=int, default=10)
+    parser.add_argument("--owm-latencia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    _, config, url_stubs = iniciar_stubs(owm_latencia=args.owm_latencia)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", GEMINI_API_KEY="stub",
+        LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false", CITY_INDEX_STRICT="false",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import app as aplicacion
+    from metrics import percentil
+    from pronostico import resumir_por_dia, texto_para_prompt
+
+    random.seed(7)
+    hoy = dt.datetime.now(dt.timezone.utc).date()
+    ciudades = [f"Destino {n}" for n in range(args.ciudades)]
+    duraciones, largos = [], []
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(username="bench", email="bench@example.com", password="x", plan="premium")
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        for _ in range(args.viajeros):
+            inicio_viaje = hoy + dt.timedelta(days=random.randint(0, 3))
+            fin_viaje = inicio_viaje + dt.timedelta(days=random.randint(0, 3))
+            with aplicacion.app.test_request_context():
+                inicio = time.perf_counter()
+                solicitud, respuesta = aplicacion._preparar_viaje(
+                    usuario, random.choice(ciudades), inicio_viaje.isoformat(), fin_viaje.isoformat())
+                duraciones.append((time.perf_counter() - inicio) * 1000)
+            assert respuesta is None, respuesta
+            largos.append(len(solicitud["contents"][0]))
+
+    crudo = pronostico_falso(ciudades[0])
+    inicio = time.perf_counter()
+    for _ in range(1000):
+        resumen = resumir_por_dia(crudo)
+    resumir_us = (time.perf_counter() - inicio) * 1000
+
+    print(json.dumps({
+        "viajeros": args.viajeros, "ciudades": args.ciudades,
+        "llamadas_owm": {api: n for api, n in config.contadores.items() if api.startswith("owm")},
+        "preparar_p50_ms": round(percentil(duraciones, 50), 2),
+        "preparar_p99_ms": round(percentil(duraciones, 99), 2),
+        "prompt_caracteres_p50": round(percentil(largos, 50)),
+        "pronostico": {
+            "json_crudo_bytes": len(json.dumps(crudo)),
+            "resumen_5_dias_caracteres": len(texto_para_prompt(resumen)),
+            "resumir_por_dia_us": round(resumir_us, 1),
+        },
+        "cache": aplicacion.pronostico_cache.stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
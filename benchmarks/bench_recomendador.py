@@ -0,0 +1,90 @@
+# bench_recomendador.py - Consejo de vestimenta: recomendador local vs Gemini (y respaldo por timeout)
+#
+# Uso: python benchmarks/bench_recomendador.py [--pedidos 50] [--gemini-latencia 0.8] [--timeout-ms 300]
+#
+# Mide la latencia p50/p99 de recomendador.recomendar() solo y de GET /api/v1/ai-advice con ?motor=local
+# y ?motor=gemini&fresh=1 (sin caché) contra el stub de Gemini (benchmarks/stubs.py). El último caso baja
+# AI_ADVICE_TIMEOUT_MS por debajo de la latencia del stub: es lo que tarda en responder el respaldo local
+# cuando Gemini está lento. El clima sale siempre de la caché (se pide una vez antes de medir).
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import clima_falso, iniciar_stubs  # noqa: E402
+
+
+def _medir(funcion, veces):
+    from metrics import percentil
+    duraciones = []
+    for _ in range(veces):
+        inicio = time.perf_counter()
+        funcion()
+        duraciones.append((time.perf_counter() - inicio) * 1000)
+    return {"p50_ms": round(percentil(duraciones, 50), 3), "p99_ms": round(percentil(duraciones, 99), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pedidos", type=int, default=50)
+    parser.add_argument("--gemini-latencia", type=float, default=0.8)
+    parser.add_argument("--timeout-ms", type=int, default=300)
+    args = parser.parse_args()
+
+    _, _, url_stubs = iniciar_stubs(gemini_latencia=args.gemini_latencia)
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}",
+        WEATHER_API_BASE=url_stubs, WEATHER_API_KEY="stub", GEMINI_API_BASE=url_stubs, GEMINI_API_KEY="stub",
+        LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false",
+    )
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+    from recomendador import recomendar
+
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(aplicacion.db)
+        usuario = aplicacion.Users(
+            username="bench", email="bench@example.com", password="x", plan="premium",
+            estilo_preferido="Elegante", actividad_principal="Oficina", sensibilidad_frio="Alta",
+            colores_preferidos="Neutros (negro, blanco, gris, beige)", tipo_calzado="Elegante",
+            preferencia_tejido="Lana", prenda_favorita="Chaqueta",
+        )
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+        preferencias = {columna: getattr(usuario, columna) for columna in (
+            "estilo_preferido", "actividad_principal", "sensibilidad_frio", "colores_preferidos",
+            "tipo_calzado", "preferencia_tejido", "prenda_favorita")}
+        cabeceras = {"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"}
+    cliente = aplicacion.app.test_client()
+
+    def consejo(motor):
+        respuesta = cliente.get(f"/api/v1/ai-advice/Madrid?motor={motor}&fresh=1", headers=cabeceras)
+        assert respuesta.status_code == 200
+        return respuesta.get_json()["motor"]
+
+    azar = random.Random(7)
+    climas = [clima_falso(f"ciudad-{azar.randrange(10 ** 6)}") for _ in range(1000)]
+    resultados = {"recomendar": _medir(lambda: recomendar(azar.choice(climas), preferencias), 10000)}
+    consejo("local")  # Calienta la caché del clima
+    resultados["endpoint_local"] = _medir(lambda: consejo("local"), args.pedidos)
+    resultados["endpoint_gemini"] = _medir(lambda: consejo("gemini"), args.pedidos)
+    # Gemini más lento que el timeout: cada pedido espera el timeout y responde el recomendador local
+    aplicacion.AI_ADVICE_TIMEOUT_MS = args.timeout_ms
+    motores = []
+    resultados["endpoint_gemini_respaldo"] = _medir(lambda: motores.append(consejo("gemini")), min(args.pedidos, 10))
+    resultados["endpoint_gemini_respaldo"]["respuestas_locales"] = motores.count("local")
+    print(f"Gemini con {int(args.gemini_latencia * 1000)} ms de latencia, timeout de respaldo {args.timeout_ms} ms")
+    print(json.dumps(resultados, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench_replica.py - Lecturas en la réplica, read-your-writes y espera del pool de conexiones
+#
+# Uso: python benchmarks/bench_replica.py [--hilos 16] [--segundos 10] [--primaria URL --replica URL] [--sin-replica]
+#
+# Sin URLs usa dos archivos SQLite: la "réplica" es una copia de la primaria hecha después de cargar los datos,
+# así que queda atrasada todo el benchmark (como una réplica con mucho lag). Con dos PostgreSQL (primaria y
+# réplica con streaming replication) se pasan --primaria y --replica. Cada hilo es un usuario que lista su
+# historial y sus outfits; uno de cada --escritores además guarda un outfit cada 10 pedidos y lo busca
+# enseguida en el listado: si no aparece, es una violación de read-your-writes. Se reportan latencias,
+# violaciones y el estado de cada pool.
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--primaria")
+    parser.add_argument("--replica")
+    parser.add_argument("--sin-replica", action="store_true")
+    parser.add_argument("--filas", type=int, default=2000, help="outfits iniciales por usuario")
+    parser.add_argument("--escritores", type=int, default=4, help="1 de cada N usuarios escribe")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    archivo_primaria = os.path.join(directorio, "primaria.db")
+    archivo_replica = os.path.join(directorio, "replica.db")
+    primaria = args.primaria or f"sqlite:///{archivo_primaria}?timeout=30"
+    replica = args.replica or f"sqlite:///{archivo_replica}?timeout=30"
+    os.environ.update(DATABASE_URL=primaria, LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false")
+    if not args.sin_replica:
+        os.environ["DATABASE_REPLICA_URL"] = replica
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-" + "x" * 32)
+
+    import app as aplicacion
+    from flask_jwt_extended import create_access_token
+    from metrics import percentil
+
+    db, Users, OutfitHistory = aplicacion.db, aplicacion.Users, aplicacion.OutfitHistory
+    cabeceras = []
+    with aplicacion.app.app_context():
+        aplicacion.aplicar_migraciones(db)
+        inicio_fechas = dt.datetime(2020, 1, 1)
+        for n in range(args.hilos):
+            usuario = Users(username=f"bench{n}", email=f"bench{n}@example.com", password="x", plan="premium")
+            db.session.add(usuario)
+            db.session.commit()
+            db.session.execute(db.insert(OutfitHistory), [
+                {"user_id": usuario.id, "city": f"Ciudad {i % 50}", "advice": "Abrigo liviano.",
+                 "date": inicio_fechas + dt.timedelta(minutes=i)}
+                for i in range(args.filas)
+            ])
+            db.session.commit()
+            cabeceras.append({"Authorization": f"Bearer {create_access_token(identity=str(usuario.id))}"})
+        if not args.replica and not args.sin_replica:
+            # La réplica SQLite es una foto de la primaria tomada ahora
+            db.engines[None].dispose()
+            shutil.copy(archivo_primaria, archivo_replica)
+
+    duraciones, violaciones, status, lock = [], Counter(), Counter(), threading.Lock()
+    fin = time.monotonic() + args.segundos
+
+    def usuario(n):
+        cliente, i = aplicacion.app.test_client(), 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            if n % args.escritores == 0 and i % 10 == 9:
+                guardado = cliente.post("/api/v1/outfits", headers=cabeceras[n],
+                                        json={"city": "Nueva", "advice": "Paraguas."}).get_json()["id"]
+                listado = cliente.get("/api/v1/outfits?limit=5", headers=cabeceras[n])
+                if guardado not in [o["id"] for o in listado.get_json()]:
+                    with lock:
+                        violaciones["outfits"] += 1
+            else:
+                listado = cliente.get("/api/v1/history" if i % 2 else "/api/v1/outfits?limit=50", headers=cabeceras[n])
+            with lock:
+                duraciones.append((time.perf_counter() - inicio) * 1000)
+                status[listado.status_code] += 1
+            i += 1
+
+    hilos = [threading.Thread(target=usuario, args=(n,)) for n in range(args.hilos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    with aplicacion.app.test_request_context():
+        pools = aplicacion.stats_pool(db.engines)
+    print(json.dumps({
+        "replica": None if args.sin_replica else replica.split("?")[0],
+        "requests": len(duraciones), "status": dict(status),
+        "p50_ms": round(percentil(duraciones, 50), 2), "p99_ms": round(percentil(duraciones, 99), 2),
+        "violaciones_read_your_writes": sum(violaciones.values()),
+        "pools": pools,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# servidor.py - Levanta la app para los benchmarks de carga (lo usa benchmarks/carga.py)
+#
+# Uso: python benchmarks/servidor.py --puerto 5055
+#
+# La configuración llega por variables de entorno (DATABASE_URL, WEATHER_API_BASE, GEMINI_API_BASE...).
+import argparse
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puerto", type=int, default=5055)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    from app import aplicar_migraciones, app, db
+
+    # Importar la app ya no crea el esquema: lo aplicamos como haría un deploy con `flask db-upgrade`
+    with app.app_context():
+        aplicar_migraciones(db)
+
+    # Un hilo por request, como el servidor de desarrollo pero sin reloader ni debugger
+    servidor = make_server('127.0.0.1', args.puerto, app, threaded=True)
+    print(f"Sirviendo la app en http://127.0.0.1:{args.puerto}", flush=True)
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# stubs.py - Servidores locales que imitan OpenWeatherMap, la API REST de Gemini y PayPal
+#
+# Uso: python benchmarks/stubs.py [--puerto 8900] [--gemini-latencia 0.8] [--gemini-tokens 200]
+#
+# Un solo servidor HTTP atiende las tres APIs según la ruta, así la app se apunta a él con
+#   WEATHER_API_BASE=http://127.0.0.1:8900 GEMINI_API_BASE=http://127.0.0.1:8900 PAYPAL_API_BASE=http://127.0.0.1:8900
+# GET /__stats devuelve cuántas llamadas recibió cada API (para verificar aciertos de caché, tokens reutilizados...).
+# POST /__fallas con {"owm": "error"|"colgado"|null, "gemini": ..., "paypal": ...} simula una caída de esa API:
+# 'error' responde 503 al instante y 'colgado' no responde hasta pasados 'colgado_s' segundos.
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Ciudades que el stub de OpenWeatherMap no conoce (responde 404 como la API real)
+CIUDADES_INEXISTENTES = {"ciudadinexistente", "nowhere"}
+
+
+class ConfigStubs:
+    def __init__(self, owm_latencia=0.05, gemini_latencia=0.8, gemini_tokens=200, paypal_latencia=0.1,
+                 token_expira=32400, colgado_s=30):
+        self.owm_latencia = owm_latencia
+        self.gemini_latencia = gemini_latencia
+        self.gemini_tokens = gemini_tokens
+        self.paypal_latencia = paypal_latencia
+        self.token_expira = token_expira
+        self.colgado_s = colgado_s
+        self.fallas = {}  # API -> 'error' o 'colgado'
+        self.contadores = {}
+        self.lock = threading.Lock()
+
+    def contar(self, nombre):
+        with self.lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + 1
+
+
+    def simular_falla(self, api):
+        """None si 'api' funciona; si no, el status de error a responder (después de colgarse, si corresponde)."""
+        falla = self.fallas.get(api)
+        if falla == 'colgado':
+            time.sleep(self.colgado_s)
+        return 503 if falla else None
+
+
+def clima_falso(ciudad, ciudad_id=None):
+    """Payload con la forma de /data/2.5/weather; los valores son deterministas por ciudad."""
+    semilla = int(hashlib.sha256(ciudad.lower().encode()).hexdigest()[:8], 16)
+    temperatura = round(-5 + (semilla % 400) / 10.0, 2)
+    condicion = (800, 801, 802, 500, 600, 701)[semilla % 6]
+    return {
+        "coord": {"lon": round((semilla % 36000) / 100.0 - 180, 2), "lat": round((semilla % 18000) / 100.0 - 90, 2)},
+        "weather": [{"id": condicion, "main": "Clear", "description": "cielo claro", "icon": "01d"}],
+        "base": "stations",
+        "main": {
+            "temp": temperatura, "feels_like": round(temperatura - 1.3, 2),
+            "temp_min": round(temperatura - 2, 2), "temp_max": round(temperatura + 2, 2),
+            "pressure": 1013, "humidity": 30 + semilla % 60
+        },
+        "visibility": 10000,
+        "wind": {"speed": round((semilla % 120) / 10.0, 1), "deg": semilla % 360},
+        "clouds": {"all": semilla % 100},
+        "dt": int(time.time()),
+        "sys": {"country": "AR", "sunrise": 1700000000, "sunset": 1700040000},
+        "timezone": -10800,
+        "id": ciudad_id or semilla % 10000000,
+        "name": ciudad.title(),
+        "cod": 200
+    }
+
+
+def pronostico_falso(ciudad, intervalos=40, ciudad_id=None):
+    """Payload con la forma de /data/2.5/forecast: 'intervalos' de 3 horas desde ahora, deterministas por ciudad."""
+    actual = clima_falso(ciudad, ciudad_id)
+    inicio = int(time.time()) // 10800 * 10800 + 10800
+    condiciones = ((800, "cielo claro"), (802, "nubes dispersas"), (500, "lluvia ligera"), (600, "nevada ligera"))
+    lista = []
+    for i in range(intervalos):
+        # Ciclo diario de ±2 °C alrededor de la temperatura actual y una condición que cambia cada 12 horas
+        temperatura = round(actual["main"]["temp"] + 2 - abs((i % 8) - 4), 2)
+        condicion, descripcion = condiciones[(actual["id"] + i // 4) % len(condiciones)]
+        intervalo = {
+            "dt": inicio + i * 10800,
+            "main": {"temp": temperatura, "feels_like": round(temperatura - 1.3, 2), "temp_min": temperatura,
+                     "temp_max": temperatura, "pressure": 1013, "humidity": actual["main"]["humidity"]},
+            "weather": [{"id": condicion, "main": descripcion, "description": descripcion, "icon": "01d"}],
+            "clouds": {"all": actual["clouds"]["all"]},
+            "wind": actual["wind"],
+            "visibility": 10000,
+            "pop": round(0.8 if condicion < 800 else (actual["id"] + i) % 3 / 10, 2),
+            "sys": {"pod": "d" if 3 <= (i % 8) < 7 else "n"},
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(inicio + i * 10800)),
+        }
+        if condicion == 500:
+            intervalo["rain"] = {"3h": round(0.5 + (actual["id"] + i) % 20 / 10, 2)}
+        lista.append(intervalo)
+    return {
+        "cod": "200", "message": 0, "cnt": len(lista), "list": lista,
+        "city": {"id": actual["id"], "name": actual["name"], "coord": actual["coord"], "country": "AR",
+                 "timezone": actual["timezone"], "sunrise": 1700000000, "sunset": 1700040000},
+    }
+
+
+def texto_falso(tokens):
+    # ~1 token por palabra corta; alcanza para medir el costo de transportar y guardar la respuesta
+    palabras = ("abrigo", "liviano", "capas", "paraguas", "algodón", "zapatillas", "lana", "bufanda")
+    return " ".join(palabras[i % len(palabras)] for i in range(tokens))
+
+
+def respuesta_gemini(texto, tokens_prompt=100, tokens_salida=None):
+    # En streaming 'tokens_salida' es el acumulado hasta ese fragmento, como informa la API real
+    tokens_salida = len(texto.split()) if tokens_salida is None else tokens_salida
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": texto}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {
+            "promptTokenCount": tokens_prompt,
+            "candidatesTokenCount": tokens_salida,
+            "totalTokenCount": tokens_prompt + tokens_salida
+        },
+        "modelVersion": "stub"
+    }
+
+
+def crear_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, datos):
+            cuerpo = json.dumps(datos).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def _leer_cuerpo(self):
+            largo = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(largo) if largo else b''
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            consulta = parse_qs(partes.query)
+            if partes.path == '/__stats':
+                with config.lock:
+                    return self._json(200, dict(config.contadores))
+            if partes.path.startswith('/data/2.5/') and config.simular_falla('owm'):
+                config.contar('owm_falla')
+                return self._json(503, {"cod": 503, "message": "service unavailable"})
+            if partes.path == '/data/2.5/weather':
+                config.contar('owm_weather')
+                time.sleep(config.owm_latencia)
+                ciudad = consulta.get('q', [''])[0]
+                if ciudad.lower() in CIUDADES_INEXISTENTES:
+                    return self._json(404, {"cod": "404", "message": "city not found"})
+                if not ciudad and consulta.get('id'):
+                    ciudad = f"ciudad-{consulta['id'][0]}"
+                return self._json(200, clima_falso(ciudad, ciudad_id=int(consulta['id'][0]) if consulta.get('id') else None))
+            if partes.path == '/data/2.5/forecast':
+                config.contar('owm_forecast')
+                time.sleep(config.owm_latencia)
+                ciudad = consulta.get('q', [''])[0]
+                if ciudad.lower() in CIUDADES_INEXISTENTES:
+                    return self._json(404, {"cod": "404", "message": "city not found"})
+                if not ciudad and consulta.get('id'):
+                    ciudad = f"ciudad-{consulta['id'][0]}"
+                return self._json(200, pronostico_falso(
+                    ciudad, int(consulta.get('cnt', ['40'])[0]),
+                    ciudad_id=int(consulta['id'][0]) if consulta.get('id') else None
+                ))
+            if partes.path == '/data/2.5/group':
+                config.contar('owm_group')
+                time.sleep(config.owm_latencia)
+                ids = [i for i in consulta.get('id', [''])[0].split(',') if i]
+                lista = [clima_falso(f"ciudad-{i}", ciudad_id=int(i)) for i in ids]
+                return self._json(200, {"cnt": len(lista), "list": lista})
+            self._json(404, {"error": "ruta desconocida en el stub"})
+
+        def do_POST(self):
+            partes = urlsplit(self.path)
+            cuerpo = self._leer_cuerpo()
+            if partes.path == '/__fallas':
+                with config.lock:
+                    config.fallas.update(json.loads(cuerpo or b'{}'))
+                return self._json(200, config.fallas)
+            api = 'gemini' if ':' in partes.path else 'paypal'  # Gemini: /v1beta/models/<modelo>:generateContent
+            if config.simular_falla(api):
+                config.contar(f'{api}_falla')
+                return self._json(503, {"error": {"code": 503, "message": "unavailable", "status": "UNAVAILABLE"}})
+            if partes.path == '/v1/oauth2/token':
+                config.contar('paypal_token')
+                time.sleep(config.paypal_latencia)
+                return self._json(200, {
+                    "scope": "https://uri.paypal.com/services/payments",
+                    "access_token": f"A21AA{uuid.uuid4().hex}",
+                    "token_type": "Bearer",
+                    "app_id": "APP-STUB",
+                    "expires_in": config.token_expira,
+                    "nonce": uuid.uuid4().hex
+                })
+            if partes.path == '/v2/checkout/orders':
+                config.contar('paypal_order')
+                time.sleep(config.paypal_latencia)
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    return self._json(401, {"error": "invalid_token"})
+                return self._json(201, {"id": uuid.uuid4().hex[:17].upper(), "status": "CREATED", "links": []})
+            if partes.path.endswith(':generateContent'):
+                config.contar('gemini')
+                time.sleep(config.gemini_latencia)
+                return self._json(200, respuesta_gemini(texto_falso(config.gemini_tokens), len(cuerpo) // 4))
+            if partes.path.endswith(':streamGenerateContent'):
+                config.contar('gemini_stream')
+                return self._stream_gemini(len(cuerpo) // 4)
+            self._json(404, {"error": "ruta desconocida en el stub"})
+
+        def _stream_gemini(self, tokens_prompt):
+            # La mitad de la latencia hasta el primer fragmento y el resto repartido entre 10 fragmentos
+            palabras = texto_falso(config.gemini_tokens).split()
+            paso = max(1, -(-len(palabras) // 10))
+            fragmentos = [palabras[i:i + paso] for i in range(0, len(palabras), paso)]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            time.sleep(config.gemini_latencia / 2)
+            enviados = 0
+            for fragmento in fragmentos:
+                enviados += len(fragmento)
+                datos = respuesta_gemini(" ".join(fragmento) + " ", tokens_prompt, enviados)
+                self.wfile.write(f"data: {json.dumps(datos)}\r\n\r\n".encode())
+                self.wfile.flush()
+                time.sleep(config.gemini_latencia / 20)
+            self.close_connection = True
+
+    return Handler
+
+
+class ServidorStubs(ThreadingHTTPServer):
+    # El backlog por defecto (5) descarta conexiones cuando llegan cientos a la vez
+    request_queue_size = 2048
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # El cliente cortó por timeout (ej. el respaldo de /api/v1/ai-advice): no es un error del stub
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def iniciar_stubs(puerto=0, **opciones):
+    """Arranca los stubs en un hilo. Retorna (servidor, config, url_base)."""
+    config = ConfigStubs(**opciones)
+    servidor = ServidorStubs(('127.0.0.1', puerto), crear_handler(config))
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, config, f"http://127.0.0.1:{servidor.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puerto", type=int, default=8900)
+    parser.add_argument("--owm-latencia", type=float, default=0.05)
+    parser.add_argument("--gemini-latencia", type=float, default=0.8)
+    parser.add_argument("--gemini-tokens", type=int, default=200)
+    parser.add_argument("--paypal-latencia", type=float, default=0.1)
+    args = parser.parse_args()
+
+    servidor, _, url = iniciar_stubs(
+        args.puerto, owm_latencia=args.owm_latencia, gemini_latencia=args.gemini_latencia,
+        gemini_tokens=args.gemini_tokens, paypal_latencia=args.paypal_latencia
+    )
+    print(f"Stubs escuchando en {url} (Ctrl+C para terminar)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
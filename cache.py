@@ -0,0 +1,239 @@
+# cache.py - Caché TTL con LRU acotado, stale-while-revalidate y coalescencia de cargas
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalizar_clave(texto):
+    """
+    Normaliza un texto libre (ej. nombre de ciudad) para usarlo como clave de caché:
+    sin acentos, en minúsculas y con los espacios colapsados.
+    """
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.lower().split())
+
+
+class _Entrada:
+    __slots__ = ('valor', 'fresco_hasta', 'caduca', 'hits')
+
+    def __init__(self, valor, fresco_hasta, caduca):
+        self.valor = valor
+        self.fresco_hasta = fresco_hasta
+        self.caduca = caduca
+        self.hits = 0
+
+
+class _Vuelo:
+    """Carga en curso para una clave; los pedidos concurrentes esperan su resultado."""
+    __slots__ = ('evento', 'valor', 'error')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+
+class RedisBackend:
+    """
+    Backend compartido opcional (Redis) para que todos los workers de gunicorn
+    compartan los aciertos. Los valores se guardan como JSON.
+    """
+
+    def __init__(self, url, prefijo):
+        import redis  # Dependencia opcional: solo se importa si se configura REDIS_URL
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._prefijo = prefijo
+
+    def get(self, clave):
+        crudo = self._redis.get(self._prefijo + clave)
+        return json.loads(crudo) if crudo is not None else None
+
+    def set(self, clave, sobre, ttl):
+        self._redis.set(self._prefijo + clave, json.dumps(sobre), ex=max(1, int(ttl)))
+
+
+class TTLCache:
+    """
+    Caché en proceso con:
+    - TTL configurable y expulsión LRU con un máximo de entradas,
+    - stale-while-revalidate: durante 'stale_ttl' segundos después de vencer se sirve
+      el valor viejo mientras se refresca en segundo plano,
+    - single-flight: N pedidos concurrentes para la misma clave provocan una sola carga,
+    - backend compartido opcional (ver RedisBackend) como segundo nivel,
+    - lectura de valores ya vencidos (get_vencido) para responder cuando el upstream falla.
+    """
+
+    def __init__(self, nombre, ttl, max_entradas=1024, stale_ttl=0, backend=None):
+        self.nombre = nombre
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entradas = max_entradas
+        self.backend = backend
+        self._entradas = OrderedDict()
+        self._vuelos = {}
+        self._lock = threading.Lock()
+        self._contadores = {
+            'hits': 0, 'misses': 0, 'stale_hits': 0, 'backend_hits': 0,
+            'cargas': 0, 'coalescidos': 0, 'expulsiones': 0, 'errores_backend': 0, 'vencidos_servidos': 0,
+        }
+
+    # --- API pública ---
+    def obtener(self, clave, cargar, cacheable=None):
+        """
+        Devuelve el valor para 'clave', llamando a cargar() solo si hace falta.
+        'cacheable(valor)' decide si el resultado de la carga se guarda (ej. no guardar errores).
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.caduca > ahora:
+                self._entradas.move_to_end(clave)
+                entrada.hits += 1
+                if entrada.fresco_hasta > ahora:
+                    self._contadores['hits'] += 1
+                    return entrada.valor
+                # Valor vencido pero dentro de la ventana stale: se sirve y se refresca aparte
+                self._contadores['stale_hits'] += 1
+                if clave not in self._vuelos:
+                    self._vuelos[clave] = _Vuelo()
+                    threading.Thread(
+                        target=self._refrescar, args=(clave, cargar, cacheable), daemon=True
+                    ).start()
+                return entrada.valor
+
+        valor = self._leer_backend(clave, ahora)
+        if valor is not None:
+            return valor
+
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is None:
+                self._vuelos[clave] = _Vuelo()
+                self._contadores['misses'] += 1
+                lider = True
+            else:
+                self._contadores['coalescidos'] += 1
+                lider = False
+
+        if lider:
+            return self._cargar_como_lider(clave, cargar, cacheable)
+        vuelo.evento.wait()
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.valor
+
+    def get(self, clave):
+        """Devuelve el valor fresco para 'clave' o None, sin cargar."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.fresco_hasta > ahora:
+                self._entradas.move_to_end(clave)
+                entrada.hits += 1
+                self._contadores['hits'] += 1
+                return entrada.valor
+            self._contadores['misses'] += 1
+        return None
+
+    def get_vencido(self, clave, max_vencido):
+        """
+        Devuelve el valor para 'clave' aunque ya no sea fresco, si venció hace menos de 'max_vencido'
+        segundos (o None). Es para responder algo cuando el upstream no está disponible.
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.fresco_hasta + max_vencido > time.time():
+                self._contadores['vencidos_servidos'] += 1
+                return entrada.valor
+        return None
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        ahora = time.time()
+        self._guardar(clave, valor, ahora + ttl, ahora + ttl + self.stale_ttl)
+        self._escribir_backend(clave, valor, ahora + ttl, ahora + ttl + self.stale_ttl)
+
+    def populares(self, n=10):
+        """Las 'n' entradas con más aciertos (clave y número de hits), para ver qué se reutiliza."""
+        with self._lock:
+            entradas = sorted(self._entradas.items(), key=lambda item: item[1].hits, reverse=True)[:n]
+            return [{'clave': clave, 'hits': entrada.hits} for clave, entrada in entradas]
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['entradas'] = len(self._entradas)
+        consultas = datos['hits'] + datos['stale_hits'] + datos['backend_hits'] + datos['misses']
+        datos['hit_ratio'] = round((consultas - datos['misses']) / consultas, 4) if consultas else 0.0
+        datos['backend'] = type(self.backend).__name__ if self.backend else None
+        return datos
+
+    # --- Internos ---
+    def _cargar_como_lider(self, clave, cargar, cacheable):
+        with self._lock:
+            vuelo = self._vuelos[clave]
+            self._contadores['cargas'] += 1
+        try:
+            valor = cargar()
+            if cacheable is None or cacheable(valor):
+                self.set(clave, valor)
+            vuelo.valor = valor
+            return valor
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                self._vuelos.pop(clave, None)
+            vuelo.evento.set()
+
+    def _refrescar(self, clave, cargar, cacheable):
+        # Refresco en segundo plano: si falla se sigue sirviendo el valor viejo hasta que caduque
+        try:
+            self._cargar_como_lider(clave, cargar, cacheable)
+        except Exception:
+            pass
+
+    def _guardar(self, clave, valor, fresco_hasta, caduca):
+        with self._lock:
+            self._entradas[clave] = _Entrada(valor, fresco_hasta, caduca)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._contadores['expulsiones'] += 1
+
+    def _leer_backend(self, clave, ahora):
+        if self.backend is None:
+            return None
+        try:
+            sobre = self.backend.get(clave)
+        except Exception:
+            with self._lock:
+                self._contadores['errores_backend'] += 1
+            return None
+        if not sobre or sobre['fresco_hasta'] <= ahora:
+            return None
+        self._guardar(clave, sobre['valor'], sobre['fresco_hasta'], sobre['caduca'])
+        with self._lock:
+            self._contadores['backend_hits'] += 1
+        return sobre['valor']
+
+    def _escribir_backend(self, clave, valor, fresco_hasta, caduca):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(
+                clave,
+                {'valor': valor, 'fresco_hasta': fresco_hasta, 'caduca': caduca},
+                caduca - time.time()
+            )
+        except Exception:
+            with self._lock:
+                self._contadores['errores_backend'] += 1
@@ -0,0 +1,208 @@
+# ciudades.py - Índice local de ciudades: normalización, autocompletado por prefijo e ids de OpenWeatherMap
+import gzip
+import json
+import os
+from array import array
+from bisect import bisect_left
+
+from cache import normalizar_clave
+
+CITY_INDEX_FILE = os.getenv("CITY_INDEX_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "ciudades.tsv"))
+COLUMNAS = ("id", "nombre", "pais", "lat", "lon", "poblacion", "alias")
+
+
+class _Textos:
+    """
+    Lista de textos guardada como un solo bloque UTF-8 más un array de offsets:
+    unos pocos bytes por entrada en lugar de un objeto str por entrada.
+    """
+
+    def __init__(self, textos):
+        self._offsets = array('I', [0])
+        partes = []
+        for texto in textos:
+            crudo = texto.encode('utf-8')
+            partes.append(crudo)
+            self._offsets.append(self._offsets[-1] + len(crudo))
+        self._bloque = b''.join(partes)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self.crudo(i).decode('utf-8')
+
+    def crudo(self, i):
+        return self._bloque[self._offsets[i]:self._offsets[i + 1]]
+
+    def bytes(self):
+        return len(self._bloque) + self._offsets.itemsize * len(self._offsets)
+
+
+class IndiceCiudades:
+    """
+    Ciudades conocidas (nombre, país, coordenadas e id de OpenWeatherMap) en arrays paralelos,
+    más un índice ordenado de claves normalizadas (nombre y alias, sin acentos ni mayúsculas)
+    para resolver un texto libre a un id y autocompletar por prefijo con bisect.
+    """
+
+    def __init__(self, filas):
+        filas = sorted(filas, key=lambda fila: -fila['poblacion'])
+        self.ids = array('I', (fila['id'] for fila in filas))
+        self.lat = array('f', (fila['lat'] for fila in filas))
+        self.lon = array('f', (fila['lon'] for fila in filas))
+        self.poblacion = array('I', (fila['poblacion'] for fila in filas))
+        self.nombres = _Textos(fila['nombre'] for fila in filas)
+        self.paises = ''.join((fila['pais'] or '--')[:2].upper() for fila in filas)
+        # ids ordenados (y la fila de cada uno) para buscar por id con bisect sin un dict de 200k entradas
+        orden = sorted(range(len(filas)), key=lambda i: self.ids[i])
+        self._ids_ordenados = array('I', (self.ids[i] for i in orden))
+        self._filas_por_id = array('I', orden)
+
+        # Las filas ya van de mayor a menor población: para una misma clave gana la ciudad más grande
+        claves = sorted(
+            {(clave, i) for i, fila in enumerate(filas)
+             for clave in {normalizar_clave(nombre) for nombre in [fila['nombre']] + fila['alias']} if clave},
+        )
+        self.claves = _Textos(clave for clave, _ in claves)
+        self.filas_clave = array('I', (i for _, i in claves))
+        self._claves_crudas = _Crudos(self.claves)
+
+    @classmethod
+    def desde_archivo(cls, ruta=None):
+        """Carga el TSV (ver COLUMNAS); si no existe, el índice queda vacío."""
+        ruta = ruta or CITY_INDEX_FILE
+        if not os.path.exists(ruta):
+            return cls([])
+        with open(ruta, encoding='utf-8') as archivo:
+            return cls(leer_tsv(archivo))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def ciudad(self, i):
+        return {
+            "id": self.ids[i], "nombre": self.nombres[i], "pais": self.paises[2 * i:2 * i + 2],
+            "lat": round(self.lat[i], 4), "lon": round(self.lon[i], 4),
+        }
+
+    def por_id(self, ciudad_id):
+        i = self._fila_por_id(ciudad_id)
+        return None if i is None else self.ciudad(i)
+
+    def resolver(self, texto):
+        """
+        Id de OpenWeatherMap para un nombre ('Cordoba', 'córdoba, es', 'Ciudad de México') o None.
+        Con un código de país al final (como en el q= de OpenWeatherMap) desambigua entre homónimas;
+        sin él gana la de mayor población.
+        """
+        texto = (texto or '').strip()
+        if texto.isdigit():
+            return int(texto) if self._fila_por_id(int(texto)) is not None else None
+        nombre, _, pais = texto.rpartition(',')
+        pais = pais.strip().upper()
+        if not nombre or len(pais) != 2:
+            nombre, pais = texto, None
+        clave = normalizar_clave(nombre)
+        if not clave:
+            return None
+        for i in self._filas_con_prefijo(clave, exacta=True):
+            if pais is None or self.paises[2 * i:2 * i + 2] == pais:
+                return self.ids[i]
+        return None
+
+    def autocompletar(self, prefijo, limite=10):
+        """Hasta 'limite' ciudades cuyo nombre o alias empieza con 'prefijo', las más pobladas primero."""
+        clave = normalizar_clave(prefijo)
+        if not clave:
+            return []
+        # Se revisa un tope de candidatas para que un prefijo de una letra siga siendo O(log n + k)
+        candidatas = set()
+        for i in self._filas_con_prefijo(clave):
+            candidatas.add(i)
+            if len(candidatas) >= limite * 10:
+                break
+        return [self.ciudad(i) for i in sorted(candidatas, key=lambda i: -self.poblacion[i])[:limite]]
+
+    def stats(self):
+        return {
+            "ciudades": len(self), "claves": len(self.claves),
+            "memoria_kb": round((self.claves.bytes() + self.nombres.bytes() + len(self.paises)
+                                 + sum(a.itemsize * len(a) for a in (self.ids, self.lat, self.lon, self.poblacion,
+                                                                      self.filas_clave, self._ids_ordenados,
+                                                                      self._filas_por_id))) / 1024, 1),
+        }
+
+    def _fila_por_id(self, ciudad_id):
+        posicion = bisect_left(self._ids_ordenados, ciudad_id)
+        if posicion < len(self._ids_ordenados) and self._ids_ordenados[posicion] == ciudad_id:
+            return self._filas_por_id[posicion]
+        return None
+
+    def _filas_con_prefijo(self, clave, exacta=False):
+        # Se compara en bytes: el orden de UTF-8 es el mismo que el de los textos y no hay que decodificar
+        clave = clave.encode('utf-8')
+        posicion = bisect_left(self._claves_crudas, clave)
+        while posicion < len(self.claves):
+            actual = self.claves.crudo(posicion)
+            if not actual.startswith(clave) or (exacta and actual != clave):
+                return
+            yield self.filas_clave[posicion]
+            posicion += 1
+
+
+class _Crudos:
+    """Vista en bytes de un _Textos, para bisect."""
+
+    def __init__(self, textos):
+        self._textos = textos
+
+    def __len__(self):
+        return len(self._textos)
+
+    def __getitem__(self, i):
+        return self._textos.crudo(i)
+
+
+def leer_tsv(lineas):
+    """Filas del TSV de ciudades (con encabezado). Los alias van separados por '|'."""
+    filas = []
+    for numero, linea in enumerate(lineas):
+        if numero == 0 or not linea.strip() or linea.startswith('#'):
+            continue
+        campos = linea.rstrip('\n').split('\t') + [''] * len(COLUMNAS)
+        filas.append({
+            "id": int(campos[0]), "nombre": campos[1], "pais": campos[2],
+            "lat": float(campos[3] or 0), "lon": float(campos[4] or 0),
+            "poblacion": int(campos[5] or 0), "alias": [a for a in campos[6].split('|') if a],
+        })
+    return filas
+
+
+def escribir_tsv(filas, archivo):
+    archivo.write('\t'.join(COLUMNAS) + '\n')
+    for fila in sorted(filas, key=lambda fila: fila['id']):
+        archivo.write('\t'.join([
+            str(fila['id']), fila['nombre'], fila['pais'], f"{fila['lat']:.4f}", f"{fila['lon']:.4f}",
+            str(fila['poblacion']), '|'.join(fila['alias'])
+        ]) + '\n')
+
+
+def importar_lista_owm(ruta, existentes=()):
+    """
+    Convierte la lista oficial de OpenWeatherMap (city.list.json o .json.gz) en filas del TSV.
+    Conserva población y alias de las filas 'existentes' con el mismo id (la lista de OWM no los trae).
+    """
+    abrir = gzip.open if ruta.endswith('.gz') else open
+    with abrir(ruta, 'rt', encoding='utf-8') as archivo:
+        ciudades = json.load(archivo)
+    previas = {fila['id']: fila for fila in existentes}
+    filas = []
+    for ciudad in ciudades:
+        previa = previas.get(ciudad['id'], {})
+        filas.append({
+            "id": ciudad['id'], "nombre": ciudad['name'].replace('\t', ' '), "pais": ciudad.get('country', ''),
+            "lat": ciudad['coord']['lat'], "lon": ciudad['coord']['lon'],
+            "poblacion": previa.get('poblacion', 0), "alias": previa.get('alias', []),
+        })
+    return filas
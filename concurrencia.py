@@ -0,0 +1,62 @@
+# concurrencia.py - Modo de servicio con gevent y trabajo de CPU fuera del event loop
+#
+# Con `gunicorn -c gunicorn.conf.py app:app` (worker gevent) los sockets quedan parcheados: las llamadas
+# a OpenWeatherMap, Gemini (httpx) y PayPal (requests) ceden el control mientras esperan la red, así
+# un proceso mantiene miles de llamadas lentas en curso sin un hilo por cada una.
+# Lo que sí consume CPU (bcrypt, PIL) tiene que ir a hilos del sistema para no frenar a todos los demás.
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def modo_gevent():
+    """True si el proceso corre con los sockets parcheados por gevent (worker gevent de gunicorn)."""
+    monkey = sys.modules.get('gevent.monkey')
+    return bool(monkey and monkey.is_module_patched('socket'))
+
+
+def crear_ejecutor(max_workers, nombre):
+    """ThreadPoolExecutor con hilos del sistema también bajo gevent (donde 'threading' son greenlets)."""
+    if modo_gevent():
+        from gevent.threadpool import ThreadPoolExecutor as EjecutorNativo
+        return EjecutorNativo(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=nombre)
+
+
+def en_hilo_nativo(funcion, *args):
+    """
+    Bajo gevent corre 'funcion' en el threadpool nativo del hub y espera sin bloquear el loop;
+    sin gevent la llama directamente (ya estamos en un hilo del servidor).
+    """
+    if not modo_gevent():
+        return funcion(*args)
+    import gevent
+    return gevent.get_hub().threadpool.apply(funcion, args)
+
+
+def preparar_psycopg_para_gevent():
+    """
+    Hace cooperativas las consultas de psycopg2 (lo mismo que psycogreen): mientras PostgreSQL
+    responde, el greenlet cede el control en lugar de bloquear el proceso entero.
+    """
+    if not modo_gevent():
+        return False
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    from gevent.socket import wait_read, wait_write
+
+    def esperar(conexion, timeout=None):
+        while True:
+            estado = conexion.poll()
+            if estado == extensions.POLL_OK:
+                break
+            elif estado == extensions.POLL_READ:
+                wait_read(conexion.fileno(), timeout=timeout)
+            elif estado == extensions.POLL_WRITE:
+                wait_write(conexion.fileno(), timeout=timeout)
+            else:
+                raise extensions.OperationalError(f"Estado de poll inesperado: {estado!r}")
+
+    extensions.set_wait_callback(esperar)
+    return True
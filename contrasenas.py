@@ -0,0 +1,158 @@
+# contrasenas.py - Hash de contraseñas (bcrypt) en un pool acotado, con costo calibrado y rehash al iniciar sesión
+import math
+import threading
+import time
+from collections import deque
+
+from concurrencia import crear_ejecutor
+from metrics import percentil
+
+# Costo con el que se mide la calibración: rápido (~15 ms) y suficiente para extrapolar
+_COSTO_MEDICION = 8
+
+
+class HashSaturado(Exception):
+    """Hay demasiados hashes esperando: la request se rechaza (503) en vez de encolarse sin límite."""
+
+
+def _ms(segundos):
+    # percentil() da None sin muestras (ej. antes del primer login): se deja None, como en jobs.py
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def costo_de(hash_guardado):
+    """Costo (log2 de las rondas) de un hash bcrypt '$2b$12$...', o None si no tiene ese formato."""
+    try:
+        return int(hash_guardado.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class Contrasenas:
+    """
+    Genera y verifica hashes bcrypt en un pool de 'workers' hilos del sistema (también bajo gevent).
+    bcrypt libera el GIL, así que el pool es lo que limita cuántos núcleos se lleva una tanda de logins:
+    el resto de las requests conserva CPU. Con más de 'max_pendientes' hashes esperando se lanza
+    HashSaturado en lugar de acumular requests que igual terminarían por timeout.
+
+    El costo se calibra una vez por proceso para que un hash tarde alrededor de 'objetivo_ms'
+    (acotado a [costo_min, costo_max]); 'costo' lo fija sin calibrar. necesita_rehash() dice si un hash
+    guardado se aleja del costo ideal, para regenerarlo al iniciar sesión con la contraseña en la mano.
+    """
+
+    def __init__(self, bcrypt, workers=2, max_pendientes=64, objetivo_ms=250, costo=None,
+                 costo_min=10, costo_max=14, muestras=500):
+        self._bcrypt = bcrypt
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.objetivo_ms = objetivo_ms
+        self.costo_min = costo_min
+        self.costo_max = costo_max
+        self._costo_ideal = float(costo) if costo else None
+        self._ejecutor = None
+        self._lock = threading.Lock()
+        self._calibracion_lock = threading.Lock()
+        self._pendientes = 0
+        self._en_curso = 0
+        self._contadores = {'hashes': 0, 'verificaciones': 0, 'rehashes': 0, 'rechazados': 0}
+        self._espera = deque(maxlen=muestras)
+        self._ejecucion = deque(maxlen=muestras)
+
+    # --- API pública ---
+    @property
+    def costo(self):
+        """Costo entero con el que se generan los hashes nuevos."""
+        return round(self.costo_ideal)
+
+    @property
+    def costo_ideal(self):
+        # Sin redondear: sirve para no regenerar hashes que quedan justo en el límite entre dos costos
+        if self._costo_ideal is None:
+            self.calibrar()
+        return self._costo_ideal
+
+    def calibrar(self):
+        """Mide el costo de un hash en esta máquina y elige el que más se acerca a objetivo_ms."""
+        with self._calibracion_lock:
+            if self._costo_ideal is None:
+                medido_ms = min(self._medir(_COSTO_MEDICION) for _ in range(3))
+                # Cada punto de costo duplica las rondas (y el tiempo)
+                ideal = _COSTO_MEDICION + math.log2(self.objetivo_ms / max(medido_ms, 0.01))
+                self._costo_ideal = min(max(ideal, self.costo_min), self.costo_max)
+        return self._costo_ideal
+
+    def calibrar_en_segundo_plano(self):
+        # Al arrancar, sin demorar el import: el primer login ya encuentra el costo calculado.
+        # No es daemon: cortar bcrypt a mitad de un hash al salir el intérprete aborta el proceso
+        threading.Thread(target=self.calibrar, name="bcrypt-calibracion").start()
+
+    def generar(self, password):
+        return self._en_pool('hashes', self._generar, password)
+
+    def verificar(self, hash_guardado, password):
+        return self._en_pool('verificaciones', self._bcrypt.check_password_hash, hash_guardado, password)
+
+    def necesita_rehash(self, hash_guardado):
+        # Margen de 0.75: con un ideal de 11.5 valen 11 y 12, y con uno fijo (ej. 12) solo 12
+        costo = costo_de(hash_guardado)
+        return costo is None or abs(costo - self.costo_ideal) > 0.75
+
+    def rehash(self, password):
+        nuevo = self.generar(password)
+        with self._lock:
+            self._contadores['rehashes'] += 1
+        return nuevo
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['pendientes'] = self._pendientes - self._en_curso
+            datos['en_curso'] = self._en_curso
+            espera, ejecucion = list(self._espera), list(self._ejecucion)
+        datos['workers'] = self.workers
+        datos['costo'] = round(self._costo_ideal) if self._costo_ideal is not None else None
+        datos['costo_ideal'] = round(self._costo_ideal, 2) if self._costo_ideal is not None else None
+        datos['objetivo_ms'] = self.objetivo_ms
+        datos['espera_p50_ms'] = _ms(percentil(espera, 50))
+        datos['espera_p95_ms'] = _ms(percentil(espera, 95))
+        datos['ejecucion_p50_ms'] = _ms(percentil(ejecucion, 50))
+        datos['ejecucion_p95_ms'] = _ms(percentil(ejecucion, 95))
+        return datos
+
+    # --- Internos ---
+    def _generar(self, password):
+        return self._bcrypt.generate_password_hash(password, self.costo).decode('utf-8')
+
+    def _medir(self, costo):
+        inicio = time.perf_counter()
+        self._bcrypt.generate_password_hash('calibracion', costo)
+        return (time.perf_counter() - inicio) * 1000
+
+    def _en_pool(self, operacion, funcion, *args):
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                self._contadores['rechazados'] += 1
+                raise HashSaturado()
+            self._pendientes += 1
+            self._contadores[operacion] += 1
+            if self._ejecutor is None:
+                self._ejecutor = crear_ejecutor(self.workers, "bcrypt")
+        encolado = time.monotonic()
+
+        def ejecutar():
+            inicio = time.monotonic()
+            with self._lock:
+                self._en_curso += 1
+                self._espera.append(inicio - encolado)
+            try:
+                return funcion(*args)
+            finally:
+                with self._lock:
+                    self._en_curso -= 1
+                    self._ejecucion.append(time.monotonic() - inicio)
+
+        try:
+            return self._ejecutor.submit(ejecutar).result()
+        finally:
+            with self._lock:
+                self._pendientes -= 1
@@ -0,0 +1,93 @@
+# cuotas.py - Cuotas del plan gratuito con un único UPDATE condicional por consumo
+import datetime as dt
+import os
+
+from sqlalchemy import case, func, or_, update
+
+AI_QUOTA_PERIOD = os.getenv("AI_QUOTA_PERIOD", "month")  # month, week, day o lifetime
+LIMITES_FREE = {
+    'outfit': int(os.getenv("AI_OUTFIT_FREE_LIMIT", "3")),
+    'travel': int(os.getenv("AI_TRAVEL_FREE_LIMIT", "1")),
+}
+# recurso -> (columna de usos, columna del período al que corresponden esos usos)
+COLUMNAS = {
+    'outfit': ('ai_outfit_uses', 'ai_outfit_period'),
+    'travel': ('ai_travel_uses', 'ai_travel_period'),
+}
+TEXTO_PERIODO = {'month': ' este mes', 'week': ' esta semana', 'day': ' hoy', 'lifetime': ''}
+
+
+def periodo_actual(ahora=None):
+    ahora = ahora or dt.datetime.utcnow()
+    if AI_QUOTA_PERIOD == 'day':
+        return ahora.strftime('%Y-%m-%d')
+    if AI_QUOTA_PERIOD == 'week':
+        anio, semana, _ = ahora.isocalendar()
+        return f"{anio}-W{semana:02d}"
+    if AI_QUOTA_PERIOD == 'lifetime':
+        return 'total'
+    return ahora.strftime('%Y-%m')
+
+
+class Cuotas:
+    """
+    Consume y devuelve usos del plan gratuito directamente en la tabla de usuarios.
+    El control y el incremento van en el mismo UPDATE condicional, así dos requests concurrentes
+    nunca pueden pasar ambas el límite, y se evita leer, comparar y escribir en viajes separados.
+    """
+
+    def __init__(self, db, tabla):
+        self.db = db
+        self.tabla = tabla
+
+    def consumir(self, user_id, recurso, limite):
+        """
+        Intenta consumir un uso de 'recurso' en el período actual.
+        Retorna (ok, usos_en_el_periodo, periodo). Si cambió el período, el contador vuelve a 1.
+        """
+        usos, periodo = self._columnas(recurso)
+        actual = periodo_actual()
+        sentencia = (
+            update(self.tabla)
+            .where(self.tabla.c.id == user_id)
+            .where(or_(periodo.is_(None), periodo != actual, func.coalesce(usos, 0) < limite))
+            .values({
+                usos: case((periodo == actual, func.coalesce(usos, 0) + 1), else_=1),
+                periodo: actual
+            })
+        )
+        if self.db.engine.dialect.update_returning:
+            fila = self.db.session.execute(sentencia.returning(usos)).first()
+            self.db.session.commit()
+            return (True, fila[0], actual) if fila else (False, limite, actual)
+
+        # Sin RETURNING: alcanza con el número de filas afectadas
+        afectadas = self.db.session.execute(sentencia).rowcount
+        self.db.session.commit()
+        if not afectadas:
+            return False, limite, actual
+        return True, self.db.session.execute(
+            self.tabla.select().with_only_columns(usos).where(self.tabla.c.id == user_id)
+        ).scalar(), actual
+
+    def devolver(self, user_id, recurso, periodo_consumo):
+        """Devuelve un uso (ej. si falló la llamada a Gemini). No hace nada si ya cambió el período."""
+        usos, periodo = self._columnas(recurso)
+        self.db.session.execute(
+            update(self.tabla)
+            .where(self.tabla.c.id == user_id, periodo == periodo_consumo, usos > 0)
+            .values({usos: usos - 1})
+        )
+        self.db.session.commit()
+
+    def _columnas(self, recurso):
+        usos, periodo = COLUMNAS[recurso]
+        return self.tabla.c[usos], self.tabla.c[periodo]
+
+
+def usos_vigentes(user, recurso):
+    """Usos del período actual según la fila cargada (0 si los usos guardados son de un período anterior)."""
+    usos, periodo = COLUMNAS[recurso]
+    if getattr(user, periodo) != periodo_actual():
+        return 0
+    return getattr(user, usos) or 0
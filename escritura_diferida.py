@@ -0,0 +1,140 @@
+# escritura_diferida.py - Escritura diferida (write-behind) de filas a la base en lotes
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+
+from metrics import log_evento, percentil
+
+
+class EscrituraDiferida:
+    """
+    Cola acotada en memoria para filas que no hace falta escribir antes de responder
+    (ej. el historial de consultas de clima). Un hilo las junta y llama a 'insertar(filas)'
+    con un lote cuando se acumulan 'lote' filas o pasan 'intervalo' segundos desde la primera.
+
+    Contrapresión: si la cola está llena, 'registrar' espera hasta 'espera_max' segundos a que
+    se libere lugar y, si sigue llena, escribe esa fila en el momento, en el hilo que llama.
+    Así una base lenta frena a quien produce en lugar de perder filas o crecer sin límite.
+    Al terminar el proceso (atexit) se escribe lo que quede en la cola.
+    'tabla' solo se usa en los logs; 'log' recibe (nivel, evento, **campos) como _log() de app.py.
+    """
+
+    def __init__(self, insertar, lote=500, intervalo=0.5, max_pendientes=10000, espera_max=0.05,
+                 nombre="escritura-diferida", muestras=500, tabla=None, log=log_evento):
+        self._insertar = insertar
+        self.tabla = tabla
+        self._log = log
+        self.lote = lote
+        self.intervalo = intervalo
+        self.espera_max = espera_max
+        self.nombre = nombre
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()  # Un solo lote a la vez contra la base
+        self._detener = threading.Event()
+        self._hilo = None
+        self._contadores = {'encoladas': 0, 'sincronicas': 0, 'escritas': 0, 'fallidas': 0, 'lotes': 0}
+        self._tamanos = deque(maxlen=muestras)
+        self._duraciones = deque(maxlen=muestras)
+
+    def registrar(self, fila):
+        """Encola una fila. Devuelve False si hubo que escribirla en el momento (cola llena)."""
+        self._arrancar()
+        try:
+            self._cola.put(fila, timeout=self.espera_max)
+        except queue.Full:
+            with self._lock:
+                self._contadores['sincronicas'] += 1
+            self._escribir([fila], de_la_cola=False)
+            return False
+        with self._lock:
+            self._contadores['encoladas'] += 1
+        return True
+
+    def vaciar(self):
+        """
+        Escribe ya lo que está en la cola (en el hilo que llama) y espera el lote que tenga en mano
+        el hilo de fondo: al volver, todo lo registrado antes está en la base.
+        """
+        while True:
+            filas = self._tomar_disponibles()
+            if not filas:
+                break
+            self._escribir(filas)
+        if self._hilo is not None and self._hilo.is_alive():
+            self._cola.join()
+
+    def cerrar(self, timeout=10):
+        """Detiene el hilo y escribe lo que quede; se llama solo al terminar el proceso."""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+        self.vaciar()
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            tamanos, duraciones = list(self._tamanos), list(self._duraciones)
+        datos['profundidad'] = self._cola.qsize()
+        datos['lote_p50'] = percentil(tamanos, 50)
+        datos['escritura_p50_s'] = percentil(duraciones, 50)
+        datos['escritura_p95_s'] = percentil(duraciones, 95)
+        return datos
+
+    def _arrancar(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+            self._hilo.start()
+            atexit.register(self.cerrar)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                filas = [self._cola.get(timeout=self.intervalo)]
+            except queue.Empty:
+                continue
+            # El lote se cierra al llegar a 'lote' filas o al pasar 'intervalo' desde la primera
+            limite = time.monotonic() + self.intervalo
+            while len(filas) < self.lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    filas.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._escribir(filas)
+
+    def _tomar_disponibles(self):
+        filas = []
+        while len(filas) < self.lote:
+            try:
+                filas.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return filas
+
+    def _escribir(self, filas, de_la_cola=True):
+        inicio = time.perf_counter()
+        with self._escritura:
+            try:
+                self._insertar(filas)
+                resultado = 'escritas'
+            except Exception as e:
+                self._log("error", "query_log_flush_failed", cola=self.nombre, tabla=self.tabla, filas=len(filas),
+                          sincronica=not de_la_cola, error=str(e), tipo_error=type(e).__name__)
+                resultado = 'fallidas'
+        with self._lock:
+            self._contadores[resultado] += len(filas)
+            self._contadores['lotes'] += 1
+            self._tamanos.append(len(filas))
+            self._duraciones.append(time.perf_counter() - inicio)
+        if de_la_cola:
+            for _ in filas:
+                self._cola.task_done()
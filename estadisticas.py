@@ -0,0 +1,152 @@
+# estadisticas.py - Estadísticas de clima por usuario mantenidas en tablas de rollup
+#
+# Tres tablas acumulan las consultas de clima (Queries) por usuario: por ciudad, por semana y en total.
+# Cada lote del historial (ver _insertar_consultas en app.py) las actualiza en la misma transacción con un
+# upsert, así leer las estadísticas cuesta lo mismo con 10 o con 10 millones de consultas. reconstruir_rollups()
+# las recalcula desde la tabla cruda con GROUP BY en la base, por rangos de usuarios.
+import datetime as dt
+
+from sqlalchemy import Date, case, cast, delete, func, select
+
+# Nombre lógico -> tabla. Todas tienen consultas, temp_min, temp_max, temp_suma y ultima
+TABLAS_ROLLUP = {'ciudades': 'stats_ciudades', 'semanas': 'stats_semanas', 'usuarios': 'stats_usuarios'}
+# Columnas que identifican cada fila de cada rollup (su clave primaria)
+CLAVES = {'ciudades': ('user_id', 'ciudad'), 'semanas': ('user_id', 'semana'), 'usuarios': ('user_id',)}
+
+
+def semana_de(fecha):
+    """Lunes de la semana (ISO, en UTC) de 'fecha'."""
+    return fecha.date() - dt.timedelta(days=fecha.weekday())
+
+
+def agregar(filas):
+    """
+    Agrupa filas del historial ({user_id, ciudad, temperatura, timestamp}) en los tres rollups.
+    Retorna {nombre: [filas del rollup]} listas para upsert().
+    """
+    grupos = {nombre: {} for nombre in TABLAS_ROLLUP}
+    for fila in filas:
+        fecha = fila.get('timestamp') or dt.datetime.utcnow()
+        claves = {
+            'ciudades': (fila['user_id'], fila['ciudad']),
+            'semanas': (fila['user_id'], semana_de(fecha)),
+            'usuarios': (fila['user_id'],),
+        }
+        for nombre, clave in claves.items():
+            _acumular(grupos[nombre], clave, fila['temperatura'], fecha)
+    return {
+        nombre: [
+            dict(zip(CLAVES[nombre], clave), consultas=n, temp_min=minimo, temp_max=maximo, temp_suma=suma, ultima=ultima)
+            for clave, (n, minimo, maximo, suma, ultima) in sorted(grupos[nombre].items(), key=lambda item: item[0])
+        ]
+        for nombre in TABLAS_ROLLUP
+    }
+
+
+def _acumular(grupo, clave, temperatura, fecha):
+    actual = grupo.get(clave)
+    if actual is None:
+        grupo[clave] = [1, temperatura, temperatura, temperatura, fecha]
+        return
+    actual[0] += 1
+    actual[1] = min(actual[1], temperatura)
+    actual[2] = max(actual[2], temperatura)
+    actual[3] += temperatura
+    actual[4] = max(actual[4], fecha)
+
+
+def upsert(conexion, tabla, nombre, filas):
+    """
+    Suma 'filas' a las del rollup: INSERT ... ON CONFLICT DO UPDATE (PostgreSQL y SQLite) que acumula
+    conteo y suma y se queda con el mínimo, el máximo y la última fecha. Las filas van ordenadas por clave
+    para que dos workers que escriben a la vez no se bloqueen en orden cruzado.
+    """
+    if not filas:
+        return
+    if conexion.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    sentencia = insert(tabla)
+    nuevo, c = sentencia.excluded, tabla.c
+    conexion.execute(sentencia.on_conflict_do_update(index_elements=list(CLAVES[nombre]), set_={
+        'consultas': c.consultas + nuevo.consultas,
+        'temp_min': case((nuevo.temp_min < c.temp_min, nuevo.temp_min), else_=c.temp_min),
+        'temp_max': case((nuevo.temp_max > c.temp_max, nuevo.temp_max), else_=c.temp_max),
+        'temp_suma': c.temp_suma + nuevo.temp_suma,
+        'ultima': case((nuevo.ultima > c.ultima, nuevo.ultima), else_=c.ultima),
+    }), filas)
+
+
+def actualizar_rollups(conexion, tablas, filas):
+    """Suma un lote de filas del historial a los rollups (en la transacción de 'conexion')."""
+    for nombre, agregadas in agregar(filas).items():
+        upsert(conexion, tablas[nombre], nombre, agregadas)
+
+
+def _semana_sql(columna, dialecto):
+    # Lunes de la semana de 'columna', calculado por la base
+    if dialecto == 'postgresql':
+        return cast(func.date_trunc('week', columna), Date)
+    return func.date(columna, 'weekday 0', '-6 days')
+
+
+def _como_fecha(valor, tipo):
+    # SQLite devuelve las fechas calculadas (min/max, date()) como texto
+    if isinstance(valor, str):
+        return tipo.fromisoformat(valor) if tipo is dt.datetime else dt.date.fromisoformat(valor[:10])
+    return valor
+
+
+def _rango(columna, desde, hasta):
+    condiciones = []
+    if desde is not None:
+        condiciones.append(columna >= desde)
+    if hasta is not None:
+        condiciones.append(columna < hasta)
+    return condiciones
+
+
+def reconstruir_rollups(conexion, consultas, tablas, usuarios, desde=None, hasta=None):
+    """
+    Recalcula los rollups de los usuarios con desde <= user_id < hasta (todos si no se indican) desde la
+    tabla cruda 'consultas': borra sus filas y las vuelve a escribir agregando con GROUP BY en la base.
+    Retorna cuántas filas de rollup escribió.
+
+    Un lote del historial que se escribe a la vez actualiza la fila del usuario en 'usuarios' (su versión del
+    historial) antes de sumar a los rollups. Por eso, bloquear primero esas filas (SELECT ... FOR UPDATE)
+    serializa la reconstrucción con los lotes de esos usuarios:
+    - un lote que ya pasó por 'usuarios' termina antes y sus consultas entran en el GROUP BY;
+    - uno que llega después espera y suma sobre lo reconstruido.
+    Sin el bloqueo, un lote que crea una clave nueva (ej. la primera consulta de una semana) entre el DELETE y el
+    INSERT lo haría fallar por clave duplicada. En SQLite no hace falta: la transacción toma el lock de escritura
+    de toda la base con el DELETE.
+    """
+    if conexion.dialect.name == 'postgresql':
+        conexion.execute(select(usuarios.c.id).where(*_rango(usuarios.c.id, desde, hasta)).with_for_update())
+    for tabla in tablas.values():
+        conexion.execute(delete(tabla).where(*_rango(tabla.c.user_id, desde, hasta)))
+
+    temperatura, fecha = consultas.c.temperatura, consultas.c.timestamp
+    agregados = (
+        func.count().label('consultas'), func.min(temperatura).label('temp_min'),
+        func.max(temperatura).label('temp_max'), func.sum(temperatura).label('temp_suma'),
+        func.max(fecha).label('ultima'),
+    )
+    claves = {
+        'ciudades': (consultas.c.user_id, consultas.c.ciudad.label('ciudad')),
+        'semanas': (consultas.c.user_id, _semana_sql(fecha, conexion.dialect.name).label('semana')),
+        'usuarios': (consultas.c.user_id,),
+    }
+    escritas = 0
+    for nombre, columnas in claves.items():
+        consulta = select(*columnas, *agregados).where(*_rango(consultas.c.user_id, desde, hasta)).group_by(*columnas)
+        filas = [
+            dict(fila._mapping, ultima=_como_fecha(fila.ultima, dt.datetime),
+                 **({'semana': _como_fecha(fila.semana, dt.date)} if nombre == 'semanas' else {}))
+            for fila in conexion.execute(consulta)
+        ]
+        if filas:
+            conexion.execute(tablas[nombre].insert(), filas)
+        escritas += len(filas)
+    return escritas
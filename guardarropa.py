@@ -0,0 +1,137 @@
+# guardarropa.py - Guardarropa por usuario direccionado por contenido (hash exacto + hash perceptual)
+import datetime as dt
+import hashlib
+import io
+import os
+import threading
+
+from sqlalchemy import delete, select, update
+
+WARDROBE_MAX_ITEMS = int(os.getenv("WARDROBE_MAX_ITEMS", "200"))
+WARDROBE_PHASH_DISTANCE = int(os.getenv("WARDROBE_PHASH_DISTANCE", "6"))
+WARDROBE_TOUCH_SECONDS = int(os.getenv("WARDROBE_TOUCH_SECONDS", "3600"))
+
+
+def hash_contenido(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def hash_perceptual(contenido):
+    """
+    dHash de 64 bits: la foto en gris a 9x8 y un bit por cada par de píxeles vecinos.
+    Dos fotos de la misma prenda (otra compresión, otro tamaño) quedan a pocos bits de distancia.
+    """
+    from PIL import Image
+
+    imagen = Image.open(io.BytesIO(contenido))
+    imagen.draft('L', (64, 64))
+    pixeles = list(imagen.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for fila in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixeles[fila * 9 + col] > pixeles[fila * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def _distancia(phash_a, phash_b):
+    return bin(int(phash_a, 16) ^ int(phash_b, 16)).count('1')
+
+
+class Guardarropa:
+    """
+    Guarda, por usuario, la descripción que generó Gemini para cada foto de prenda, así las siguientes
+    consultas envían texto en vez de píxeles. Vive en la tabla 'tabla' (modelo Prendas en app.py), una fila
+    por sha256 de foto original: todos los workers la comparten y cada operación es una sola transacción.
+    Cada usuario guarda hasta 'max_prendas' fotos; al superarlas se expulsan las menos usadas (LRU).
+    El último uso se actualiza como mucho una vez cada 'refresco_s' segundos por prenda, no en cada acierto.
+    """
+
+    def __init__(self, db, tabla, max_prendas=WARDROBE_MAX_ITEMS, distancia_max=WARDROBE_PHASH_DISTANCE,
+                 refresco_s=WARDROBE_TOUCH_SECONDS):
+        self.db = db
+        self.tabla = tabla
+        self.max_prendas = max_prendas
+        self.distancia_max = distancia_max
+        self.refresco = dt.timedelta(seconds=refresco_s)
+        self._lock = threading.Lock()
+        self._contadores = {'hits_exactos': 0, 'hits_similares': 0, 'misses': 0, 'expulsiones': 0}
+
+    # --- API pública ---
+    def buscar(self, user_id, sha):
+        """Descripción de la prenda cuyo contenido original tiene este sha256, o None."""
+        c = self.tabla.c
+        with self.db.engine.begin() as conexion:
+            fila = conexion.execute(
+                select(c.descripcion, c.ultimo_uso).where(c.user_id == user_id, c.sha == sha)
+            ).first()
+            if fila is None:
+                return None
+            self._tocar(conexion, user_id, sha, fila.ultimo_uso)
+        self._contar('hits_exactos')
+        return fila.descripcion
+
+    def buscar_similar(self, user_id, sha, phash):
+        """
+        Busca una prenda casi idéntica por hash perceptual. Si la encuentra, guarda 'sha' con la misma
+        descripción para que la próxima vez la foto se resuelva sin decodificarla.
+        """
+        c = self.tabla.c
+        with self.db.engine.begin() as conexion:
+            for principal, phash_guardado, descripcion in conexion.execute(
+                select(c.sha, c.phash, c.descripcion).where(c.user_id == user_id)
+            ).all():
+                if _distancia(phash_guardado, phash) <= self.distancia_max:
+                    self._insertar(conexion, user_id, sha, phash_guardado, descripcion)
+                    self._tocar(conexion, user_id, principal, None)
+                    self._contar('hits_similares')
+                    return descripcion
+        self._contar('misses')
+        return None
+
+    def guardar(self, user_id, sha, phash, descripcion):
+        with self.db.engine.begin() as conexion:
+            self._insertar(conexion, user_id, sha, phash, descripcion)
+            self._expulsar(conexion, user_id)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._contadores)
+
+    # --- Internos ---
+    def _insertar(self, conexion, user_id, sha, phash, descripcion):
+        # INSERT ... ON CONFLICT DO UPDATE: dos workers que describen la misma foto a la vez no chocan
+        if conexion.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        sentencia = insert(self.tabla).values(
+            user_id=user_id, sha=sha, phash=phash, descripcion=descripcion, ultimo_uso=dt.datetime.utcnow()
+        )
+        conexion.execute(sentencia.on_conflict_do_update(
+            index_elements=['user_id', 'sha'],
+            set_={'phash': sentencia.excluded.phash, 'descripcion': sentencia.excluded.descripcion,
+                  'ultimo_uso': sentencia.excluded.ultimo_uso}
+        ))
+
+    def _tocar(self, conexion, user_id, sha, ultimo_uso):
+        # UPDATE condicional: solo si el último uso guardado tiene más de 'refresco' (o no se leyó)
+        ahora = dt.datetime.utcnow()
+        if ultimo_uso is not None and ahora - ultimo_uso < self.refresco:
+            return
+        c = self.tabla.c
+        conexion.execute(update(self.tabla).where(
+            c.user_id == user_id, c.sha == sha, c.ultimo_uso < ahora - self.refresco
+        ).values(ultimo_uso=ahora))
+
+    def _expulsar(self, conexion, user_id):
+        c = self.tabla.c
+        conservar = select(c.sha).where(c.user_id == user_id).order_by(c.ultimo_uso.desc()).limit(self.max_prendas)
+        expulsadas = conexion.execute(
+            delete(self.tabla).where(c.user_id == user_id, c.sha.not_in(conservar))
+        ).rowcount
+        if expulsadas:
+            self._contar('expulsiones', expulsadas)
+
+    def _contar(self, contador, valor=1):
+        with self._lock:
+            self._contadores[contador] += valor
@@ -10,6 +10,19 @@ import TravelAssistant from './TravelAssistant'; // --- NUEVO: Importar el compo
 import { LogoutIcon, StarIcon, WandIcon, RobotIcon } from './icons'; // Asegúrate de que WandIcon y RobotIcon estén importados
 import Spinner from './Spinner'; // Import the new Spinner component
 
+// Una página de GET /api/v1/outfits; la cabecera X-Next-Cursor indica que hay más (el backend pagina de a 50)
+async function fetchOutfitPage(baseUrl, token, cursor) {
+    const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+    const res = await fetch(`${baseUrl}/api/v1/outfits${query}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+    });
+    if (!res.ok) {
+        const errorText = await res.text();
+        throw new Error(`${res.status} ${errorText}`);
+    }
+    return { items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
 function MainView(props) {
     // Desestructurar las props para facilitar el uso y la lectura del código
     const {
@@ -52,6 +65,8 @@ function MainView(props) {
     // --- NUEVO: Outfit history state ---
     const [outfitHistory, setOutfitHistory] = useState([]);
     const [selectedOutfitIndex, setSelectedOutfitIndex] = useState(null);
+    const [historyCursor, setHistoryCursor] = useState(null);
+    const [isHistoryLoadingMore, setIsHistoryLoadingMore] = useState(false);
     // Modal state
     const [isModalOpen, setIsModalOpen] = useState(false);
     const [modalOutfit, setModalOutfit] = useState(null);
@@ -81,17 +96,10 @@ function MainView(props) {
                 return;
             }
             try {
-                const res = await fetch(`${API_BASE_URL}/api/v1/outfits`, {
-                    headers: { 'Authorization': `Bearer ${token}` }
-                });
-                if (res.ok) {
-                    const data = await res.json();
-                    setOutfitHistory(data);
-                    setSelectedOutfitIndex(data.length > 0 ? 0 : null);
-                } else {
-                    const errorText = await res.text();
-                    console.error('Failed to fetch outfit history:', res.status, errorText);
-                }
+                const { items, nextCursor } = await fetchOutfitPage(API_BASE_URL, token, null);
+                setOutfitHistory(items);
+                setHistoryCursor(nextCursor);
+                setSelectedOutfitIndex(items.length > 0 ? 0 : null);
             } catch (e) {
                 console.error('Error fetching outfit history:', e);
             }
@@ -99,6 +107,22 @@ function MainView(props) {
         fetchHistory();
     }, [user, aiOutfitConsejo]);
 
+    // "Cargar más": agrega la página siguiente del historial usando el cursor de la anterior
+    const handleLoadMoreHistory = async () => {
+        const token = localStorage.getItem('token');
+        if (!token || !historyCursor) return;
+        setIsHistoryLoadingMore(true);
+        try {
+            const { items, nextCursor } = await fetchOutfitPage(API_BASE_URL, token, historyCursor);
+            setOutfitHistory(prev => [...prev, ...items]);
+            setHistoryCursor(nextCursor);
+        } catch (e) {
+            console.error('Error fetching more outfit history:', e);
+        } finally {
+            setIsHistoryLoadingMore(false);
+        }
+    };
+
     // Función auxiliar para manejar el cambio de archivos en el input de tipo 'file'
     const handleFileChange = (event) => {
         setSelectedFiles(Array.from(event.target.files));
@@ -145,9 +169,26 @@ function MainView(props) {
     console.log('outfitHistory:', outfitHistory);
 
     // Handler to open modal with outfit details
-    const handleOpenModal = (outfit) => {
+    // The history list only carries id/city/date; the full advice is fetched when an item is opened
+    const handleOpenModal = async (outfit) => {
         setModalOutfit(outfit);
         setIsModalOpen(true);
+        if (outfit.advice) return;
+        try {
+            const token = localStorage.getItem('token');
+            const res = await fetch(`${API_BASE_URL}/api/v1/outfits/${outfit.id}`, {
+                headers: { 'Authorization': `Bearer ${token}` }
+            });
+            if (res.ok) {
+                const detail = await res.json();
+                setModalOutfit(detail);
+                setOutfitHistory(prev => prev.map(item => item.id === detail.id ? detail : item));
+            } else {
+                console.error('Failed to fetch outfit detail:', res.status);
+            }
+        } catch (e) {
+            console.error('Error fetching outfit detail:', e);
+        }
     };
     const handleCloseModal = () => {
         setIsModalOpen(false);
@@ -435,6 +476,15 @@ function MainView(props) {
                                 </li>
                             ))}
                         </ul>
+                        {historyCursor && (
+                            <button
+                                onClick={handleLoadMoreHistory}
+                                disabled={isHistoryLoadingMore}
+                                style={{...styles.upgradeButton, marginTop: '1rem', width: '100%', justifyContent: 'center'}}
+                            >
+                                {isHistoryLoadingMore ? 'Cargando...' : 'Cargar más'}
+                            </button>
+                        )}
                     </div>
                 </div>
             </div>
@@ -0,0 +1,19 @@
+# gunicorn.conf.py - Servidor de producción: gunicorn -c gunicorn.conf.py app:app
+#
+# Por defecto usa workers gevent: las requests que esperan a OpenWeatherMap, Gemini o PayPal no ocupan
+# un hilo cada una, así un worker mantiene cientos o miles de llamadas en curso (ver concurrencia.py).
+# GUNICORN_WORKER_CLASS=gthread vuelve al modelo de un hilo por request.
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+# Requests simultáneas por worker gevent
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+# Hilos por worker cuando worker_class=gthread
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Gemini puede tardar; el streaming SSE mantiene la conexión abierta mientras llegan fragmentos
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,112 @@
+# http_client.py - Cliente HTTP saliente compartido: pools keep-alive por host, timeouts y reintentos
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import VentanaLatencias, registrar_fase
+from resiliencia import recortar_timeout, restante
+
+# Respuestas que se reintentan (además de los errores de conexión y los timeouts)
+REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class ClienteHTTP:
+    """
+    Una requests.Session por host, con su propio pool de conexiones keep-alive, de modo que
+    las llamadas a OpenWeatherMap o PayPal reutilizan la conexión TLS en lugar de abrir una nueva.
+    Todas las llamadas llevan timeout y reintentos acotados con backoff exponencial
+    (errores de conexión, timeouts y respuestas 429/5xx), y registran su latencia por upstream.
+
+    Con un plazo de request activo (ver resiliencia.py) cada intento usa como mucho el tiempo que
+    queda y no se reintenta si no alcanza para esperar el backoff. Con 'disyuntores', cada upstream
+    tiene su circuit breaker: con el circuito abierto la llamada falla en el momento (CircuitoAbierto).
+
+    Los POST también se reintentan: usarlo solo con llamadas idempotentes
+    (ej. el token OAuth, o órdenes de PayPal con la cabecera PayPal-Request-Id).
+    """
+
+    def __init__(self, timeout=(3.05, 10), reintentos=2, backoff=0.3, conexiones_por_host=20, disyuntores=None):
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.conexiones_por_host = conexiones_por_host
+        self.disyuntores = disyuntores
+        self._sesiones = {}
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self.latencias = VentanaLatencias()
+
+    def get(self, upstream, url, **kwargs):
+        return self.request(upstream, 'GET', url, **kwargs)
+
+    def post(self, upstream, url, **kwargs):
+        return self.request(upstream, 'POST', url, **kwargs)
+
+    def request(self, upstream, metodo, url, **kwargs):
+        timeout = kwargs.pop('timeout', self.timeout)
+        # Sin plazo restante la llamada ni se intenta (y no cuenta como fallo del upstream)
+        recortar_timeout(timeout, upstream)
+        disyuntor = self.disyuntores[upstream] if self.disyuntores is not None else None
+        if disyuntor is not None:
+            disyuntor.verificar()
+        inicio = time.perf_counter()
+        resultado = 'error'
+        try:
+            respuesta = self._con_reintentos(upstream, metodo, url, timeout, kwargs)
+            resultado = str(respuesta.status_code)
+            return respuesta
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.latencias.registrar(upstream, duracion)
+            registrar_fase(upstream, duracion)
+            if disyuntor is not None:
+                # Los 4xx (salvo 429) son errores del pedido, no del upstream
+                disyuntor.registrar(resultado != 'error' and int(resultado) not in REINTENTABLES, duracion)
+            with self._lock:
+                contadores = self._contadores.setdefault(upstream, {})
+                contadores[resultado] = contadores.get(resultado, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            contadores = {upstream: dict(valores) for upstream, valores in self._contadores.items()}
+        latencias = self.latencias.resumen()
+        return {
+            upstream: {'respuestas': contadores.get(upstream, {}), 'latencia': latencias.get(upstream)}
+            for upstream in contadores
+        }
+
+    def _con_reintentos(self, upstream, metodo, url, timeout, kwargs):
+        import requests
+        sesion = self._sesion(url)
+        for intento in range(self.reintentos + 1):
+            respuesta, error = None, None
+            try:
+                respuesta = sesion.request(metodo, url, timeout=recortar_timeout(timeout, upstream), **kwargs)
+                if respuesta.status_code not in REINTENTABLES:
+                    return respuesta
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            espera = self.backoff * 2 ** intento
+            queda = restante()
+            if intento == self.reintentos or (queda is not None and queda <= espera):
+                break
+            time.sleep(espera)
+        if error is not None:
+            raise error
+        return respuesta
+
+    def _sesion(self, url):
+        partes = urlsplit(url)
+        host = f"{partes.scheme}://{partes.netloc}"
+        with self._lock:
+            sesion = self._sesiones.get(host)
+            if sesion is None:
+                # requests se importa con la primera sesión para no cargarlo al arrancar
+                import requests
+                from requests.adapters import HTTPAdapter
+                # Los reintentos los hace _con_reintentos, que conoce el plazo de la request
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.conexiones_por_host, max_retries=0)
+                sesion = requests.Session()
+                sesion.mount(host, adaptador)
+                self._sesiones[host] = sesion
+            return sesion
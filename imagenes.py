@@ -0,0 +1,54 @@
+# imagenes.py - Preprocesamiento de las fotos subidas antes de enviarlas a Gemini
+import io
+import os
+import threading
+
+from concurrencia import crear_ejecutor, modo_gevent
+
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG o WEBP
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+MIME_TYPE = MIME_TYPES[IMAGE_FORMAT]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def preprocesar_imagen(contenido, max_lado=None, calidad=None, formato=None):
+    """
+    Reduce una foto a 'max_lado' píxeles en su lado mayor y la re-codifica sin metadatos EXIF.
+    En JPEG usa el modo draft de PIL, que decodifica directamente a 1/2, 1/4 u 1/8 de la
+    resolución original, así una foto de 4000px nunca se descomprime entera en memoria.
+    """
+    from PIL import Image, ImageOps  # PIL se carga con la primera foto, no al arrancar
+
+    max_lado = max_lado or IMAGE_MAX_EDGE
+    imagen = Image.open(io.BytesIO(contenido))
+    imagen.draft('RGB', (max_lado, max_lado))
+    # Aplicamos la orientación del EXIF antes de descartarlo para que la foto no quede girada
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode != 'RGB':
+        imagen = imagen.convert('RGB')
+    imagen.thumbnail((max_lado, max_lado), Image.LANCZOS)
+
+    salida = io.BytesIO()
+    # Al no pasar 'exif' al guardar, la imagen resultante sale sin metadatos
+    imagen.save(salida, formato or IMAGE_FORMAT, quality=calidad or IMAGE_QUALITY, optimize=True)
+    return salida.getvalue()
+
+
+def preprocesar_imagenes(contenidos):
+    """
+    Preprocesa varias fotos en paralelo (PIL libera el GIL al decodificar y codificar).
+    Siempre en hilos del sistema, también bajo gevent, para no frenar el event loop.
+    """
+    global _executor
+    if len(contenidos) == 1 and not modo_gevent():
+        return [preprocesar_imagen(contenidos[0])]
+    with _executor_lock:
+        if _executor is None:
+            _executor = crear_ejecutor(IMAGE_WORKERS, "imagenes")
+    return list(_executor.map(preprocesar_imagen, contenidos))
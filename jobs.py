@@ -0,0 +1,117 @@
+# jobs.py - Cola acotada de trabajos en segundo plano para los endpoints de IA
+import queue
+import threading
+import time
+from collections import deque
+
+from metrics import log_evento, percentil
+
+
+class JobQueue:
+    """
+    Pool acotado de hilos que ejecuta trabajos identificados por su id.
+    El estado de cada trabajo vive en la base de datos (ver modelo Jobs en app.py);
+    la cola solo guarda ids, así que tras un reinicio basta con volver a encolar los pendientes.
+    'log' recibe (nivel, evento, **campos) como _log() de app.py.
+    """
+
+    def __init__(self, ejecutar, max_workers=4, max_pendientes=100, muestras=500, log=log_evento):
+        self._ejecutar = ejecutar
+        self._log = log
+        self._max_workers = max_workers
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._hilos = []
+        self._recuperacion = None
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self._contadores = {'encolados': 0, 'rechazados': 0, 'completados': 0, 'fallidos': 0, 'recuperados': 0}
+        self._espera = deque(maxlen=muestras)
+        self._ejecucion = deque(maxlen=muestras)
+
+    def encolar(self, job_id):
+        """Encola un trabajo. Devuelve False si la cola está llena."""
+        self._arrancar()
+        try:
+            self._cola.put_nowait((job_id, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._contadores['rechazados'] += 1
+            return False
+        with self._lock:
+            self._contadores['encolados'] += 1
+        return True
+
+    def hay_lugar(self):
+        """
+        False si la cola está llena (y lo cuenta como rechazo). Se consulta antes de consumir la cuota y
+        guardar el trabajo; encolar() puede igual devolver False si otro pedido ocupó el lugar entretanto.
+        """
+        if not self._cola.full():
+            return True
+        with self._lock:
+            self._contadores['rechazados'] += 1
+        return False
+
+    def recuperar_periodicamente(self, recuperar, intervalo):
+        """
+        Llama a recuperar() cada 'intervalo' segundos en un hilo aparte, para retomar trabajos que otro
+        worker dejó a medias (ej. se cayó durante la llamada a Gemini). Las llamadas siguientes no hacen nada.
+        """
+        with self._lock:
+            if self._recuperacion is not None:
+                return
+            self._recuperacion = threading.Thread(
+                target=self._bucle_recuperacion, args=(recuperar, intervalo), name="ai-job-recuperacion", daemon=True
+            )
+        self._recuperacion.start()
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['profundidad'] = self._cola.qsize()
+            datos['en_curso'] = self._en_curso
+            datos['workers'] = self._max_workers
+            espera, ejecucion = list(self._espera), list(self._ejecucion)
+        datos['espera_p50_s'] = percentil(espera, 50)
+        datos['espera_p95_s'] = percentil(espera, 95)
+        datos['ejecucion_p50_s'] = percentil(ejecucion, 50)
+        datos['ejecucion_p95_s'] = percentil(ejecucion, 95)
+        return datos
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilos:
+                return
+            for i in range(self._max_workers):
+                hilo = threading.Thread(target=self._bucle, name=f"ai-job-{i}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def _bucle(self):
+        while True:
+            job_id, encolado = self._cola.get()
+            inicio = time.monotonic()
+            with self._lock:
+                self._en_curso += 1
+                self._espera.append(inicio - encolado)
+            try:
+                self._ejecutar(job_id)
+                resultado = 'completados'
+            except Exception as e:
+                self._log("error", "job_fallido", job_id=job_id, error=str(e), tipo_error=type(e).__name__)
+                resultado = 'fallidos'
+            with self._lock:
+                self._en_curso -= 1
+                self._contadores[resultado] += 1
+                self._ejecucion.append(time.monotonic() - inicio)
+            self._cola.task_done()
+
+    def _bucle_recuperacion(self, recuperar, intervalo):
+        while True:
+            time.sleep(intervalo)
+            try:
+                recuperados = recuperar() or 0
+                with self._lock:
+                    self._contadores['recuperados'] += recuperados
+            except Exception as e:
+                self._log("error", "recuperacion_jobs_fallida", error=str(e), tipo_error=type(e).__name__)
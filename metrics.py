@@ -0,0 +1,235 @@
+# metrics.py - Ventanas de latencia, histogramas Prometheus y traza de fases por request
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))
+    return round(ordenados[indice], 4)
+
+
+def log_evento(nivel, evento, **campos):
+    """Línea JSON en el logger 'guardianclima' para los módulos que no reciben el _log() de app.py."""
+    logging.getLogger("guardianclima").log(
+        getattr(logging, nivel.upper()), json.dumps(dict(nivel=nivel, evento=evento, **campos), default=str)
+    )
+
+
+class VentanaLatencias:
+    """
+    Guarda las últimas 'muestras' latencias (en segundos) por etiqueta
+    y resume p50/p95/p99 para /api/internal/stats.
+    """
+
+    def __init__(self, muestras=500):
+        self._muestras = muestras
+        self._series = {}
+        self._totales = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, etiqueta, segundos):
+        with self._lock:
+            serie = self._series.get(etiqueta)
+            if serie is None:
+                serie = self._series[etiqueta] = deque(maxlen=self._muestras)
+                self._totales[etiqueta] = 0
+            serie.append(segundos)
+            self._totales[etiqueta] += 1
+
+    def resumen(self):
+        with self._lock:
+            series = {etiqueta: list(serie) for etiqueta, serie in self._series.items()}
+            totales = dict(self._totales)
+        return {
+            etiqueta: {
+                'n': totales[etiqueta],
+                'p50_s': percentil(valores, 50),
+                'p95_s': percentil(valores, 95),
+                'p99_s': percentil(valores, 99),
+            }
+            for etiqueta, valores in series.items()
+        }
+
+
+# --- Métricas en formato Prometheus (/metrics) ---
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, extra=()):
+    pares = list(zip(nombres, valores)) + list(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+class Histograma:
+    """Histograma acumulativo por combinación de etiquetas: un bisect y un lock por observación."""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(buckets)
+        self._series = {}  # valores de etiquetas -> [conteo por bucket..., conteo > último bucket]
+        self._sumas = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [0] * (len(self.buckets) + 1)
+                self._sumas[etiquetas] = 0.0
+            serie[indice] += 1
+            self._sumas[etiquetas] += valor
+
+    def exportar(self):
+        with self._lock:
+            series = {etiquetas: list(serie) for etiquetas, serie in self._series.items()}
+            sumas = dict(self._sumas)
+        lineas = []
+        for etiquetas, serie in series.items():
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, [('le', limite)])} {acumulado}")
+            acumulado += serie[-1]
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, [('le', '+Inf')])} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {round(sumas[etiquetas], 6)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {acumulado}")
+        return lineas
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *etiquetas, valor=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}" for etiquetas, valor in valores.items()]
+
+
+class Medidor:
+    """
+    Valores que ya lleva otro componente (contadores de las cachés, profundidad de la cola):
+    'leer()' devuelve {tupla de etiquetas: valor} y se consulta solo al exportar.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas, leer, tipo='gauge'):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.leer = leer
+        self.tipo = tipo
+
+    def exportar(self):
+        return [
+            f"{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}"
+            for etiquetas, valor in self.leer().items() if valor is not None
+        ]
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def agregar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        lineas = []
+        for metrica in self._metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+duracion_requests = registro.agregar(Histograma(
+    'guardianclima_http_request_duration_seconds', 'Duración de las requests por endpoint.',
+    ('endpoint', 'method', 'status')
+))
+duracion_fases = registro.agregar(Histograma(
+    'guardianclima_phase_duration_seconds',
+    'Tiempo por fase: bcrypt, sql, pil, gemini y cada upstream HTTP (openweathermap, paypal).',
+    ('phase',)
+))
+
+
+# --- Traza de fases por request ---
+# threading.local: cada hilo (o greenlet, con monkey patching) lleva su propia traza
+_traza = threading.local()
+
+
+def iniciar_traza():
+    _traza.fases = {}
+
+
+def terminar_traza():
+    fases = getattr(_traza, 'fases', None)
+    _traza.fases = None
+    return fases or {}
+
+
+def registrar_fase(nombre, segundos):
+    duracion_fases.observar(segundos, nombre)
+    fases = getattr(_traza, 'fases', None)
+    if fases is not None:
+        fases[nombre] = fases.get(nombre, 0.0) + segundos
+
+
+@contextmanager
+def fase(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_fase(nombre, time.perf_counter() - inicio)
+
+
+def instrumentar_sql(objetivo):
+    """Mide cada sentencia SQL como fase 'sql' (objetivo: un Engine o la clase Engine para todos)."""
+
+    @event.listens_for(objetivo, 'before_cursor_execute')
+    def _antes(conexion, cursor, sentencia, parametros, contexto, executemany):
+        conexion.info.setdefault('inicio_sql', []).append(time.perf_counter())
+
+    @event.listens_for(objetivo, 'after_cursor_execute')
+    def _despues(conexion, cursor, sentencia, parametros, contexto, executemany):
+        registrar_fase('sql', time.perf_counter() - conexion.info['inicio_sql'].pop())
+
+    @event.listens_for(objetivo, 'handle_error')
+    def _error(contexto_error):
+        conexion = contexto_error.connection
+        if conexion is not None and conexion.info.get('inicio_sql'):
+            registrar_fase('sql', time.perf_counter() - conexion.info['inicio_sql'].pop())
@@ -0,0 +1,90 @@
+# migraciones.py - Migraciones de esquema versionadas (se aplican con `flask --app app db-upgrade`)
+import datetime as dt
+
+from sqlalchemy import inspect, text
+
+from estadisticas import TABLAS_ROLLUP, reconstruir_rollups
+
+
+def _tablas_iniciales(conexion, db):
+    # Equivale al antiguo db.create_all(): crea solo las tablas que faltan
+    db.metadata.create_all(conexion)
+
+
+def _indices_historial(conexion, db):
+    """
+    Índices compuestos para listar el historial por usuario en orden cronológico inverso
+    (paginación por cursor). En PostgreSQL además cubren las columnas de la proyección de listado
+    para que la consulta se resuelva solo con el índice.
+    """
+    postgres = conexion.dialect.name == 'postgresql'
+    incluir_consultas = ' INCLUDE (ciudad, temperatura, descripcion)' if postgres else ''
+    incluir_outfits = ' INCLUDE (city)' if postgres else ''
+    conexion.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_queries_user_timestamp '
+        f'ON queries (user_id, "timestamp", id){incluir_consultas}'
+    ))
+    conexion.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_outfit_history_user_date '
+        f'ON outfit_history (user_id, date, id){incluir_outfits}'
+    ))
+
+
+def _periodos_de_cuota(conexion, db):
+    # Período al que corresponden los contadores de IA del plan gratuito (ver cuotas.py)
+    existentes = {columna['name'] for columna in inspect(conexion).get_columns('users')}
+    for columna in ('ai_outfit_period', 'ai_travel_period'):
+        if columna not in existentes:
+            conexion.execute(text(f'ALTER TABLE users ADD COLUMN {columna} VARCHAR(10)'))
+
+
+def _versiones_de_listados(conexion, db):
+    # Versión por usuario del historial y de los outfits: se incrementa con cada escritura (ETag de los listados)
+    existentes = {columna['name'] for columna in inspect(conexion).get_columns('users')}
+    for columna in ('historial_version', 'outfits_version'):
+        if columna not in existentes:
+            conexion.execute(text(f'ALTER TABLE users ADD COLUMN {columna} INTEGER NOT NULL DEFAULT 0'))
+
+
+def _estadisticas_por_usuario(conexion, db):
+    # Rollups de las consultas de clima (ver estadisticas.py), calculados desde el historial existente
+    tablas = {nombre: db.metadata.tables[tabla] for nombre, tabla in TABLAS_ROLLUP.items()}
+    db.metadata.create_all(conexion, tables=list(tablas.values()))
+    reconstruir_rollups(conexion, db.metadata.tables['queries'], tablas, db.metadata.tables['users'])
+
+
+def _guardarropa_en_la_base(conexion, db):
+    # El guardarropa pasa del índice JSON por usuario en disco (WARDROBE_DIR) a una tabla compartida por los workers
+    db.metadata.create_all(conexion, tables=[db.metadata.tables['prendas']])
+
+
+# (versión, descripción, función). Nunca cambiar una migración ya publicada: agregar una nueva.
+MIGRACIONES = [
+    (1, "Tablas iniciales", _tablas_iniciales),
+    (2, "Índices (user_id, fecha, id) para el historial de consultas y outfits", _indices_historial),
+    (3, "Períodos de las cuotas de IA del plan gratuito", _periodos_de_cuota),
+    (4, "Versiones del historial y de los outfits por usuario", _versiones_de_listados),
+    (5, "Estadísticas de clima por usuario (rollups de queries)", _estadisticas_por_usuario),
+    (6, "Guardarropa en la base (descripciones de prendas por sha256)", _guardarropa_en_la_base),
+]
+
+
+def aplicar_migraciones(db):
+    """Aplica en orden las migraciones pendientes y devuelve la lista de versiones aplicadas."""
+    aplicadas_ahora = []
+    with db.engine.begin() as conexion:
+        conexion.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations '
+            '(version INTEGER PRIMARY KEY, descripcion VARCHAR(200), aplicada TIMESTAMP)'
+        ))
+        aplicadas = {fila[0] for fila in conexion.execute(text('SELECT version FROM schema_migrations'))}
+        for version, descripcion, migrar in MIGRACIONES:
+            if version in aplicadas:
+                continue
+            migrar(conexion, db)
+            conexion.execute(
+                text('INSERT INTO schema_migrations (version, descripcion, aplicada) VALUES (:v, :d, :a)'),
+                {"v": version, "d": descripcion, "a": dt.datetime.utcnow()}
+            )
+            aplicadas_ahora.append(version)
+    return aplicadas_ahora
@@ -0,0 +1,74 @@
+# paypal_client.py - Llamadas a la API REST de PayPal con el token OAuth cacheado
+import threading
+import time
+import uuid
+
+
+class PayPalError(Exception):
+    def __init__(self, mensaje, detalles=None):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.detalles = detalles
+
+
+class PayPalAPI:
+    """
+    Cliente mínimo de PayPal (OAuth client_credentials + Orders v2).
+    El access token se reutiliza hasta 'margen' segundos antes de su 'expires_in',
+    así cada checkout hace un solo viaje a PayPal en lugar de dos.
+    """
+
+    def __init__(self, http, base_url, client_id, client_secret, margen=60):
+        self.http = http
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.margen = margen
+        self._token = None
+        self._vence = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        with self._lock:
+            if self._token and time.time() < self._vence:
+                return self._token
+            respuesta = self.http.post(
+                'paypal',
+                f"{self.base_url}/v1/oauth2/token",
+                headers={"Accept": "application/json", "Accept-Language": "en_US"},
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.client_secret)
+            )
+            if not respuesta.ok:
+                raise PayPalError("Failed to authenticate with PayPal.", respuesta.text)
+            datos = respuesta.json()
+            self._token = datos['access_token']
+            self._vence = time.time() + int(datos.get('expires_in', 0)) - self.margen
+            return self._token
+
+    def invalidar_token(self):
+        with self._lock:
+            self._token = None
+
+    def crear_orden(self, cuerpo):
+        # El PayPal-Request-Id hace idempotente el POST, así los reintentos no duplican la orden
+        request_id = str(uuid.uuid4())
+        for intento in range(2):
+            respuesta = self.http.post(
+                'paypal',
+                f"{self.base_url}/v2/checkout/orders",
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.token()}",
+                    "PayPal-Request-Id": request_id
+                },
+                json=cuerpo
+            )
+            if respuesta.status_code == 401 and intento == 0:
+                # Token revocado o vencido antes de tiempo: pedimos uno nuevo y reintentamos una vez
+                self.invalidar_token()
+                continue
+            break
+        if not respuesta.ok:
+            raise PayPalError("Failed to create PayPal order.", respuesta.text)
+        return respuesta.json()
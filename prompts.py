@@ -0,0 +1,219 @@
+# prompts.py - Prompts de Gemini: plantillas, presupuesto de tokens, modelo por ruta y uso de tokens por llamada
+#
+# Cada ruta de IA (advice, outfit, travel, wardrobe) tiene una plantilla: las instrucciones fijas van en la
+# instrucción de sistema y el texto lleva solo los datos de la request (preferencias compactas, clima, prendas).
+# PromptsGemini arma la solicitud de generate_content con el modelo, el tope de salida y el presupuesto de
+# entrada configurados para la ruta, y registra tokens y latencia de cada llamada.
+import math
+import string
+import threading
+
+from metrics import Contador, Histograma, VentanaLatencias, registro
+
+# Aproximación para texto en español; solo se usa para el presupuesto y cuando Gemini no informa el uso
+_CARACTERES_POR_TOKEN = 4
+# Lo que Gemini cuenta por imagen (o por cada mosaico de 768x768 px en las más grandes); alcanza para estimar
+_TOKENS_POR_IMAGEN = 258
+
+SIN_FORMATO = "No uses negritas, asteriscos ni etiquetas HTML."
+
+# Columna de Users -> etiqueta corta en el prompt
+PREFERENCIAS = (
+    ('estilo_preferido', 'estilo'), ('actividad_principal', 'actividad'), ('sensibilidad_frio', 'sensibilidad al frío'),
+    ('colores_preferidos', 'colores'), ('preferencia_clima', 'clima preferido'), ('frecuencia_viajes', 'viajes'),
+    ('tipo_calzado', 'calzado'), ('frecuencia_ejercicio', 'ejercicio'), ('preferencia_tejido', 'tejidos'),
+    ('prenda_favorita', 'prenda favorita'),
+)
+
+
+def estimar_tokens(texto):
+    return math.ceil(len(texto) / _CARACTERES_POR_TOKEN)
+
+
+def preferencias_compactas(user):
+    """Las preferencias del usuario en una línea ('estilo=Casual; calzado=Deportivo; ...'), sin las vacías."""
+    return "; ".join(
+        f"{etiqueta}={getattr(user, columna)}" for columna, etiqueta in PREFERENCIAS if getattr(user, columna)
+    )
+
+
+def clima_compacto(datos_clima):
+    """'cielo claro, 20.0°C (sensación 19.0°C), humedad 60%' a partir de la respuesta de /data/2.5/weather."""
+    principal = datos_clima['main']
+    return (f"{datos_clima['weather'][0]['description']}, {principal['temp']}°C "
+            f"(sensación {principal['feels_like']}°C), humedad {principal['humidity']}%")
+
+
+class Plantilla:
+    """
+    Instrucción de sistema fija más un texto con campos $nombre (string.Template, compilada una vez).
+    Si el prompt supera el presupuesto, se recortan los campos 'recortables', en orden, hasta que entre.
+    """
+
+    def __init__(self, sistema, texto, recortables=()):
+        self.sistema = sistema
+        self.texto = string.Template(texto)
+        self.recortables = recortables
+
+    def armar(self, presupuesto, campos):
+        """Retorna (texto, recortado). El presupuesto cuenta la instrucción de sistema y el texto, no las imágenes."""
+        campos = dict(campos)
+        texto = self.texto.substitute(campos)
+        recortado = False
+        for campo in self.recortables:
+            exceso = estimar_tokens(self.sistema + texto) - presupuesto
+            if exceso <= 0:
+                break
+            valor = campos[campo]
+            campos[campo] = valor[:max(0, len(valor) - exceso * _CARACTERES_POR_TOKEN - 1)].rstrip() + "…"
+            texto = self.texto.substitute(campos)
+            recortado = True
+        return texto, recortado
+
+
+PLANTILLAS = {
+    'advice': Plantilla(
+        "Actúa como un asistente de moda y estilo de vida personal. Con las preferencias del usuario y el clima, "
+        "genera una recomendación de vestimenta breve, práctica y con estilo en un solo párrafo, dirigida al usuario "
+        "de forma amigable y directa (ej. una capa extra si es sensible al frío, prendas formales si su estilo es "
+        "elegante). Responde únicamente con la recomendación.",
+        "Preferencias: $preferencias\nClima actual: $clima"
+    ),
+    'outfit': Plantilla(
+        "Sos un asistente de estilo y moda profesional. Usa solo las prendas del usuario para tus recomendaciones. "
+        "Con sus prendas, el clima y sus preferencias, genera una recomendación de vestimenta práctica y con estilo "
+        "con estas secciones: Parte de arriba, Parte de abajo, Calzado, Capas adicionales (si aplica), Accesorios "
+        "relevantes (si aplica). Describe cada prenda en pocas palabras (ej. 'camiseta blanca de algodón') para que "
+        "el usuario la reconozca en sus fotos. " + SIN_FORMATO,
+        "Prendas: $prendas$imagenes\nClima en $ciudad: $clima\nPreferencias: $preferencias",
+        recortables=('prendas',)
+    ),
+    'travel': Plantilla(
+        "Eres un asistente de viajes y experto en planificación de equipaje. Crea una lista de equipaje organizada "
+        "por categorías (ej. Ropa, Calzado, Accesorios, Artículos de Aseo, Documentos), específica en cada artículo "
+        "(ej. '2 camisetas de algodón de manga corta', '1 chaqueta impermeable ligera') y con cantidades según la "
+        "duración del viaje. Termina con 2 o 3 consejos prácticos según el clima y el destino. " + SIN_FORMATO,
+        "Destino: $ciudad\nFechas: del $inicio al $fin\nPreferencias: $preferencias\n$clima",
+        recortables=('clima',)
+    ),
+    'wardrobe': Plantilla(
+        "Sos un asistente de estilo y moda profesional.",
+        "Describe la prenda principal de cada una de las $n imágenes en una línea breve (tipo, color, material y "
+        "estilo, ej. 'camiseta blanca de algodón'). Responde solo con una lista JSON de $n strings, en el mismo "
+        "orden que las imágenes."
+    ),
+}
+
+tokens_gemini = registro.agregar(Contador(
+    'guardianclima_gemini_tokens_total', 'Tokens de Gemini por ruta, modelo y tipo (input u output).',
+    ('route', 'model', 'kind')
+))
+duracion_gemini = registro.agregar(Histograma(
+    'guardianclima_gemini_call_seconds', 'Duración de cada llamada a Gemini por ruta, modelo y resultado.',
+    ('route', 'model', 'outcome')
+))
+prompts_recortados = registro.agregar(Contador(
+    'guardianclima_gemini_prompts_trimmed_total', 'Prompts recortados para entrar en el presupuesto de la ruta.',
+    ('route',)
+))
+
+
+class PromptsGemini:
+    """
+    Modelo, tope de tokens de salida y presupuesto de tokens de entrada por ruta (configurar()), solicitudes
+    armadas desde PLANTILLAS (solicitud()) y el uso de cada llamada (registrar()) para /api/internal/stats.
+    """
+
+    def __init__(self, muestras=500):
+        self._rutas = {}
+        self._uso = {}
+        self._latencias = VentanaLatencias(muestras)
+        self._lock = threading.Lock()
+
+    def configurar(self, ruta, modelo, max_salida, presupuesto):
+        self._rutas[ruta] = {'modelo': modelo, 'max_salida': max_salida, 'presupuesto': presupuesto}
+
+    def solicitud(self, ruta, campos, partes=(), unidades=1, **opciones):
+        """
+        Argumentos de generate_content para 'ruta': 'partes' (ej. imágenes) van antes del texto y
+        'unidades' multiplica el tope de salida (ej. una descripción por prenda). 'opciones' se suman a
+        GenerateContentConfig. La clave 'ruta' la usa registrar() y no se envía a Gemini.
+        """
+        from google.genai import types
+        plantilla, config = PLANTILLAS[ruta], self._rutas[ruta]
+        texto, recortado = plantilla.armar(config['presupuesto'], campos)
+        if recortado:
+            prompts_recortados.incrementar(ruta)
+            with self._lock:
+                self._contadores(ruta)['recortados'] += 1
+        return dict(
+            model=config['modelo'],
+            config=types.GenerateContentConfig(
+                system_instruction=plantilla.sistema, max_output_tokens=config['max_salida'] * unidades, **opciones
+            ),
+            contents=list(partes) + [texto],
+            ruta=ruta
+        )
+
+    def registrar(self, solicitud, segundos, uso=None, texto_salida=None, error=False):
+        """
+        Suma una llamada a Gemini: 'uso' es el usage_metadata de la respuesta (en streaming, el del último
+        fragmento). Sin él, los tokens se estiman del prompt y de 'texto_salida'.
+        """
+        ruta, modelo = solicitud.get('ruta', 'otro'), solicitud.get('model', '')
+        entrada = getattr(uso, 'prompt_token_count', None)
+        salida = getattr(uso, 'candidates_token_count', None)
+        estimada = not error and entrada is None
+        if estimada:
+            entrada = self._estimar_entrada(solicitud)
+        entrada = entrada or 0
+        if salida is None:
+            salida = estimar_tokens(texto_salida or "")
+        tokens_gemini.incrementar(ruta, modelo, 'input', valor=entrada)
+        tokens_gemini.incrementar(ruta, modelo, 'output', valor=salida)
+        duracion_gemini.observar(segundos, ruta, modelo, 'error' if error else 'ok')
+        self._latencias.registrar(ruta, segundos)
+        with self._lock:
+            contadores = self._contadores(ruta)
+            contadores['llamadas'] += 1
+            contadores['errores'] += int(error)
+            contadores['estimadas'] += int(estimada)
+            contadores['tokens_entrada'] += entrada
+            contadores['tokens_salida'] += salida
+
+    def stats(self):
+        with self._lock:
+            uso = {ruta: dict(contadores) for ruta, contadores in self._uso.items()}
+        latencias = self._latencias.resumen()
+        datos = {}
+        for ruta, config in self._rutas.items():
+            contadores = uso.get(ruta) or self._contadores_vacios()
+            exitosas = max(1, contadores['llamadas'] - contadores['errores'])
+            datos[ruta] = dict(
+                config, **contadores,
+                tokens_entrada_promedio=round(contadores['tokens_entrada'] / exitosas, 1),
+                tokens_salida_promedio=round(contadores['tokens_salida'] / exitosas, 1),
+                latencia=latencias.get(ruta)
+            )
+        return datos
+
+    # --- Internos ---
+    @staticmethod
+    def _contadores_vacios():
+        return {'llamadas': 0, 'errores': 0, 'estimadas': 0, 'recortados': 0, 'tokens_entrada': 0, 'tokens_salida': 0}
+
+    def _contadores(self, ruta):
+        # Con self._lock tomado
+        if ruta not in self._uso:
+            self._uso[ruta] = self._contadores_vacios()
+        return self._uso[ruta]
+
+    @staticmethod
+    def _estimar_entrada(solicitud):
+        config = solicitud.get('config')
+        contenidos = solicitud.get('contents') or []
+        if isinstance(contenidos, str):
+            contenidos = [contenidos]
+        textos = [parte for parte in contenidos if isinstance(parte, str)]
+        sistema = getattr(config, 'system_instruction', None) or ""
+        return estimar_tokens(sistema + "".join(textos)) + _TOKENS_POR_IMAGEN * (len(contenidos) - len(textos))
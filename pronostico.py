@@ -0,0 +1,71 @@
+# pronostico.py - Pronóstico de OpenWeatherMap (/data/2.5/forecast) reducido a un resumen por día
+#
+# El pronóstico de 5 días viene en 40 intervalos de 3 horas (~16 KB de JSON). Para el asistente de viaje alcanza
+# con una línea por día: mínima, máxima, probabilidad y milímetros de precipitación y la condición dominante.
+# resumir_por_dia() hace esa reducción una vez por ciudad y el resultado (menos de 1 KB) es lo que se guarda
+# en la caché compartida; cada viaje solo toma los días de su ventana con dias_del_viaje().
+import datetime as dt
+from collections import Counter
+from itertools import groupby
+
+# Cuántos intervalos de 3 horas pedir: 40 son los 5 días completos que da la API gratuita
+INTERVALOS_PRONOSTICO = 40
+
+_SEGUNDOS_DIA = 86400
+
+
+def _columnas(intervalos):
+    # Una lista por campo en lugar de un dict por intervalo: cada agregado del día es un min()/max()/sum()
+    # sobre un tramo de la columna
+    columnas = {'dia': [], 'temp_min': [], 'temp_max': [], 'pop': [], 'mm': [], 'condicion': []}
+    for intervalo in intervalos:
+        principal = intervalo.get('main', {})
+        clima = (intervalo.get('weather') or [{}])[0]
+        columnas['temp_min'].append(principal.get('temp_min', principal.get('temp')))
+        columnas['temp_max'].append(principal.get('temp_max', principal.get('temp')))
+        columnas['pop'].append(intervalo.get('pop', 0))
+        columnas['mm'].append((intervalo.get('rain') or {}).get('3h', 0) + (intervalo.get('snow') or {}).get('3h', 0))
+        columnas['condicion'].append(clima.get('description', ''))
+    return columnas
+
+
+def resumir_por_dia(pronostico):
+    """
+    Reduce la respuesta de /data/2.5/forecast a una lista de días (fecha local de la ciudad, ISO), cada uno con
+    temp_min, temp_max, prob_precipitacion (%, la mayor del día), precipitacion_mm (suma) y condicion (la
+    descripción más frecuente; ante un empate, la primera del día). Los intervalos vienen ordenados por 'dt'.
+    """
+    intervalos = pronostico.get('list') or []
+    desfase = (pronostico.get('city') or {}).get('timezone', 0)
+    columnas = _columnas(intervalos)
+    dias_locales = [(intervalo['dt'] + desfase) // _SEGUNDOS_DIA for intervalo in intervalos]
+
+    dias, inicio = [], 0
+    for dia, grupo in groupby(dias_locales):
+        fin = inicio + sum(1 for _ in grupo)
+        tramo = slice(inicio, fin)
+        dias.append({
+            'fecha': (dt.date(1970, 1, 1) + dt.timedelta(days=dia)).isoformat(),
+            'temp_min': round(min(columnas['temp_min'][tramo]), 1),
+            'temp_max': round(max(columnas['temp_max'][tramo]), 1),
+            'prob_precipitacion': round(100 * max(columnas['pop'][tramo])),
+            'precipitacion_mm': round(sum(columnas['mm'][tramo]), 1),
+            'condicion': Counter(columnas['condicion'][tramo]).most_common(1)[0][0],
+        })
+        inicio = fin
+    return dias
+
+
+def dias_del_viaje(dias, fecha_inicio, fecha_fin):
+    """Los días del resumen entre fecha_inicio y fecha_fin (date, ambas incluidas)."""
+    desde, hasta = fecha_inicio.isoformat(), fecha_fin.isoformat()
+    return [dia for dia in dias if desde <= dia['fecha'] <= hasta]
+
+
+def texto_para_prompt(dias):
+    """Una línea por día, lo más corta posible: '2025-07-01: 8.0 a 15.5°C, precipitación 60% (4.2 mm), lluvia ligera'."""
+    return "\n".join(
+        f"{dia['fecha']}: {dia['temp_min']} a {dia['temp_max']}°C, precipitación {dia['prob_precipitacion']}%"
+        f"{' (%s mm)' % dia['precipitacion_mm'] if dia['precipitacion_mm'] else ''}, {dia['condicion']}"
+        for dia in dias
+    )
@@ -0,0 +1,209 @@
+# recomendador.py - Recomendador de vestimenta local (reglas + puntaje), sin llamar a Gemini
+#
+# Responde en microsegundos con el clima de OpenWeatherMap y las preferencias del usuario:
+# es el motor del plan gratuito y el respaldo cuando Gemini falla o tarda demasiado.
+# El catálogo se guarda por columnas y cada prenda se puntúa contra el clima y las preferencias;
+# por cada parte del outfit (abrigo, arriba, abajo, calzado) gana la de mayor puntaje.
+
+# Partes del outfit, en el orden en que se nombran en el consejo
+PARTES = ('superior', 'inferior', 'calzado', 'abrigo')
+
+ESTILOS = ('Casual', 'Deportivo', 'Elegante', 'Minimalista', 'Bohemio', 'Clásico', 'Urbano')
+
+# Nombre, parte, rango de temperatura efectiva cómodo (°C), impermeable, transpirable,
+# estilos, tejido y etiquetas (tipo de calzado / prenda favorita de las preferencias)
+CATALOGO = (
+    ("una camiseta de algodón", 'superior', 20, 35, False, True, "Casual Deportivo Minimalista Urbano", "Algodón", "Camiseta"),
+    ("una camiseta técnica", 'superior', 18, 38, False, True, "Deportivo", "Sintético", "Camiseta"),
+    ("una camisa de lino", 'superior', 22, 36, False, True, "Casual Elegante Bohemio Clásico Minimalista", "Lino", "Camisa"),
+    ("una camisa de algodón de manga larga", 'superior', 14, 26, False, True, "Elegante Clásico Casual Minimalista", "Algodón", "Camisa"),
+    ("una chomba", 'superior', 18, 30, False, True, "Casual Clásico Deportivo", "Algodón", "Camiseta"),
+    ("una remera de manga larga", 'superior', 12, 22, False, False, "Casual Urbano Minimalista", "Algodón", "Camiseta"),
+    ("una blusa liviana", 'superior', 20, 32, False, True, "Elegante Bohemio Minimalista", "Mezcla", "Camisa"),
+    ("un suéter de punto fino", 'superior', 10, 18, False, False, "Elegante Clásico Minimalista", "Mezcla", ""),
+    ("un buzo con capucha", 'superior', 6, 18, False, False, "Urbano Deportivo Casual", "Algodón", ""),
+    ("un sweater de lana", 'superior', -2, 14, False, False, "Clásico Elegante Casual Minimalista Bohemio", "Lana", ""),
+    ("una primera capa térmica con un buzo polar", 'superior', -20, 4, False, False, "Deportivo Casual Urbano", "Sintético", ""),
+    ("un vestido liviano", 'superior', 22, 34, False, True, "Bohemio Casual Elegante", "Algodón", "Vestido"),
+    ("un vestido de punto con medias", 'superior', 6, 18, False, False, "Elegante Clásico Bohemio", "Lana", "Vestido"),
+
+    ("un short", 'inferior', 24, 38, False, True, "Casual Deportivo Urbano", "Algodón", ""),
+    ("una bermuda de lino", 'inferior', 24, 36, False, True, "Casual Bohemio Clásico", "Lino", ""),
+    ("unos jeans", 'inferior', 5, 26, False, False, "Casual Urbano Minimalista Clásico", "Algodón", "Jeans"),
+    ("un pantalón chino", 'inferior', 12, 28, False, True, "Casual Clásico Elegante Minimalista", "Algodón", "Pantalón de vestir"),
+    ("un pantalón de vestir", 'inferior', 8, 26, False, False, "Elegante Clásico Minimalista", "Mezcla", "Pantalón de vestir"),
+    ("un pantalón de lino", 'inferior', 22, 34, False, True, "Bohemio Elegante Casual", "Lino", "Pantalón de vestir"),
+    ("un jogger", 'inferior', 6, 22, False, False, "Deportivo Urbano", "Sintético", ""),
+    ("un pantalón térmico", 'inferior', -20, 6, True, False, "Deportivo Urbano Casual", "Sintético", ""),
+    ("una falda midi", 'inferior', 16, 30, False, True, "Elegante Bohemio Clásico", "Mezcla", "Falda"),
+    ("un pantalón de lana", 'inferior', -4, 12, False, False, "Clásico Elegante", "Lana", ""),
+
+    ("zapatillas urbanas", 'calzado', 8, 30, False, False, "Casual Urbano Minimalista", "", "Zapatillas Casual"),
+    ("zapatillas de running", 'calzado', 5, 34, False, True, "Deportivo", "", "Deportivo Zapatillas"),
+    ("sandalias", 'calzado', 24, 40, False, True, "Bohemio Casual", "", "Sandalias"),
+    ("alpargatas", 'calzado', 20, 32, False, True, "Bohemio Casual", "", "Casual"),
+    ("mocasines", 'calzado', 12, 28, False, False, "Elegante Clásico", "", "Elegante"),
+    ("zapatos de cuero", 'calzado', 4, 26, False, False, "Elegante Clásico Minimalista", "", "Elegante"),
+    ("botines de cuero", 'calzado', 0, 18, False, False, "Urbano Elegante Clásico", "", "Botas"),
+    ("botas impermeables", 'calzado', -20, 14, True, False, "Casual Urbano Clásico Deportivo", "", "Botas"),
+    ("zapatillas impermeables", 'calzado', 0, 22, True, False, "Deportivo Urbano", "", "Deportivo Zapatillas"),
+
+    ("una campera rompevientos", 'abrigo', 12, 20, False, True, "Deportivo Urbano Casual", "Sintético", "Chaqueta"),
+    ("un piloto impermeable", 'abrigo', 6, 24, True, False, "Clásico Elegante Casual Minimalista Urbano", "Sintético", "Chaqueta"),
+    ("una campera de jean", 'abrigo', 14, 22, False, False, "Casual Urbano Bohemio", "Algodón", "Chaqueta"),
+    ("un blazer", 'abrigo', 14, 22, False, False, "Elegante Clásico Minimalista", "Mezcla", "Chaqueta"),
+    ("un chaleco acolchado", 'abrigo', 6, 14, False, False, "Casual Urbano Deportivo", "Sintético", "Chaqueta"),
+    ("un tapado de lana", 'abrigo', -2, 10, False, False, "Elegante Clásico Minimalista Bohemio", "Lana", "Chaqueta"),
+    ("una parka impermeable", 'abrigo', -10, 10, True, False, "Urbano Casual Deportivo", "Sintético", "Chaqueta"),
+    ("una campera de plumas", 'abrigo', -25, 4, True, False, "Urbano Casual Deportivo Minimalista", "Sintético", "Chaqueta"),
+)
+
+# Columnas del catálogo (una lista por atributo, alineadas por índice)
+_NOMBRE = [p[0] for p in CATALOGO]
+_PARTE = [p[1] for p in CATALOGO]
+_T_MIN = [p[2] for p in CATALOGO]
+_T_MAX = [p[3] for p in CATALOGO]
+_IMPERMEABLE = [p[4] for p in CATALOGO]
+_TRANSPIRABLE = [p[5] for p in CATALOGO]
+_ESTILOS = [sum(1 << ESTILOS.index(e) for e in p[6].split()) for p in CATALOGO]
+_TEJIDO = [p[7] for p in CATALOGO]
+_ETIQUETAS = [frozenset(p[8].split()) | ({p[8]} if p[8] else set()) for p in CATALOGO]
+_INDICES = {parte: [i for i, p in enumerate(_PARTE) if p == parte] for parte in PARTES}
+
+# "¿Cómo te llevas con el frío?": grados que se suman a la sensación térmica para cada respuesta
+# ('Muy Baja (siempre tengo frío)' la percibe más fría, 'Muy Alta (siempre tengo calor)' más cálida)
+AJUSTE_SENSIBILIDAD = {'muy baja': -4, 'baja': -2, 'normal': 0, 'alta': 2, 'muy alta': 4}
+
+# Estilos que suma cada actividad principal del día
+ESTILOS_ACTIVIDAD = {
+    'Oficina': "Elegante Clásico Minimalista",
+    'Estudiante': "Casual Urbano",
+    'Trabajo Remoto': "Casual Minimalista",
+    'Actividades al Aire Libre': "Deportivo",
+    'Viajes Frecuentes': "Casual Urbano",
+    'Vida Nocturna': "Elegante Urbano",
+}
+
+# Pesos del puntaje
+P_CONFORT = 1.0      # por cada °C fuera del rango cómodo de la prenda
+P_ESTILO = 3.0
+P_ACTIVIDAD = 1.0
+P_TEJIDO = 1.5
+P_CALZADO = 3.0
+P_FAVORITA = 2.5
+P_LLUVIA = 6.0       # impermeable con lluvia o nieve (abrigo y calzado)
+P_HUMEDAD = 1.5      # transpirable con calor húmedo
+
+
+def clase_condicion(id_condicion):
+    """Agrupa los códigos de condición de OpenWeatherMap en clases que cambian la vestimenta."""
+    if id_condicion < 300: return 'tormenta'
+    if id_condicion < 400: return 'llovizna'
+    if id_condicion < 600: return 'lluvia'
+    if id_condicion < 700: return 'nieve'
+    if id_condicion < 800: return 'niebla'
+    if id_condicion == 800: return 'despejado'
+    if id_condicion <= 802: return 'parcialmente_nublado'
+    return 'nublado'
+
+
+def _mascara(estilos):
+    return sum(1 << ESTILOS.index(e) for e in (estilos or "").split() if e in ESTILOS)
+
+
+def _ajuste_sensibilidad(sensibilidad):
+    texto = (sensibilidad or 'Normal').split('(')[0].strip().lower()
+    return AJUSTE_SENSIBILIDAD.get(texto, 0)
+
+
+def puntajes(parte, temperatura, mojado, humedo, preferencias):
+    """Puntaje de cada prenda de 'parte' para ese clima y esas preferencias: [(puntaje, índice)]."""
+    estilo = _mascara(preferencias.get('estilo_preferido'))
+    actividad = _mascara(ESTILOS_ACTIVIDAD.get(preferencias.get('actividad_principal'), ""))
+    tejido = preferencias.get('preferencia_tejido')
+    calzado = preferencias.get('tipo_calzado')
+    favorita = preferencias.get('prenda_favorita')
+    pesa_lluvia = P_LLUVIA if mojado and parte in ('abrigo', 'calzado') else 0.0
+    pesa_humedad = P_HUMEDAD if humedo else 0.0
+    pesa_calzado = P_CALZADO if parte == 'calzado' else 0.0
+    return [(
+        - P_CONFORT * (max(0, _T_MIN[i] - temperatura) + max(0, temperatura - _T_MAX[i]))
+        + P_ESTILO * bool(_ESTILOS[i] & estilo)
+        + P_ACTIVIDAD * bool(_ESTILOS[i] & actividad)
+        + P_TEJIDO * (_TEJIDO[i] == tejido)
+        + pesa_calzado * (calzado in _ETIQUETAS[i])
+        + P_FAVORITA * (favorita in _ETIQUETAS[i])
+        + pesa_lluvia * (1 if _IMPERMEABLE[i] else -1)
+        + pesa_humedad * _TRANSPIRABLE[i],
+        i
+    ) for i in _INDICES[parte]]
+
+
+def recomendar(datos_clima, preferencias):
+    """
+    Outfit para el clima actual ('datos_clima' con la forma de /data/2.5/weather) y las preferencias
+    del usuario (dict con las columnas de Users). Retorna {"consejo", "prendas", "temperatura_efectiva"}.
+    """
+    principal = datos_clima['main']
+    temperatura = principal.get('feels_like', principal['temp']) + _ajuste_sensibilidad(preferencias.get('sensibilidad_frio'))
+    clima = datos_clima['weather'][0]
+    condicion = clase_condicion(clima.get('id', 800))
+    mojado = condicion in ('tormenta', 'llovizna', 'lluvia', 'nieve')
+    humedo = principal.get('humidity', 50) > 75 and temperatura > 22
+
+    prendas = {}
+    for parte in PARTES:
+        # Sin frío ni lluvia no hace falta abrigo
+        if parte == 'abrigo' and temperatura >= 20 and not mojado:
+            continue
+        # Un vestido ya cubre la parte de abajo
+        if parte == 'inferior' and 'Vestido' in _ETIQUETAS[prendas['superior']]:
+            continue
+        prendas[parte] = max(puntajes(parte, temperatura, mojado, humedo, preferencias))[1]
+
+    accesorios = []
+    if mojado and condicion != 'nieve':
+        accesorios.append("un paraguas")
+    if temperatura < 6:
+        accesorios.append("gorro, guantes y bufanda")
+    elif temperatura < 12:
+        accesorios.append("una bufanda liviana")
+    if condicion == 'despejado' and temperatura > 18:
+        accesorios.append("anteojos de sol")
+    if condicion == 'despejado' and temperatura > 26:
+        accesorios.append("una gorra y protector solar")
+
+    nombres = {parte: _NOMBRE[i] for parte, i in prendas.items()}
+    return {
+        "consejo": _redactar(datos_clima, nombres, accesorios, preferencias),
+        "prendas": dict(nombres, accesorios=accesorios),
+        "temperatura_efectiva": round(temperatura, 1),
+    }
+
+
+def _enumerar(items):
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " y " + items[-1]
+
+
+def _grados(temperatura):
+    # Entero sin signo para -0.4 ("0°C", no "-0°C" como daría f"{-0.4:.0f}")
+    return round(temperatura) or 0
+
+
+def _redactar(datos_clima, nombres, accesorios, preferencias):
+    principal = datos_clima['main']
+    descripcion = datos_clima['weather'][0].get('description', '')
+    texto = (
+        f"Con {_grados(principal['temp'])}°C (sensación de {_grados(principal.get('feels_like', principal['temp']))}°C) "
+        f"y {descripcion}, te recomiendo "
+        f"{_enumerar([nombres[parte] for parte in ('superior', 'inferior', 'calzado') if parte in nombres])}"
+    )
+    if 'abrigo' in nombres:
+        texto += f", con {nombres['abrigo']} encima"
+    texto += "."
+    if accesorios:
+        texto += f" No te olvides de {_enumerar(accesorios)}."
+    colores = (preferencias.get('colores_preferidos') or '').split('(')[0].strip().lower()
+    if colores:
+        texto += f" Para tu estilo {(preferencias.get('estilo_preferido') or 'casual').lower()}, combinalo en tonos {colores}."
+    return texto
@@ -0,0 +1,207 @@
+# resiliencia.py - Disyuntores (circuit breakers) por upstream y plazo total por request
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+CERRADO, SEMIABIERTO, ABIERTO = 'cerrado', 'semiabierto', 'abierto'
+# Valor numérico del estado para la métrica (gauge)
+VALOR_ESTADO = {CERRADO: 0, SEMIABIERTO: 1, ABIERTO: 2}
+
+
+class ErrorUpstream(Exception):
+    """Llamada a un upstream que no se hizo (o se cortó) por resiliencia; 'status' es el código a responder."""
+    status = 503
+
+
+class CircuitoAbierto(ErrorUpstream):
+    status = 503
+
+    def __init__(self, upstream, reintentar_en):
+        super().__init__(f"Circuito abierto para {upstream}")
+        self.upstream = upstream
+        self.reintentar_en = reintentar_en
+
+
+class PlazoVencido(ErrorUpstream):
+    status = 504
+
+    def __init__(self, upstream):
+        super().__init__(f"Sin tiempo para llamar a {upstream}: venció el plazo de la request")
+        self.upstream = upstream
+
+
+class Disyuntor:
+    """
+    Circuit breaker de un upstream. Mira las últimas 'ventana' llamadas: si hay al menos 'minimo'
+    y la proporción de fallos (errores, 429/5xx o llamadas más lentas que 'lento' segundos) llega a
+    'umbral', se abre y rechaza todas las llamadas durante 'espera' segundos sin tocar el upstream.
+    Después pasa a semiabierto: deja pasar una sola llamada de prueba; si sale bien se cierra y si no,
+    vuelve a abrirse.
+    """
+
+    def __init__(self, nombre, ventana=20, minimo=10, umbral=0.5, espera=30, lento=None, activo=True):
+        self.nombre = nombre
+        self.minimo = minimo
+        self.umbral = umbral
+        self.espera = espera
+        self.lento = lento
+        self.activo = activo
+        self._resultados = deque(maxlen=ventana)
+        self._estado = CERRADO
+        self._abierto_hasta = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+        self._contadores = {'exitos': 0, 'fallos': 0, 'lentas': 0, 'rechazadas': 0, 'aperturas': 0}
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado_actual(time.monotonic())
+
+    def permitir(self):
+        """True si la llamada puede hacerse. En semiabierto solo pasa una llamada de prueba a la vez."""
+        if not self.activo:
+            return True
+        with self._lock:
+            estado = self._estado_actual(time.monotonic())
+            if estado == CERRADO:
+                return True
+            if estado == SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return True
+            self._contadores['rechazadas'] += 1
+            return False
+
+    def verificar(self):
+        """Como permitir(), pero lanza CircuitoAbierto si la llamada no puede hacerse."""
+        if not self.permitir():
+            raise CircuitoAbierto(self.nombre, self.reintentar_en())
+
+    def registrar(self, exito, duracion=0.0):
+        lenta = exito and self.lento is not None and duracion > self.lento
+        fallo = not exito or lenta
+        with self._lock:
+            self._contadores['lentas' if lenta else 'exitos' if exito else 'fallos'] += 1
+            # Llamadas que empezaron antes de abrirse el circuito no cambian nada mientras está abierto
+            if not self.activo or self._estado == ABIERTO:
+                return
+            if self._estado == SEMIABIERTO:
+                self._prueba_en_curso = False
+                if fallo:
+                    self._abrir()
+                else:
+                    self._estado = CERRADO
+                    self._resultados.clear()
+                return
+            self._resultados.append(fallo)
+            if self._estado == CERRADO and len(self._resultados) >= self.minimo \
+                    and sum(self._resultados) / len(self._resultados) >= self.umbral:
+                self._abrir()
+
+    @contextmanager
+    def llamada(self):
+        """verificar() + registrar(): cualquier excepción dentro del bloque cuenta como fallo."""
+        self.verificar()
+        inicio = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.registrar(False, time.monotonic() - inicio)
+            raise
+        self.registrar(True, time.monotonic() - inicio)
+
+    def reintentar_en(self):
+        with self._lock:
+            return max(0, round(self._abierto_hasta - time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['estado'] = self._estado_actual(time.monotonic())
+            datos['tasa_fallos'] = round(sum(self._resultados) / len(self._resultados), 4) if self._resultados else 0.0
+        return datos
+
+    def _estado_actual(self, ahora):
+        if self._estado == ABIERTO and ahora >= self._abierto_hasta:
+            self._estado = SEMIABIERTO
+        return self._estado
+
+    def _abrir(self):
+        self._estado = ABIERTO
+        self._abierto_hasta = time.monotonic() + self.espera
+        self._resultados.clear()
+        self._contadores['aperturas'] += 1
+
+
+class Disyuntores:
+    """Un Disyuntor por upstream, creado con la configuración común más la propia (ej. 'lento')."""
+
+    def __init__(self, **config):
+        self._config = config
+        self._propios = {}
+        self._disyuntores = {}
+        self._lock = threading.Lock()
+
+    def configurar(self, nombre, **config):
+        self._propios[nombre] = config
+
+    def __getitem__(self, nombre):
+        with self._lock:
+            disyuntor = self._disyuntores.get(nombre)
+            if disyuntor is None:
+                disyuntor = Disyuntor(nombre, **dict(self._config, **self._propios.get(nombre, {})))
+                self._disyuntores[nombre] = disyuntor
+            return disyuntor
+
+    def stats(self):
+        with self._lock:
+            disyuntores = list(self._disyuntores.values())
+        return {disyuntor.nombre: disyuntor.stats() for disyuntor in disyuntores}
+
+
+# --- Plazo total por request ---
+# threading.local como la traza de fases (metrics.py): cada hilo o greenlet lleva el suyo
+_plazo = threading.local()
+
+
+def iniciar_plazo(segundos):
+    _plazo.vence = time.monotonic() + segundos if segundos else None
+
+
+def terminar_plazo():
+    _plazo.vence = None
+
+
+def restante():
+    """Segundos que le quedan a la request actual, o None si no hay plazo (ej. trabajos en segundo plano)."""
+    vence = getattr(_plazo, 'vence', None)
+    return None if vence is None else vence - time.monotonic()
+
+
+def recortar_timeout(timeout, upstream):
+    """
+    Timeout de una llamada (segundos, o tupla (conexión, lectura) como en requests) recortado a lo que
+    queda del plazo. Lanza PlazoVencido si ya no queda tiempo.
+    """
+    queda = restante()
+    if queda is None:
+        return timeout
+    if queda <= 0:
+        raise PlazoVencido(upstream)
+    if isinstance(timeout, tuple):
+        return tuple(min(valor, queda) for valor in timeout)
+    return queda if timeout is None else min(timeout, queda)
+
+
+def con_plazo(funcion):
+    """Envuelve 'funcion' para que corra en otro hilo (ej. un ThreadPoolExecutor) con el plazo del actual."""
+    vence = getattr(_plazo, 'vence', None)
+
+    def envuelta(*args, **kwargs):
+        _plazo.vence = vence
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            _plazo.vence = None
+    return envuelta
@@ -0,0 +1,51 @@
+# conftest.py - Fixtures de pytest: la app contra una base SQLite temporal y usuarios con su token
+#
+# Uso: python -m pytest -q (desde la raíz del repo)
+import itertools
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_usuarios = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def aplicacion(tmp_path_factory):
+    """El módulo app, importado una vez contra una base SQLite nueva y sin llamadas a upstreams reales."""
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{tmp_path_factory.mktemp('db') / 'tests.db'}",
+        JWT_SECRET_KEY="tests-" + "x" * 32, WEATHER_API_KEY="tests", GEMINI_API_KEY="",
+        LOG_REQUESTS="false", AI_JOB_RECOVER_ON_START="false", BCRYPT_LOG_ROUNDS="4",
+    )
+    import app as modulo
+    with modulo.app.app_context():
+        modulo.aplicar_migraciones(modulo.db)
+    return modulo
+
+
+@pytest.fixture
+def cliente(aplicacion):
+    return aplicacion.app.test_client()
+
+
+@pytest.fixture
+def crear_usuario(aplicacion, cliente):
+    """Crea un usuario nuevo del plan gratuito: dict con id, email y las cabeceras con su token."""
+    def crear():
+        n = next(_usuarios)
+        datos = {"username": f"usuario{n}", "email": f"usuario{n}@example.com", "password": "Segura9Clave"}
+        assert cliente.post('/api/register', json=datos).status_code == 201
+        token = cliente.post('/api/login', json=datos).get_json()['access_token']
+        with aplicacion.app.app_context():
+            user_id = aplicacion.Users.query.filter_by(email=datos["email"]).one().id
+        return {"id": user_id, "email": datos["email"], "headers": {"Authorization": f"Bearer {token}"}}
+    return crear
+
+
+@pytest.fixture
+def usuario(crear_usuario):
+    return crear_usuario()
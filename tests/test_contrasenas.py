@@ -0,0 +1,19 @@
+# test_contrasenas.py - Inicio de sesión con el pool de bcrypt saturado
+from contrasenas import HashSaturado
+
+
+def test_login_valido_con_el_pool_saturado_en_el_rehash(aplicacion, cliente, usuario, monkeypatch):
+    # La contraseña ya se verificó: si el rehash no entra en el pool, el login igual sale bien
+    def saturado(password):
+        raise HashSaturado()
+
+    monkeypatch.setattr(aplicacion.contrasenas, "necesita_rehash", lambda hash_guardado: True)
+    monkeypatch.setattr(aplicacion.contrasenas, "rehash", saturado)
+    with aplicacion.app.app_context():
+        hash_anterior = aplicacion.db.session.get(aplicacion.Users, usuario["id"]).password
+
+    respuesta = cliente.post('/api/login', json={"email": usuario["email"], "password": "Segura9Clave"})
+    assert respuesta.status_code == 200
+    assert "access_token" in respuesta.get_json()
+    with aplicacion.app.app_context():
+        assert aplicacion.db.session.get(aplicacion.Users, usuario["id"]).password == hash_anterior
@@ -0,0 +1,96 @@
+# test_cuotas.py - UPDATE condicional de las cuotas del plan gratuito y devolución de usos
+import threading
+
+import pytest
+
+import cuotas as modulo_cuotas
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "rowcount"])
+def cuotas(request, aplicacion, monkeypatch):
+    """Cuotas sobre la tabla de usuarios, con RETURNING (Postgres, SQLite >= 3.35) y sin él."""
+    with aplicacion.app.app_context():
+        monkeypatch.setattr(aplicacion.db.engine.dialect, "update_returning", request.param)
+        yield modulo_cuotas.Cuotas(aplicacion.db, aplicacion.Users.__table__)
+
+
+def _usos(aplicacion, user_id):
+    fila = aplicacion.db.session.get(aplicacion.Users, user_id)
+    aplicacion.db.session.refresh(fila)
+    return fila.ai_outfit_uses, fila.ai_outfit_period
+
+
+def test_consume_hasta_el_limite(aplicacion, cuotas, usuario):
+    periodo = modulo_cuotas.periodo_actual()
+    assert [cuotas.consumir(usuario["id"], 'outfit', 3) for _ in range(4)] == [
+        (True, 1, periodo), (True, 2, periodo), (True, 3, periodo), (False, 3, periodo)
+    ]
+    assert _usos(aplicacion, usuario["id"]) == (3, periodo)
+
+
+def test_devolver_libera_un_uso(aplicacion, cuotas, usuario):
+    periodo = modulo_cuotas.periodo_actual()
+    for _ in range(3):
+        cuotas.consumir(usuario["id"], 'outfit', 3)
+    cuotas.devolver(usuario["id"], 'outfit', periodo)
+    assert _usos(aplicacion, usuario["id"]) == (2, periodo)
+    assert cuotas.consumir(usuario["id"], 'outfit', 3) == (True, 3, periodo)
+
+
+def test_devolver_no_baja_de_cero_ni_toca_otro_periodo(aplicacion, cuotas, usuario):
+    periodo = modulo_cuotas.periodo_actual()
+    cuotas.devolver(usuario["id"], 'outfit', periodo)
+    assert _usos(aplicacion, usuario["id"])[0] == 0
+    cuotas.consumir(usuario["id"], 'outfit', 3)
+    cuotas.devolver(usuario["id"], 'outfit', "1999-01")
+    assert _usos(aplicacion, usuario["id"]) == (1, periodo)
+
+
+def test_periodo_nuevo_reinicia_el_contador(aplicacion, cuotas, usuario):
+    tabla = aplicacion.Users.__table__
+    aplicacion.db.session.execute(
+        tabla.update().where(tabla.c.id == usuario["id"]).values(ai_outfit_uses=3, ai_outfit_period="1999-01")
+    )
+    aplicacion.db.session.commit()
+    periodo = modulo_cuotas.periodo_actual()
+    assert cuotas.consumir(usuario["id"], 'outfit', 3) == (True, 1, periodo)
+
+
+@pytest.mark.parametrize("encolar", [False, True], ids=["cola_llena_antes", "cola_llena_al_encolar"])
+def test_cola_llena_no_consume_cuota(aplicacion, cliente, usuario, monkeypatch, encolar):
+    # Con la cola llena el pedido asíncrono responde 503 y el uso del plan gratuito no se pierde
+    monkeypatch.setattr(aplicacion.job_queue, "hay_lugar", lambda: encolar)
+    monkeypatch.setattr(aplicacion.job_queue, "encolar", lambda job_id: False)
+    respuesta = cliente.post('/api/v1/ai-travel-assistant?async=1', headers=usuario["headers"], json={
+        "ciudad_destino": "Madrid", "fecha_inicio": "2026-07-01", "fecha_fin": "2026-07-03"
+    })
+    assert respuesta.status_code == 503
+    with aplicacion.app.app_context():
+        usuario_db = aplicacion.db.session.get(aplicacion.Users, usuario["id"])
+        assert modulo_cuotas.usos_vigentes(usuario_db, 'travel') == 0
+        estados = [job.estado for job in aplicacion.Jobs.query.filter_by(user_id=usuario["id"])]
+    assert estados == (['error'] if encolar else [])
+
+
+def test_consumos_concurrentes_no_pasan_el_limite(aplicacion, usuario):
+    # N hilos compiten por K usos sobre la base SQLite en archivo de los tests: cada uno con su sesión y conexión
+    hilos, limite = 16, 3
+    largada = threading.Barrier(hilos)
+    resultados = []
+
+    def consumir():
+        with aplicacion.app.app_context():
+            cuotas = modulo_cuotas.Cuotas(aplicacion.db, aplicacion.Users.__table__)
+            largada.wait()
+            resultados.append(cuotas.consumir(usuario["id"], 'outfit', limite)[0])
+
+    trabajadores = [threading.Thread(target=consumir) for _ in range(hilos)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for trabajador in trabajadores:
+        trabajador.join(timeout=30)
+
+    assert len(resultados) == hilos
+    assert resultados.count(True) == limite
+    with aplicacion.app.app_context():
+        assert _usos(aplicacion, usuario["id"]) == (limite, modulo_cuotas.periodo_actual())
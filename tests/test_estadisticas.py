@@ -0,0 +1,106 @@
+# test_estadisticas.py - Los rollups mantenidos con upsert por lote coinciden con reconstruir_rollups()
+import datetime as dt
+import random
+import threading
+import time
+
+from sqlalchemy import select
+
+from estadisticas import CLAVES, agregar, reconstruir_rollups, semana_de
+
+
+def _consultas(user_ids, cantidad=120):
+    # Varias ciudades y semanas, con consultas en el borde domingo/lunes y temperaturas bajo cero
+    random.seed(3)
+    inicio = dt.datetime(2026, 3, 1, 23, 30)  # domingo
+    return [{
+        'user_id': random.choice(user_ids),
+        'ciudad': random.choice(['Madrid', 'Lima', 'Oslo']),
+        'temperatura': round(random.uniform(-15, 35), 2),
+        'descripcion': 'cielo claro',
+        'timestamp': inicio + dt.timedelta(minutes=random.randint(0, 60 * 24 * 20)),
+    } for _ in range(cantidad)]
+
+
+def _rollups(aplicacion, user_ids):
+    """{nombre: {clave: (consultas, temp_min, temp_max, temp_suma, ultima)}} de los usuarios dados."""
+    datos = {}
+    with aplicacion.db.engine.connect() as conexion:
+        for nombre, tabla in aplicacion._tablas_rollup().items():
+            filas = conexion.execute(select(tabla).where(tabla.c.user_id.in_(user_ids))).mappings()
+            datos[nombre] = {
+                tuple(fila[columna] for columna in CLAVES[nombre]):
+                    (fila['consultas'], fila['temp_min'], fila['temp_max'], round(fila['temp_suma'], 6), fila['ultima'])
+                for fila in filas
+            }
+    return datos
+
+
+def test_upsert_por_lotes_igual_a_reconstruir(aplicacion, crear_usuario):
+    user_ids = [crear_usuario()["id"] for _ in range(3)]
+    consultas = _consultas(user_ids)
+    with aplicacion.app.app_context():
+        # Lotes de distinto tamaño, como los que arma la escritura diferida
+        for inicio, fin in ((0, 1), (1, 40), (40, 41), (41, 120)):
+            aplicacion._insertar_consultas(consultas[inicio:fin])
+        incrementales = _rollups(aplicacion, user_ids)
+
+        with aplicacion.db.engine.begin() as conexion:
+            reconstruir_rollups(conexion, aplicacion.Queries.__table__, aplicacion._tablas_rollup(),
+                                aplicacion.Users.__table__, min(user_ids), max(user_ids) + 1)
+        reconstruidos = _rollups(aplicacion, user_ids)
+
+    assert incrementales == reconstruidos
+    assert sum(n for n, *_ in incrementales['usuarios'].values()) == len(consultas)
+    # Y ambos coinciden con agregar() sobre todas las consultas de una vez
+    for nombre, filas in agregar(consultas).items():
+        assert {tuple(fila[columna] for columna in CLAVES[nombre]) for fila in filas} == set(incrementales[nombre])
+
+
+def test_reconstruir_solo_toca_su_rango(aplicacion, crear_usuario):
+    dentro, fuera = crear_usuario()["id"], crear_usuario()["id"]
+    with aplicacion.app.app_context():
+        aplicacion._insertar_consultas(_consultas([dentro, fuera], cantidad=20))
+        antes = _rollups(aplicacion, [fuera])
+        with aplicacion.db.engine.begin() as conexion:
+            escritas = reconstruir_rollups(conexion, aplicacion.Queries.__table__, aplicacion._tablas_rollup(),
+                                           aplicacion.Users.__table__, dentro, dentro + 1)
+        assert _rollups(aplicacion, [fuera]) == antes
+        assert escritas == sum(len(filas) for filas in _rollups(aplicacion, [dentro]).values())
+
+
+def test_semana_empieza_el_lunes():
+    assert semana_de(dt.datetime(2026, 3, 1, 23, 59)) == dt.date(2026, 2, 23)  # domingo
+    assert semana_de(dt.datetime(2026, 3, 2, 0, 0)) == dt.date(2026, 3, 2)  # lunes
+
+
+def test_reconstruir_mientras_se_escriben_lotes(aplicacion, crear_usuario):
+    # Lotes con claves nuevas (semanas y ciudades) mientras se reconstruye el mismo rango: ninguno falla
+    # y al final los rollups incrementales siguen coincidiendo con una reconstrucción desde cero
+    user_ids = [crear_usuario()["id"] for _ in range(2)]
+    consultas = _consultas(user_ids, cantidad=200)
+    errores = []
+
+    def escribir():
+        try:
+            for inicio in range(0, len(consultas), 10):
+                aplicacion._insertar_consultas(consultas[inicio:inicio + 10])
+        except Exception as e:  # pragma: no cover - solo si hay regresión
+            errores.append(e)
+
+    escritor = threading.Thread(target=escribir)
+    with aplicacion.app.app_context():
+        escritor.start()
+        while escritor.is_alive():
+            with aplicacion.db.engine.begin() as conexion:
+                reconstruir_rollups(conexion, aplicacion.Queries.__table__, aplicacion._tablas_rollup(),
+                                    aplicacion.Users.__table__, min(user_ids), max(user_ids) + 1)
+            time.sleep(0.005)  # Sin la pausa el escritor podría no conseguir nunca el lock de SQLite
+        escritor.join()
+        assert not errores, errores
+        incrementales = _rollups(aplicacion, user_ids)
+        with aplicacion.db.engine.begin() as conexion:
+            reconstruir_rollups(conexion, aplicacion.Queries.__table__, aplicacion._tablas_rollup(),
+                                aplicacion.Users.__table__, min(user_ids), max(user_ids) + 1)
+        assert _rollups(aplicacion, user_ids) == incrementales
+    assert sum(n for n, *_ in incrementales['usuarios'].values()) == len(consultas)
@@ -0,0 +1,104 @@
+# test_jobs.py - Recuperación de trabajos de IA que quedaron 'running' o 'pending' tras caerse un worker
+import datetime as dt
+import json
+import threading
+import uuid
+
+import pytest
+
+from cuotas import periodo_actual
+from jobs import JobQueue
+
+
+@pytest.fixture
+def encolados(aplicacion, monkeypatch):
+    """Ids que la recuperación manda a la cola (sin ejecutarlos)."""
+    ids = []
+    monkeypatch.setattr(aplicacion.job_queue, "encolar", lambda job_id: ids.append(job_id) or True)
+    return ids
+
+
+def _job(aplicacion, user_id, estado, hace_s, cuota=None):
+    ahora, job_id = dt.datetime.utcnow(), uuid.uuid4().hex
+    job = aplicacion.Jobs(
+        id=job_id, user_id=user_id, tipo='travel', estado=estado,
+        creado=ahora - dt.timedelta(seconds=hace_s + 1),
+        iniciado=ahora - dt.timedelta(seconds=hace_s) if estado == 'running' else None,
+        payload=json.dumps({"cuota": cuota, "ciudad_destino": "Madrid",
+                            "fecha_inicio": "2026-07-01", "fecha_fin": "2026-07-03"}),
+    )
+    with aplicacion.app.app_context():
+        aplicacion.db.session.add(job)
+        aplicacion.db.session.commit()
+    return job_id
+
+
+def _estado(aplicacion, job_id):
+    with aplicacion.app.app_context():
+        return aplicacion.db.session.get(aplicacion.Jobs, job_id).estado
+
+
+def _atrasar(aplicacion, job_id, segundos):
+    # Simula que pasó el tiempo desde que el trabajo arrancó
+    with aplicacion.app.app_context():
+        job = aplicacion.db.session.get(aplicacion.Jobs, job_id)
+        job.iniciado -= dt.timedelta(seconds=segundos)
+        aplicacion.db.session.commit()
+
+
+def test_running_abandonado_vuelve_a_la_cola(aplicacion, usuario, encolados):
+    job_id = _job(aplicacion, usuario["id"], 'running', aplicacion.AI_JOB_STALE_SECONDS + 60)
+    assert aplicacion.recuperar_jobs_pendientes() >= 1
+    assert _estado(aplicacion, job_id) == 'pending'
+    assert job_id in encolados
+
+
+def test_worker_reiniciado_antes_del_umbral(aplicacion, usuario, encolados):
+    # El worker se cae y renace a los 10 s: al arrancar el trabajo todavía no está abandonado...
+    job_id = _job(aplicacion, usuario["id"], 'running', 10)
+    aplicacion.recuperar_jobs_pendientes(todos=True)
+    assert _estado(aplicacion, job_id) == 'running' and job_id not in encolados
+    # ...pero la revisión periódica lo retoma cuando pasa AI_JOB_STALE_SECONDS
+    _atrasar(aplicacion, job_id, aplicacion.AI_JOB_STALE_SECONDS)
+    aplicacion.recuperar_jobs_pendientes()
+    assert _estado(aplicacion, job_id) == 'pending' and job_id in encolados
+
+
+def test_pending_recientes_solo_al_arrancar(aplicacion, usuario, encolados):
+    # Un 'pending' reciente ya está en la cola de algún worker: la revisión periódica no lo duplica
+    reciente = _job(aplicacion, usuario["id"], 'pending', 5)
+    huerfano = _job(aplicacion, usuario["id"], 'pending', aplicacion.AI_JOB_STALE_SECONDS + 60)
+    aplicacion.recuperar_jobs_pendientes()
+    assert huerfano in encolados and reciente not in encolados
+    aplicacion.recuperar_jobs_pendientes(todos=True)
+    assert reciente in encolados
+
+
+def test_trabajo_recuperado_que_falla_devuelve_la_cuota(aplicacion, usuario, encolados, monkeypatch):
+    cuota = {"recurso": "travel", "periodo": periodo_actual()}
+    with aplicacion.app.app_context():
+        aplicacion.cuotas.consumir(usuario["id"], 'travel', 1)
+    job_id = _job(aplicacion, usuario["id"], 'running', aplicacion.AI_JOB_STALE_SECONDS + 60, cuota=cuota)
+    monkeypatch.setattr(aplicacion, "_ejecutar_viaje", lambda *args: ({"error": "IA no disponible"}, 503))
+
+    aplicacion.recuperar_jobs_pendientes()
+    aplicacion._ejecutar_job(job_id)
+
+    assert _estado(aplicacion, job_id) == 'error'
+    with aplicacion.app.app_context():
+        assert aplicacion.db.session.get(aplicacion.Users, usuario["id"]).ai_travel_uses == 0
+
+
+def test_recuperacion_periodica():
+    llamadas = threading.Semaphore(0)
+
+    def recuperar():
+        llamadas.release()
+        return 2
+
+    cola = JobQueue(lambda job_id: None, max_workers=1)
+    cola.recuperar_periodicamente(recuperar, 0.01)
+    cola.recuperar_periodicamente(recuperar, 0.01)  # La segunda no arranca otro hilo
+    for _ in range(3):
+        assert llamadas.acquire(timeout=2)
+    assert cola.stats()['recuperados'] >= 4
@@ -0,0 +1,65 @@
+# test_listados.py - ETag, 304 y versiones de /api/v1/outfits y /api/v1/history
+CLIMA = {
+    'name': 'Madrid', 'main': {'temp': 20.0, 'feels_like': 19.0, 'humidity': 60, 'temp_min': 18, 'temp_max': 22},
+    'weather': [{'id': 800, 'description': 'cielo claro', 'main': 'Clear'}],
+}
+
+
+def _guardar_outfit(cliente, usuario, ciudad):
+    respuesta = cliente.post('/api/v1/outfits', json={"city": ciudad, "advice": "x"}, headers=usuario["headers"])
+    assert respuesta.status_code == 200
+
+
+def test_etag_304_mientras_no_cambia(aplicacion, cliente, usuario):
+    _guardar_outfit(cliente, usuario, "Madrid")
+    primera = cliente.get('/api/v1/outfits', headers=usuario["headers"])
+    etag = primera.headers["ETag"]
+    assert primera.status_code == 200 and primera.headers["Cache-Control"] == "private, no-cache"
+
+    no_modificada = cliente.get('/api/v1/outfits', headers=dict(usuario["headers"], **{"If-None-Match": etag}))
+    assert no_modificada.status_code == 304
+    assert no_modificada.data == b""
+    assert no_modificada.headers["ETag"] == etag
+
+
+def test_guardar_outfit_sube_la_version(aplicacion, cliente, usuario):
+    _guardar_outfit(cliente, usuario, "Madrid")
+    etag = cliente.get('/api/v1/outfits', headers=usuario["headers"]).headers["ETag"]
+    _guardar_outfit(cliente, usuario, "Lima")
+
+    respuesta = cliente.get('/api/v1/outfits', headers=dict(usuario["headers"], **{"If-None-Match": etag}))
+    assert respuesta.status_code == 200
+    assert respuesta.headers["ETag"] != etag
+    assert [item["city"] for item in respuesta.get_json()] == ["Lima", "Madrid"]
+
+
+def test_la_pagina_es_parte_del_etag(cliente, usuario):
+    _guardar_outfit(cliente, usuario, "Madrid")
+    _guardar_outfit(cliente, usuario, "Lima")
+    completa = cliente.get('/api/v1/outfits', headers=usuario["headers"])
+    primera_pagina = cliente.get('/api/v1/outfits?limit=1', headers=usuario["headers"])
+    assert completa.headers["ETag"] != primera_pagina.headers["ETag"]
+    assert len(primera_pagina.get_json()) == 1
+
+
+def test_los_etags_son_por_usuario(cliente, usuario, crear_usuario):
+    etag = cliente.get('/api/v1/outfits', headers=usuario["headers"]).headers["ETag"]
+    otro = crear_usuario()
+    respuesta = cliente.get('/api/v1/outfits', headers=dict(otro["headers"], **{"If-None-Match": etag}))
+    assert respuesta.status_code == 200
+
+
+def test_historial_cambia_al_escribir_el_lote(aplicacion, cliente, usuario, monkeypatch):
+    # Las consultas de clima suben historial_version cuando se escribe su lote (escritura diferida)
+    monkeypatch.setattr(aplicacion, "_obtener_datos_clima_upstream", lambda ciudad, *a, **k: (CLIMA, 200))
+    etag = cliente.get('/api/v1/history', headers=usuario["headers"]).headers["ETag"]
+    assert cliente.get('/api/v1/weather/Madrid', headers=usuario["headers"]).status_code == 200
+    aplicacion.consultas_diferidas.vaciar()
+
+    respuesta = cliente.get('/api/v1/history', headers=dict(usuario["headers"], **{"If-None-Match": etag}))
+    assert respuesta.status_code == 200
+    assert [consulta["ciudad"] for consulta in respuesta.get_json()] == ["Madrid"]
+    sin_cambios = cliente.get('/api/v1/history',
+                              headers=dict(usuario["headers"], **{"If-None-Match": respuesta.headers["ETag"]}))
+    assert sin_cambios.status_code == 304
+
@@ -0,0 +1,31 @@
+# test_metricas.py - /metrics y /api/internal/stats en un proceso recién arrancado
+import pytest
+
+from contrasenas import Contrasenas
+
+
+@pytest.fixture
+def sin_hashes(aplicacion, monkeypatch):
+    # Pool de bcrypt sin muestras, como antes del primer registro o login del proceso
+    contrasenas = Contrasenas(aplicacion.bcrypt, costo=4)
+    monkeypatch.setattr(aplicacion, "contrasenas", contrasenas)
+    return contrasenas
+
+
+def test_stats_de_contrasenas_sin_muestras(sin_hashes):
+    datos = sin_hashes.stats()
+    assert datos['espera_p50_ms'] is None and datos['ejecucion_p95_ms'] is None
+
+
+def test_metrics_antes_del_primer_login(cliente, sin_hashes):
+    respuesta = cliente.get('/metrics')
+    assert respuesta.status_code == 200
+    texto = respuesta.get_data(as_text=True)
+    assert 'guardianclima_password_hash_queue{state="pending"} 0' in texto
+    assert 'guardianclima_password_hash_total{operation="hashes"} 0' in texto
+
+
+def test_stats_internas_antes_del_primer_login(cliente, sin_hashes):
+    respuesta = cliente.get('/api/internal/stats')
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['contrasenas']['espera_p50_ms'] is None
@@ -0,0 +1,44 @@
+# test_paginacion.py - Cursores keyset de /api/v1/history y /api/v1/outfits
+import base64
+import datetime as dt
+
+import pytest
+
+
+def test_cursor_ida_y_vuelta(aplicacion):
+    fecha = dt.datetime(2026, 3, 1, 12, 30, 5, 123456)
+    cursor = aplicacion._codificar_cursor(fecha, 42)
+    assert aplicacion._decodificar_cursor(cursor) == (fecha, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "no-es-base64!",
+    base64.urlsafe_b64encode(b"sin separador").decode(),
+    base64.urlsafe_b64encode(b"2026-03-01T12:00:00|no-es-un-id").decode(),
+    base64.urlsafe_b64encode(b"no-es-una-fecha|3").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|1").decode(),
+])
+def test_cursor_invalido(aplicacion, cliente, usuario, cursor):
+    with pytest.raises(ValueError):
+        aplicacion._decodificar_cursor(cursor)
+    respuesta = cliente.get(f'/api/v1/outfits?cursor={cursor}', headers=usuario["headers"])
+    assert respuesta.status_code == 400
+
+
+def test_paginas_sin_repetir_ni_saltear(cliente, usuario):
+    # Dos outfits con la misma fecha: el id desempata y ninguno se pierde entre páginas
+    for n, fecha in enumerate(["2026-01-01T10:00:00", "2026-01-02T10:00:00", "2026-01-02T10:00:00",
+                               "2026-01-03T10:00:00", "2026-01-04T10:00:00"]):
+        cliente.post('/api/v1/outfits', json={"city": f"C{n}", "advice": "x", "date": fecha}, headers=usuario["headers"])
+
+    vistos, url = [], '/api/v1/outfits?limit=2'
+    while url:
+        respuesta = cliente.get(url, headers=usuario["headers"])
+        assert respuesta.status_code == 200
+        vistos += [item["city"] for item in respuesta.get_json()]
+        cursor = respuesta.headers.get("X-Next-Cursor")
+        if cursor:
+            # El Link rel="next" conserva ?limit=
+            assert "limit=2" in respuesta.headers["Link"]
+        url = f'/api/v1/outfits?limit=2&cursor={cursor}' if cursor else None
+    assert vistos == ["C4", "C3", "C2", "C1", "C0"]
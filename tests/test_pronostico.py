@@ -0,0 +1,86 @@
+# test_pronostico.py - Resumen por día del pronóstico de 5 días (fecha local de la ciudad)
+import datetime as dt
+
+import pytest
+
+from pronostico import dias_del_viaje, resumir_por_dia, texto_para_prompt
+
+
+def _intervalo(utc, temp, condicion="cielo claro", pop=0, lluvia=None, nieve=None):
+    intervalo = {
+        'dt': int(dt.datetime.fromisoformat(utc).replace(tzinfo=dt.timezone.utc).timestamp()),
+        'main': {'temp': temp, 'temp_min': temp - 1, 'temp_max': temp + 1},
+        'weather': [{'description': condicion}],
+        'pop': pop,
+    }
+    if lluvia is not None:
+        intervalo['rain'] = {'3h': lluvia}
+    if nieve is not None:
+        intervalo['snow'] = {'3h': nieve}
+    return intervalo
+
+
+def _pronostico(intervalos, desfase):
+    return {'city': {'name': 'Ciudad', 'timezone': desfase}, 'list': intervalos}
+
+
+@pytest.mark.parametrize("desfase, fechas", [
+    (0, ['2026-07-01', '2026-07-01', '2026-07-02', '2026-07-02']),
+    # UTC-3 (Buenos Aires): las 00:00 y 01:00 UTC del 2 todavía son el 1 a la noche
+    (-3 * 3600, ['2026-06-30', '2026-07-01', '2026-07-01', '2026-07-01']),
+    # UTC+9 (Tokio): las 18:00 UTC del 1 ya son el 2 a la madrugada
+    (9 * 3600, ['2026-07-01', '2026-07-02', '2026-07-02', '2026-07-02']),
+    # UTC+5:30 (India): el desfase no es de horas enteras
+    (int(5.5 * 3600), ['2026-07-01', '2026-07-01', '2026-07-02', '2026-07-02']),
+])
+def test_agrupa_por_fecha_local(desfase, fechas):
+    horas = ['2026-07-01T00:00:00', '2026-07-01T18:00:00', '2026-07-02T00:00:00', '2026-07-02T01:00:00']
+    # Una temperatura distinta por intervalo para ver en qué día quedó cada uno
+    dias = resumir_por_dia(_pronostico([_intervalo(hora, 10 * n) for n, hora in enumerate(horas)], desfase))
+    esperados = {}
+    for n, fecha in enumerate(fechas):
+        esperados.setdefault(fecha, []).append(10 * n)
+    assert [(dia['fecha'], dia['temp_min'], dia['temp_max']) for dia in dias] == [
+        (fecha, min(temps) - 1, max(temps) + 1) for fecha, temps in esperados.items()
+    ]
+
+
+def test_agregados_del_dia():
+    dias = resumir_por_dia(_pronostico([
+        _intervalo('2026-07-01T00:00:00', 8, 'lluvia ligera', pop=0.2, lluvia=1.25),
+        _intervalo('2026-07-01T03:00:00', 12, 'nubes', pop=0.6, nieve=0.5),
+        _intervalo('2026-07-01T06:00:00', 15.26, 'lluvia ligera', pop=0.4, lluvia=2.5),
+        _intervalo('2026-07-02T00:00:00', 20, 'nubes'),
+        _intervalo('2026-07-02T03:00:00', 21, 'cielo claro'),
+    ], 0))
+    assert dias[0] == {
+        'fecha': '2026-07-01', 'temp_min': 7.0, 'temp_max': 16.3, 'prob_precipitacion': 60,
+        'precipitacion_mm': 4.2, 'condicion': 'lluvia ligera',
+    }
+    # Empate entre condiciones: gana la primera del día
+    assert dias[1]['condicion'] == 'nubes'
+    assert dias[1]['precipitacion_mm'] == 0
+
+
+def test_pronostico_vacio():
+    assert resumir_por_dia({}) == []
+    assert resumir_por_dia({'list': [], 'city': {'timezone': 3600}}) == []
+
+
+def test_dias_del_viaje_incluye_los_extremos():
+    dias = [{'fecha': f'2026-07-0{n}'} for n in range(1, 6)]
+    assert dias_del_viaje(dias, dt.date(2026, 7, 2), dt.date(2026, 7, 4)) == dias[1:4]
+    assert dias_del_viaje(dias, dt.date(2026, 7, 6), dt.date(2026, 7, 9)) == []
+
+
+def test_texto_para_prompt():
+    dias = [
+        {'fecha': '2026-07-01', 'temp_min': 8.0, 'temp_max': 15.5, 'prob_precipitacion': 60,
+         'precipitacion_mm': 4.2, 'condicion': 'lluvia ligera'},
+        {'fecha': '2026-07-02', 'temp_min': 10.0, 'temp_max': 18.0, 'prob_precipitacion': 0,
+         'precipitacion_mm': 0, 'condicion': 'cielo claro'},
+    ]
+    assert texto_para_prompt(dias) == (
+        "2026-07-01: 8.0 a 15.5°C, precipitación 60% (4.2 mm), lluvia ligera\n"
+        "2026-07-02: 10.0 a 18.0°C, precipitación 0%, cielo claro"
+    )
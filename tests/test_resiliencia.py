@@ -0,0 +1,172 @@
+# test_resiliencia.py - Transiciones de estado de los disyuntores y plazo por request
+import time
+import types
+
+import pytest
+
+import resiliencia
+from resiliencia import ABIERTO, CERRADO, SEMIABIERTO, CircuitoAbierto, Disyuntor, Disyuntores, PlazoVencido
+
+
+class Reloj:
+    """Reemplazo de time.monotonic() en resiliencia.py que solo avanza con avanzar()."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+    def avanzar(self, segundos):
+        self.ahora += segundos
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(resiliencia, "time", types.SimpleNamespace(monotonic=reloj))
+    return reloj
+
+
+def _abierto(reloj, **config):
+    disyuntor = Disyuntor("upstream", ventana=4, minimo=4, umbral=0.5, espera=30, **config)
+    for exito in (True, True, False, False):
+        disyuntor.registrar(exito)
+    assert disyuntor.estado == ABIERTO
+    return disyuntor
+
+
+def test_no_abre_antes_del_minimo_de_llamadas(reloj):
+    disyuntor = Disyuntor("upstream", ventana=4, minimo=4, umbral=0.5)
+    for _ in range(3):
+        disyuntor.registrar(False)
+    assert disyuntor.estado == CERRADO
+    disyuntor.registrar(False)
+    assert disyuntor.estado == ABIERTO
+    assert disyuntor.stats()['aperturas'] == 1
+
+
+def test_no_abre_por_debajo_del_umbral(reloj):
+    disyuntor = Disyuntor("upstream", ventana=4, minimo=4, umbral=0.5)
+    for exito in (True, True, True, False, True, True):
+        disyuntor.registrar(exito)
+    assert disyuntor.estado == CERRADO
+    assert disyuntor.stats()['tasa_fallos'] == 0.25
+
+
+def test_abierto_rechaza_sin_llamar(reloj):
+    disyuntor = _abierto(reloj)
+    assert not disyuntor.permitir()
+    reloj.avanzar(10)
+    with pytest.raises(CircuitoAbierto) as error:
+        disyuntor.verificar()
+    assert error.value.reintentar_en == 20
+    assert disyuntor.stats()['rechazadas'] == 2
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba(reloj):
+    disyuntor = _abierto(reloj)
+    reloj.avanzar(30)
+    assert disyuntor.estado == SEMIABIERTO
+    assert disyuntor.permitir()
+    assert not disyuntor.permitir()
+
+
+def test_prueba_exitosa_cierra(reloj):
+    disyuntor = _abierto(reloj)
+    reloj.avanzar(30)
+    assert disyuntor.permitir()
+    disyuntor.registrar(True)
+    assert disyuntor.estado == CERRADO
+    # La ventana arranca vacía: hacen falta 'minimo' llamadas nuevas para volver a abrir
+    for _ in range(3):
+        disyuntor.registrar(False)
+    assert disyuntor.estado == CERRADO
+
+
+def test_prueba_fallida_vuelve_a_abrir(reloj):
+    disyuntor = _abierto(reloj)
+    reloj.avanzar(30)
+    assert disyuntor.permitir()
+    disyuntor.registrar(False)
+    assert disyuntor.estado == ABIERTO
+    assert disyuntor.reintentar_en() == 30
+    assert disyuntor.stats()['aperturas'] == 2
+
+
+def test_resultados_tardios_no_cambian_un_circuito_abierto(reloj):
+    # Llamadas que empezaron antes de abrirse terminan después: no cierran ni reinician la espera
+    disyuntor = _abierto(reloj)
+    disyuntor.registrar(True)
+    reloj.avanzar(10)
+    disyuntor.registrar(False)
+    assert disyuntor.estado == ABIERTO
+    assert disyuntor.reintentar_en() == 20
+
+
+def test_llamadas_lentas_cuentan_como_fallo(reloj):
+    disyuntor = Disyuntor("upstream", ventana=2, minimo=2, umbral=1.0, lento=1.0)
+    disyuntor.registrar(True, duracion=0.5)
+    disyuntor.registrar(True, duracion=2.0)
+    assert disyuntor.estado == CERRADO
+    disyuntor.registrar(True, duracion=3.0)
+    assert disyuntor.estado == ABIERTO
+    assert disyuntor.stats()['lentas'] == 2
+
+
+def test_llamada_registra_excepciones(reloj):
+    disyuntor = Disyuntor("upstream", ventana=1, minimo=1, umbral=1.0)
+    with pytest.raises(ValueError):
+        with disyuntor.llamada():
+            raise ValueError("upstream caído")
+    with pytest.raises(CircuitoAbierto):
+        with disyuntor.llamada():
+            pytest.fail("no debería llamar al upstream con el circuito abierto")
+
+
+def test_inactivo_nunca_abre(reloj):
+    disyuntor = Disyuntor("upstream", ventana=2, minimo=2, activo=False)
+    for _ in range(5):
+        disyuntor.registrar(False)
+    assert disyuntor.permitir()
+    assert disyuntor.estado == CERRADO
+
+
+def test_disyuntores_con_configuracion_propia(reloj):
+    disyuntores = Disyuntores(ventana=4, minimo=4, umbral=0.5)
+    disyuntores.configurar("gemini", lento=30)
+    assert disyuntores["gemini"].lento == 30 and disyuntores["paypal"].lento is None
+    assert disyuntores["gemini"] is disyuntores["gemini"]
+    assert set(disyuntores.stats()) == {"gemini", "paypal"}
+
+
+def test_plazo_recorta_el_timeout(reloj):
+    resiliencia.iniciar_plazo(5)
+    try:
+        assert resiliencia.recortar_timeout((3.05, 10), "openweathermap") == (3.05, 5)
+        reloj.avanzar(5)
+        with pytest.raises(PlazoVencido):
+            resiliencia.recortar_timeout(10, "openweathermap")
+    finally:
+        resiliencia.terminar_plazo()
+    assert resiliencia.recortar_timeout(10, "openweathermap") == 10
+
+
+@pytest.mark.parametrize("llamar", [
+    lambda aplicacion, solicitud: aplicacion._generar_gemini(solicitud),
+    lambda aplicacion, solicitud: list(aplicacion._fragmentos_gemini(solicitud)),
+], ids=["generate_content", "streaming"])
+def test_plazo_vencido_no_abre_el_circuito_de_gemini(aplicacion, monkeypatch, llamar):
+    # Un solo fallo abriría el circuito: el plazo vencido de la request no debe contar como uno
+    disyuntores = Disyuntores(ventana=1, minimo=1, umbral=1.0)
+    monkeypatch.setattr(aplicacion, "disyuntores", disyuntores)
+    monkeypatch.setattr(aplicacion, "gemini_client", types.SimpleNamespace(models=None))
+    resiliencia.iniciar_plazo(0.001)
+    try:
+        time.sleep(0.01)
+        with pytest.raises(PlazoVencido):
+            llamar(aplicacion, {"model": "gemini-test", "contents": ["hola"], "ruta": "advice"})
+    finally:
+        resiliencia.terminar_plazo()
+    assert disyuntores["gemini"].estado == CERRADO
+    assert disyuntores["gemini"].stats()['fallos'] == 0
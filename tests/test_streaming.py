@@ -0,0 +1,73 @@
+# test_streaming.py - Métricas de las respuestas SSE y devolución de la cuota si el cliente corta el stream
+import time
+import types
+
+import pytest
+
+RUTA = '/api/v1/ai-travel-assistant?stream=1'
+VIAJE = {"ciudad_destino": "Madrid", "fecha_inicio": "2026-07-01", "fecha_fin": "2026-07-03"}
+
+
+class _Fragmento:
+    def __init__(self, texto):
+        self.text = texto
+        self.usage_metadata = None
+
+
+class _Modelos:
+    def generate_content_stream(self, **argumentos):
+        for texto in ("Lista ", "de ", "equipaje"):
+            time.sleep(0.02)
+            yield _Fragmento(texto)
+
+
+@pytest.fixture
+def gemini_falso(aplicacion, monkeypatch):
+    monkeypatch.setattr(aplicacion, "gemini_client", types.SimpleNamespace(models=_Modelos()))
+    monkeypatch.setattr(aplicacion, "_preparar_viaje", lambda *args: (
+        {"model": "gemini-test", "contents": ["viaje"], "ruta": "travel"}, None
+    ))
+
+
+def _conteo(histograma, *valores):
+    """_count de la serie de 'histograma' cuyas etiquetas tienen estos valores (0 si todavía no existe)."""
+    for linea in histograma.exportar():
+        nombre, valor = linea.rsplit(" ", 1)
+        if nombre.startswith(f"{histograma.nombre}_count") and all(f'="{v}"' in nombre for v in valores):
+            return int(valor)
+    return 0
+
+
+def _usos_viaje(aplicacion, user_id):
+    with aplicacion.app.app_context():
+        return aplicacion.db.session.get(aplicacion.Users, user_id).ai_travel_uses
+
+
+def test_stream_completo_exporta_ttfb_y_duracion(aplicacion, cliente, usuario, gemini_falso):
+    antes = {
+        'ttfb': _conteo(aplicacion.ttfb_streaming, 'ai-travel-assistant'),
+        'ok': _conteo(aplicacion.duracion_streaming, 'ai-travel-assistant', 'ok'),
+        'request': _conteo(aplicacion.duracion_requests, '/api/v1/ai-travel-assistant', 'POST', '200'),
+    }
+    respuesta = cliente.post(RUTA, json=VIAJE, headers=usuario["headers"])
+    assert 'event: done' in respuesta.get_data(as_text=True)
+
+    assert _conteo(aplicacion.ttfb_streaming, 'ai-travel-assistant') == antes['ttfb'] + 1
+    assert _conteo(aplicacion.duracion_streaming, 'ai-travel-assistant', 'ok') == antes['ok'] + 1
+    # La request se registra una sola vez, al terminar el stream y no al devolver las cabeceras
+    assert _conteo(aplicacion.duracion_requests, '/api/v1/ai-travel-assistant', 'POST', '200') == antes['request'] + 1
+    assert 'guardianclima_streaming_ttfb_seconds_count{route="ai-travel-assistant"}' in cliente.get('/metrics').get_data(
+        as_text=True)
+    assert _usos_viaje(aplicacion, usuario["id"]) == 1
+
+
+def test_cliente_que_corta_el_stream_recupera_la_cuota(aplicacion, cliente, usuario, gemini_falso):
+    antes = _conteo(aplicacion.duracion_streaming, 'ai-travel-assistant', 'desconectado')
+    respuesta = cliente.post(RUTA, json=VIAJE, headers=usuario["headers"], buffered=False)
+    primero = next(iter(respuesta.response))
+    assert b'"texto"' in primero
+    assert _usos_viaje(aplicacion, usuario["id"]) == 1
+    respuesta.close()  # El cliente cierra la conexión: GeneratorExit en el generador
+
+    assert _usos_viaje(aplicacion, usuario["id"]) == 0
+    assert _conteo(aplicacion.duracion_streaming, 'ai-travel-assistant', 'desconectado') == antes + 1